@@ -14,3 +14,4 @@ from .hashdictionary import HashDictionary
 from .wikicorpus import WikiCorpus
 from .textcorpus import TextCorpus
 from .ucicorpus import UciCorpus
+from .npycorpus import NpyCorpus
@@ -19,9 +19,13 @@ from __future__ import with_statement
 
 import logging
 import itertools
+from collections import defaultdict
+
+import numpy
+import scipy.sparse
 
 from gensim import utils
-from gensim._six import iteritems, iterkeys, itervalues, string_types
+from gensim._six import iteritems, iterkeys, itervalues, string_types, text_type
 from gensim._six.moves import xrange
 from gensim._six.moves import zip as izip
 
@@ -75,8 +79,51 @@ class Dictionary(utils.SaveLoad, dict):
 
 
     @staticmethod
-    def from_documents(documents):
-        return Dictionary(documents=documents)
+    def from_documents(documents, processes=1, chunksize=10000, prune_at=None):
+        """
+        Build a Dictionary from a stream of `documents`, same as `Dictionary(documents)`.
+
+        If `processes > 1`, the documents are split into chunks of `chunksize`
+        documents each, partial dictionaries are built from the chunks in parallel
+        worker processes and then merged together via `merge_with`, in the original
+        chunk order. The result is identical to building the dictionary serially.
+
+        If `prune_at` is set, only the `prune_at` tokens with the highest document
+        frequency are kept after each merge, so that memory stays bounded even for
+        huge vocabularies (see `filter_extremes`). Token ids are then compacted and
+        no longer match the serial version.
+
+        >>> dictionary = Dictionary.from_documents(wiki.get_texts(), processes=8, prune_at=2000000)
+
+        """
+        if processes <= 1 and prune_at is None:
+            return Dictionary(documents=documents)
+
+        result = Dictionary()
+        pool = None
+        if processes > 1:
+            import multiprocessing
+            logger.info("building dictionary with %i processes" % processes)
+            pool = multiprocessing.Pool(processes)
+        try:
+            chunks = utils.grouper(documents, chunksize)
+            # only send `processes` chunks to the pool at a time, to keep memory bounded
+            for chunk_no, chunk_batch in enumerate(utils.grouper(chunks, max(1, processes))):
+                if pool is not None:
+                    partials = pool.map(build_partial, chunk_batch)
+                else:
+                    partials = [build_partial(chunk) for chunk in chunk_batch]
+                for partial in partials:
+                    result.merge_with(partial)
+                    if prune_at is not None and len(result) > prune_at:
+                        result.filter_extremes(no_below=0, no_above=1.0, keep_n=prune_at)
+                logger.info("merged dictionary from %i documents: %s" % (result.num_docs, result))
+        finally:
+            if pool is not None:
+                pool.terminate()
+        logger.info("built %s from %i documents (total %i corpus positions)" %
+                     (result, result.num_docs, result.num_pos))
+        return result
 
 
     def add_documents(self, documents):
@@ -113,42 +160,85 @@ class Dictionary(utils.SaveLoad, dict):
 
         If `allow_update` is **not** set, this function is `const`, aka read-only.
         """
-        result = {}
-        missing = {}
+        missing = {} if return_missing else None
+        result = sorted(iteritems(self._doc2counts(document, allow_update, missing)))
+        if return_missing:
+            return result, missing
+        else:
+            return result
+
+
+    def doc2bow_many(self, documents, allow_update=False, as_csr=False):
+        """
+        Convert a batch of `documents` to bag-of-words, same as calling `doc2bow`
+        on each document in turn (see there for the meaning of `allow_update`).
+
+        Return a list of bag-of-words documents, or, if `as_csr` is set, a single
+        `scipy.sparse.csr_matrix` with one row per document (and one column per
+        token id, up to the greatest one, as ids may have gaps), which avoids creating
+        the intermediate `(token_id, token_count)` 2-tuples altogether.
+        """
+        if not as_csr:
+            return [self.doc2bow(document, allow_update=allow_update) for document in documents]
+        indptr, indices, data = [0], [], []
+        for document in documents:
+            counts = self._doc2counts(document, allow_update)
+            ids = sorted(counts)
+            indices.extend(ids)
+            data.extend([counts[tokenid] for tokenid in ids])
+            indptr.append(len(indices))
+        return scipy.sparse.csr_matrix(
+            (numpy.asarray(data, dtype=numpy.int32), numpy.asarray(indices, dtype=numpy.int32), indptr),
+            shape=(len(indptr) - 1, max(itervalues(self.token2id)) + 1 if self.token2id else 0))
+
+
+    def _doc2counts(self, document, allow_update=False, missing=None):
+        """
+        Return a `{token_id: token_count}` dict for the given `document`; this is
+        the core of `doc2bow`. Tokens that are not in the dictionary are stored
+        into the `missing` dict, if supplied.
+        """
         if isinstance(document, string_types):
             raise TypeError("doc2bow expects an array of utf8 tokens on input, not a string")
-        document = sorted(utils.to_utf8(token) for token in document)
-        # construct (word, frequency) mapping. in python3 this is done simply
-        # using Counter(), but here i use itertools.groupby() for the job
-        for word_norm, group in itertools.groupby(document):
-            frequency = len(list(group)) # how many times does this word appear in the input document
-            tokenid = self.token2id.get(word_norm, None)
+        # count the raw tokens first, so that each distinct token is converted
+        # to utf8 only once (and tokens that already are bytestrings not at all)
+        counts = defaultdict(int)
+        for token in document:
+            counts[token] += 1
+        word_counts = {}
+        for token, frequency in iteritems(counts):
+            word_norm = token.encode('utf8') if isinstance(token, text_type) else token
+            word_counts[word_norm] = word_counts.get(word_norm, 0) + frequency
+
+        result = {}
+        new_words = []
+        token2id = self.token2id
+        for word_norm, frequency in iteritems(word_counts):
+            tokenid = token2id.get(word_norm, None)
             if tokenid is None:
                 # first time we see this token (~normalized form)
-                if return_missing:
+                if missing is not None:
                     missing[word_norm] = frequency
-                if not allow_update: # if we aren't allowed to create new tokens, continue with the next unique token
-                    continue
-                tokenid = len(self.token2id)
-                self.token2id[word_norm] = tokenid # new id = number of ids made so far; NOTE this assumes there are no gaps in the id sequence!
-
+                if allow_update:
+                    new_words.append(word_norm)
+                continue
             # update how many times a token appeared in the document
             result[tokenid] = frequency
 
         if allow_update:
+            # assign new ids in sorted token order, so that the ids don't depend on hash order
+            for word_norm in sorted(new_words):
+                tokenid = len(token2id)
+                token2id[word_norm] = tokenid # new id = number of ids made so far; NOTE this assumes there are no gaps in the id sequence!
+                result[tokenid] = word_counts[word_norm]
             self.num_docs += 1
-            self.num_pos += len(document)
+            self.num_pos += sum(itervalues(counts))
             self.num_nnz += len(result)
             # increase document count for each unique token that appeared in the document
+            dfs = self.dfs
             for tokenid in iterkeys(result):
-                self.dfs[tokenid] = self.dfs.get(tokenid, 0) + 1
-
-        # return tokenids, in ascending id order
-        result = sorted(iteritems(result))
-        if return_missing:
-            return result, missing
-        else:
-            return result
+                dfs[tokenid] = dfs.get(tokenid, 0) + 1
+        return result
 
 
     def filter_extremes(self, no_below=5, no_above=0.5, keep_n=100000):
@@ -250,6 +340,8 @@ class Dictionary(utils.SaveLoad, dict):
         created using two different dictionaries, one from `self` and one from `other`.
 
         `other` can be any id=>word mapping (a dict, a Dictionary object, ...).
+        If `other` is a Dictionary, its document frequencies and corpus statistics
+        (`num_docs`, `num_pos` and `num_nnz`) are added to this dictionary's, too.
 
         Return a transformation object which, when accessed as `result[doc_from_other_corpus]`,
         will convert documents from a corpus built using the `other` dictionary
@@ -265,7 +357,13 @@ class Dictionary(utils.SaveLoad, dict):
 
         """
         old2new = {}
-        for other_id, other_token in iteritems(other):
+        if hasattr(other, 'token2id'):
+            # Dictionary: go over its tokens in id order, so that merging partial
+            # dictionaries one after another assigns the same ids as a serial build
+            items = sorted((other_id, other_token) for other_token, other_id in iteritems(other.token2id))
+        else:
+            items = iteritems(other)
+        for other_id, other_token in items:
             if other_token in self.token2id:
                 new_id = self.token2id[other_token]
             else:
@@ -341,3 +439,11 @@ class Dictionary(utils.SaveLoad, dict):
                      (result, result.num_docs, result.num_pos))
         return result
 #endclass Dictionary
+
+
+def build_partial(documents):
+    """
+    Build a Dictionary from a (small) chunk of documents; used by the worker
+    processes in `Dictionary.from_documents`.
+    """
+    return Dictionary(documents)
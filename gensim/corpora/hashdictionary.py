@@ -24,11 +24,14 @@ to the same id, causing hash collisions. The word<->id mapping is no longer a bi
 from __future__ import with_statement
 
 import logging
-import itertools
 import zlib
+from collections import defaultdict
+
+import numpy
+import scipy.sparse
 
 from gensim import utils
-from gensim._six import iteritems, iterkeys
+from gensim._six import iteritems, iterkeys, itervalues
 
 
 logger = logging.getLogger('gensim.corpora.hashdictionary')
@@ -145,11 +148,47 @@ class HashDictionary(utils.SaveLoad, dict):
         (`self.dfs`) by one.
 
         """
+        result = sorted(iteritems(self._doc2counts(document, allow_update)))
+        if return_missing:
+            return result, {} # with hashing, no token is ever missing
+        else:
+            return result
+
+
+    def doc2bow_many(self, documents, allow_update=False, as_csr=False):
+        """
+        Convert a batch of `documents` to bag-of-words, same as calling `doc2bow`
+        on each document in turn.
+
+        Return a list of bag-of-words documents, or, if `as_csr` is set, a single
+        `scipy.sparse.csr_matrix` with one row per document and `self.id_range`
+        columns, without creating the intermediate `(token_id, token_count)` 2-tuples.
+        """
+        if not as_csr:
+            return [self.doc2bow(document, allow_update=allow_update) for document in documents]
+        indptr, indices, data = [0], [], []
+        for document in documents:
+            counts = self._doc2counts(document, allow_update)
+            ids = sorted(counts)
+            indices.extend(ids)
+            data.extend([counts[tokenid] for tokenid in ids])
+            indptr.append(len(indices))
+        return scipy.sparse.csr_matrix(
+            (numpy.asarray(data, dtype=numpy.int32), numpy.asarray(indices, dtype=numpy.int32), indptr),
+            shape=(len(indptr) - 1, self.id_range))
+
+
+    def _doc2counts(self, document, allow_update=False):
+        """
+        Return a `{token_id: token_count}` dict for the given `document`; this is
+        the core of `doc2bow`.
+        """
+        # count the words first, so that each distinct word is hashed only once
+        counts = defaultdict(int)
+        for word in document:
+            counts[word] += 1
         result = {}
-        missing = {}
-        document = sorted(document) # convert the input to plain list (needed below)
-        for word_norm, group in itertools.groupby(document):
-            frequency = len(list(group)) # how many times does this word appear in the input document
+        for word_norm, frequency in iteritems(counts):
             tokenid = self.restricted_hash(word_norm)
             result[tokenid] = result.get(tokenid, 0) + frequency
             if self.debug:
@@ -158,20 +197,14 @@ class HashDictionary(utils.SaveLoad, dict):
 
         if allow_update or self.allow_update:
             self.num_docs += 1
-            self.num_pos += len(document)
+            self.num_pos += sum(itervalues(counts))
             self.num_nnz += len(result)
             if self.debug:
                 # increment document count for each unique tokenid that appeared in the document
                 # done here, because several words may map to the same tokenid
                 for tokenid in iterkeys(result):
                     self.dfs[tokenid] = self.dfs.get(tokenid, 0) + 1
-
-        # return tokenids, in ascending id order
-        result = sorted(iteritems(result))
-        if return_missing:
-            return result, missing
-        else:
-            return result
+        return result
 
 
     def filter_extremes(self, no_below=5, no_above=0.5, keep_n=100000):
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2010 Radim Rehurek <radimrehurek@seznam.cz>
+# Licensed under the GNU LGPL v2.1 - http://www.gnu.org/licenses/lgpl.html
+
+
+"""
+Corpus stored in a binary, memory-mappable format.
+
+The documents are stored as three numpy arrays in the compressed sparse row
+(CSR) layout: `indptr` (where each document starts), `indices` (feature ids)
+and `data` (feature weights). Each array lives in its own `.npy` file next to
+`fname`, so it can be loaded back with `numpy.load(mmap_mode='r')` and no
+text parsing is needed when iterating over the corpus.
+"""
+
+
+from __future__ import with_statement
+
+import logging
+import os
+
+import numpy
+import scipy.sparse
+
+from gensim import utils
+from gensim.corpora import IndexedCorpus
+from gensim._six.moves import xrange
+
+
+logger = logging.getLogger('gensim.corpora.npycorpus')
+
+
+class NpyCorpus(IndexedCorpus):
+    """
+    Corpus in the binary CSR format.
+
+    There are four files stored for each corpus: `fname` holds corpus statistics
+    (number of documents, features and non-zeroes), while `fname.indptr.npy`,
+    `fname.indices.npy` and `fname.data.npy` hold the CSR arrays themselves.
+
+    Random access via `corpus[docno]` is O(1), using the `indptr` array directly
+    (there is no separate `.index` file).
+
+    >>> NpyCorpus.serialize('corpus.npyc', MmCorpus('corpus.mm')) # convert from any corpus
+    >>> corpus = NpyCorpus('corpus.npyc') # arrays are mmap'ed read-only by default
+    >>> print(corpus[42])
+
+    """
+    def __init__(self, fname, mmap='r'):
+        """
+        Load a corpus previously stored by `NpyCorpus.serialize`.
+
+        Use `mmap=None` to load the CSR arrays fully into RAM, instead of
+        memory-mapping them (the default, `mmap='r'`).
+        """
+        logger.info("loading corpus from %s" % fname)
+        self.fname = fname
+        self.index = None
+        stats = utils.unpickle(fname)
+        self.num_docs, self.num_terms, self.num_nnz = stats['num_docs'], stats['num_terms'], stats['num_nnz']
+        self.indptr = NpyCorpus.load_array(fname, 'indptr', mmap)
+        self.indices = NpyCorpus.load_array(fname, 'indices', mmap)
+        self.data = NpyCorpus.load_array(fname, 'data', mmap)
+        self.length = self.num_docs
+        logger.info("accepted corpus with %i documents, %i features, %i non-zero entries" %
+                     (self.num_docs, self.num_terms, self.num_nnz))
+
+
+    def __str__(self):
+        return ("NpyCorpus(%i documents, %i features, %i non-zero entries)" %
+                (self.num_docs, self.num_terms, self.num_nnz))
+
+
+    def __len__(self):
+        return self.num_docs
+
+
+    def __iter__(self):
+        """
+        Iterate over the corpus, returning one sparse vector at a time.
+        """
+        indptr = numpy.asarray(self.indptr) # only num_docs + 1 integers; fine to keep in RAM
+        for docno in xrange(self.num_docs):
+            yield self._doc(indptr[docno], indptr[docno + 1])
+
+
+    def __getitem__(self, docno):
+        if docno < 0:
+            docno += self.num_docs
+        if not 0 <= docno < self.num_docs:
+            raise IndexError("document #%s out of range (corpus has %i documents)" % (docno, self.num_docs))
+        return self._doc(self.indptr[docno], self.indptr[docno + 1])
+
+
+    def _doc(self, start, end):
+        return list(zip(self.indices[start : end].tolist(), self.data[start : end].tolist()))
+
+
+    def iter_chunks(self, chunksize=20000, num_terms=None, dtype=numpy.float64):
+        """
+        Iteratively yield the corpus as `scipy.sparse.csc_matrix` chunks of `chunksize`
+        documents each (documents as columns). The last chunk may be smaller.
+
+        The chunks are sliced directly out of the stored CSR arrays; see also
+        `matutils.MmReader.iter_chunks`.
+        """
+        if num_terms is None:
+            num_terms = self.num_terms
+        chunksize = int(chunksize)
+        for chunk_start in xrange(0, self.num_docs, chunksize):
+            chunk_end = min(self.num_docs, chunk_start + chunksize)
+            indptr = numpy.array(self.indptr[chunk_start : chunk_end + 1])
+            start, end = indptr[0], indptr[-1]
+            indptr -= start
+            yield scipy.sparse.csc_matrix(
+                (numpy.array(self.data[start : end], dtype=dtype), numpy.array(self.indices[start : end]), indptr),
+                shape=(num_terms, chunk_end - chunk_start), dtype=dtype)
+
+
+    @staticmethod
+    def array_fname(fname, name):
+        return fname + '.' + name + '.npy'
+
+
+    @staticmethod
+    def load_array(fname, name, mmap=None):
+        return numpy.load(NpyCorpus.array_fname(fname, name), mmap_mode=mmap)
+
+
+    @classmethod
+    def serialize(serializer, fname, corpus, id2word=None, index_fname=None, progress_cnt=1000, labels=None):
+        """
+        Save the `corpus` to `fname` in the binary CSR format.
+
+        Unlike other indexed corpora, no `.index` file is created (and `index_fname`
+        is ignored): the `indptr` array already serves as the index.
+
+        >>> NpyCorpus.serialize('corpus.npyc', corpus)
+        >>> print(NpyCorpus('corpus.npyc')[42])
+
+        """
+        if getattr(corpus, 'fname', None) == fname:
+            raise ValueError("identical input vs. output corpus filename, refusing to serialize: %s" % fname)
+        serializer.save_corpus(fname, corpus, id2word, progress_cnt=progress_cnt)
+
+
+    @staticmethod
+    def save_corpus(fname, corpus, id2word=None, progress_cnt=1000, buffer_nnz=1000000):
+        """
+        Save a corpus in the binary CSR format.
+
+        The corpus is processed in a single pass, so it can be a once-only stream.
+        The non-zero entries are buffered in chunks of `buffer_nnz` elements, so
+        memory use stays bounded even for corpora larger than RAM.
+
+        This function is automatically called by `NpyCorpus.serialize`; don't
+        call it directly, call `serialize` instead.
+        """
+        logger.info("storing corpus in binary CSR format to %s" % fname)
+        fname_indices, fname_data = NpyCorpus.array_fname(fname, 'indices'), NpyCorpus.array_fname(fname, 'data')
+        tmp_indices, tmp_data = fname_indices + '.tmp', fname_data + '.tmp'
+
+        indptr = [0]
+        num_nnz, num_terms = 0, 0
+        try:
+            with open(tmp_indices, 'wb') as fout_indices:
+                with open(tmp_data, 'wb') as fout_data:
+                    buf_indices, buf_data = [], []
+                    for docno, doc in enumerate(corpus):
+                        if docno % progress_cnt == 0:
+                            logger.info("PROGRESS: saving document #%i" % docno)
+                        for termid, weight in doc:
+                            buf_indices.append(termid)
+                            buf_data.append(weight)
+                        num_nnz += len(doc)
+                        indptr.append(num_nnz)
+                        if len(buf_indices) >= buffer_nnz:
+                            num_terms = max(num_terms, NpyCorpus.flush(buf_indices, buf_data, fout_indices, fout_data))
+                            buf_indices, buf_data = [], []
+                    num_terms = max(num_terms, NpyCorpus.flush(buf_indices, buf_data, fout_indices, fout_data))
+
+            # convert the raw binary dumps into proper .npy files
+            for tmp, target, dtype in [(tmp_indices, fname_indices, numpy.int32), (tmp_data, fname_data, numpy.float64)]:
+                if num_nnz:
+                    numpy.save(target, numpy.memmap(tmp, dtype=dtype, mode='r', shape=(num_nnz,)))
+                else:
+                    numpy.save(target, numpy.empty((0,), dtype=dtype))
+        finally:
+            for tmp in [tmp_indices, tmp_data]:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        numpy.save(NpyCorpus.array_fname(fname, 'indptr'), numpy.asarray(indptr, dtype=numpy.int64))
+
+        num_docs = len(indptr) - 1
+        if id2word is not None:
+            num_terms = max(num_terms, len(id2word))
+        if num_docs * num_terms != 0:
+            logger.info("saved %ix%i matrix, density=%.3f%% (%i/%i)" % (
+                num_docs, num_terms,
+                100.0 * num_nnz / (num_docs * num_terms),
+                num_nnz,
+                num_docs * num_terms))
+        utils.pickle({'num_docs': num_docs, 'num_terms': num_terms, 'num_nnz': num_nnz}, fname)
+
+
+    @staticmethod
+    def flush(buf_indices, buf_data, fout_indices, fout_data):
+        """
+        Append buffered feature ids and weights to the raw output files.
+
+        Return the number of features implied by the flushed ids (1 + max id).
+        """
+        if not buf_indices:
+            return 0
+        indices = numpy.asarray(buf_indices, dtype=numpy.int32) # HACK assume feature ids fit in 32bit integer
+        indices.tofile(fout_indices)
+        numpy.asarray(buf_data, dtype=numpy.float64).tofile(fout_data)
+        return 1 + int(indices.max())
+#endclass NpyCorpus
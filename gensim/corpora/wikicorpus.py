@@ -15,16 +15,31 @@ tokenizer). The package is available at https://github.com/clips/pattern .
 
 See scripts/process_wiki.py for a canned (example) script based on this
 module.
+
+Multistream dumps (`*-pages-articles-multistream.xml.bz2`) consist of many
+independent bz2 streams of ~100 pages each. Given the accompanying index file
+(`*-multistream-index.txt.bz2`), `WikiCorpus` decompresses and parses these
+streams in parallel, and can resume iteration from any stream offset.
+
+Parsing the dump is slow, so `WikiCorpus` can optionally cache the tokenized
+articles on disk (see the `cache_fname` parameter); passes after the first one
+then read the cache instead of the dump.
 """
 
 
 import bz2
 import logging
+import os
 import re
+from io import BytesIO
 from xml.etree.cElementTree import iterparse # LXML isn't faster, so let's go with the built-in solution
 import multiprocessing
 
+import numpy
+
 from gensim import utils
+from gensim._six import iteritems
+from gensim._six.moves import xrange
 
 # cannot import whole gensim.corpora, because that imports wikicorpus...
 from gensim.corpora.dictionary import Dictionary
@@ -54,16 +69,42 @@ RE_P14 = re.compile('\[\[Category:[^][]*\]\]', re.UNICODE) # categories
 # Remove File and Image template
 RE_P15 = re.compile('\[\[([fF]ile:|[iI]mage)[^]]*(\]\])', re.UNICODE)
 
-
-def filter_wiki(raw):
+# patterns used by `scan_markup`
+RE_SCAN = re.compile(r'\{\{|<|\[|\]', re.UNICODE)
+RE_BRACES = re.compile(r'[{}]', re.UNICODE)
+RE_FILE = re.compile(r'[fF]ile:|[iI]mage', re.UNICODE)
+RE_URL = re.compile(r'\w+://', re.UNICODE)
+RE_END_BRACKET = re.compile(r'\]|\{\{', re.UNICODE)
+RE_SIMPLE_LINK = re.compile(r'\[(\[)?([^][<{]*)\](?(1)\])', re.UNICODE)
+RE_SIMPLE_TAG = re.compile(r'<(?!!--|ref[> ]|nowiki[> ]|math[> ])[^<>{]*>', re.UNICODE)
+RE_LANGUAGE_LINK = re.compile("\n\[\[[a-z][a-z][\w-]*:[^:\]]+\]\]", re.UNICODE) # a single link of RE_P2
+MAX_ROUNDS = 3 # maximum number of substitution rounds in `remove_markup`
+PHASES = 4 # substitutions in each round that remove brackets: categories, outside links, links, empty brackets
+# (start, end) of comments, footnotes, outside links, math content and all other
+# tags, in the order `remove_markup` removes them
+SCAN_ELEMENTS = [('<!--', '-->'), ('<ref[> ]', '</ref>|/>'), ('<nowiki[> ]', '</nowiki>|/>'),
+                 ('<math[> ]', '</math>|/>'), ('<', '>')]
+RE_ELEMENT_STARTS = [re.compile(start, re.UNICODE) for start, _ in SCAN_ELEMENTS]
+# the end of an element, or the start of a template, a file link or an element removed before it
+RE_ELEMENT_ENDS = [re.compile('(?P<end>%s)|\\{\\{|\\[\\[(?:[fF]ile:|[iI]mage)%s' %
+                              (end, ''.join('|' + start for start, _ in SCAN_ELEMENTS[:level])),
+                              re.UNICODE) for level, (_, end) in enumerate(SCAN_ELEMENTS)]
+
+
+def filter_wiki(raw, scanner=False):
     """
     Filter out wiki mark-up from `raw`, leaving only text. `raw` is either unicode
     or utf-8 encoded string.
+
+    With `scanner` set, use the single-pass `scan_markup` instead of the regexp
+    based `remove_markup`.
     """
     # parsing of the wiki markup is not perfect, but sufficient for our purposes
     # contributions to improving this code are welcome :)
     text = utils.to_unicode(raw, 'utf8', errors='ignore')
     text = utils.decode_htmlentities(text) # '&amp;nbsp;' --> '\xa0'
+    if scanner:
+        return scan_markup(text)
     return remove_markup(text)
 
 
@@ -157,6 +198,308 @@ def remove_file(s):
     return s
 
 
+def scan_markup(text):
+    """
+    Remove wiki markup from `text`, the same way `remove_markup` does, but in a
+    single left-to-right sweep instead of repeated regexp substitutions.
+
+    Templates, comments, footnotes, tags and categories are skipped as soon as
+    they are found, and file links are replaced by their caption in place. Links
+    (possibly nested) are kept on a stack until they are closed, and then replaced
+    by their description. Table markup is removed from each line of output as
+    soon as the line is complete, and any remaining brackets are stripped.
+
+    `remove_markup` simplifies nested links from the inside out, one level per
+    round of substitutions, and removes table markup at the end of each round.
+    The scanner keeps track of the round in which each link is simplified, so
+    that it sees the same description (e.g. with table markup already removed).
+
+    Two cases are left to `remove_markup`: the scanner falls back to it for the
+    whole text, as soon as it finds one of them. These are rare in practice:
+
+    * a link with a '|' that is only simplified after the first round (such as
+      `[[a|[[b|c]]]]`), in a text with table markup: `remove_markup` strips table
+      cell markup up to the last '|' of the line, even one inside that link;
+    * a bracket inside an outside link (such as `[http://x.org [[a]] b]`):
+      `remove_markup` ends the outside link at the first ']'.
+
+    The result differs from `remove_markup` only in whitespace and punctuation,
+    except in one known case: the brackets of a category separated by a comment
+    or tag (such as `[[Category:a]<!-- -->]`) don't make a category for the
+    scanner, so its name is kept in the text.
+    """
+    original = text
+    tables = '\n|' in text or '\n!' in text or '||' in text
+    start, end = _language_links(text)
+    if start < end:
+        text = text[:start] + text[end:] # remove the last list (=languages)
+
+    output, result = [], [] # finished text, and pieces of the current (incomplete) lines
+    first_line, newline = True, False
+    # stack of open brackets: where each one's content starts in `result`, its
+    # position in `text`, whether all brackets nested inside it were removed, and
+    # when the last of them was removed (see `_simplify_link`)
+    stack = []
+    file_end = None # position of the ']]' that closes the file link being scanned
+    pos = 0
+    while True:
+        if newline and not stack:
+            # lines up to the last newline are complete => remove their table markup
+            done = ''.join(result)
+            split = done.rfind('\n') + 1
+            if split:
+                output.append(_remove_table_markup(done[:split], first_line))
+                result, first_line = [done[split:]], False
+            newline = False
+        if file_end is not None and pos > file_end:
+            file_end = None # the end of the file link was skipped, inside a comment etc.
+        match = RE_SCAN.search(text, pos)
+        if match is None:
+            result.append(text[pos:])
+            break
+        start, token = match.start(), match.group()
+        result.append(text[pos : start])
+        newline = newline or '\n' in result[-1]
+        pos = start + 1
+
+        if token == '{{':
+            pos = _skip_template(text, start)
+        elif token == '<':
+            simple = RE_SIMPLE_TAG.match(text, start)
+            if simple is not None: # fast path for the most common case
+                pos = simple.end()
+                continue
+            # remove comment, footnote, outside link, math content or any other tag
+            for level, start_pattern in enumerate(RE_ELEMENT_STARTS):
+                element = start_pattern.match(text, start)
+                end, element_file_end = _element_end(text, element.end(), level, file_end) \
+                    if element is not None else (None, None)
+                if end is not None:
+                    pos, file_end = end, element_file_end
+                    break
+            else:
+                result.append('<')
+        elif token == '[':
+            if stack and RE_URL.match(text, stack[-1][1] + 1):
+                # `remove_markup` ends an outside link at the first ']', even if it closes a nested bracket
+                return remove_markup(original)
+            if file_end is None and text.startswith('[[', start) and RE_FILE.match(text, start + 2):
+                caption, end = _file_caption(text, start + 2)
+                if end is not None:
+                    # file or image: continue scanning from its caption, and drop the closing ']]'
+                    pos, file_end = caption, end
+                    continue
+            simple = RE_SIMPLE_LINK.match(text, start, len(text) if file_end is None else file_end)
+            if simple is not None and 'Category:' not in simple.group(2):
+                # fast path for the most common case: plain [link] or [[link]], with no markup inside
+                content, removed, when = _simplify_link(simple.group(2), True, 0)
+                if simple.group(1): # double brackets
+                    content, removed, when = _simplify_link(content, removed, when)
+                result.append(content)
+                newline = newline or '\n' in content
+                _update_parent(stack, removed, when)
+                pos = simple.end()
+                continue
+            stack.append([len(result), start, True, 0])
+        elif start == file_end:
+            pos, file_end = start + 2, None
+        elif stack: # closing bracket
+            offset, bracket_start, clean, after = stack.pop()
+            content = ''.join(result[offset:])
+            del result[offset:]
+            if clean and content.startswith('Category:') and stack and stack[-1][1] == bracket_start - 1 and \
+                    text.startswith(']', pos) and ('|' not in content or _removal(after, 0) < _removal(after, 2)):
+                # (a category with a '|' is simplified as a link instead, if that comes first)
+                # category: remove it, along with the enclosing bracket
+                stack.pop()
+                when = _removal(after, 0)
+                if tables and '|' in content and when > PHASES + 2:
+                    return remove_markup(original)
+                _update_parent(stack, True, when)
+                pos += 1
+                continue
+            piped = '|' in content
+            content, removed, when = _simplify_link(content, clean, after)
+            if tables and piped and removed and when > PHASES + 2:
+                # the link was still there when `remove_markup` stripped the table markup
+                return remove_markup(original)
+            result.append(content)
+            newline = newline or '\n' in content
+            _update_parent(stack, removed, when)
+        else: # unmatched closing bracket
+            result.append(']')
+    for offset, _, _, _ in reversed(stack): # unclosed brackets
+        result.insert(offset, '[')
+    output.append(_remove_table_markup(''.join(result), first_line))
+    return ''.join(output).replace('[', '').replace(']', '')
+
+
+def _language_links(text):
+    """
+    Return the `(start, end)` of the list of links to other languages at the very
+    end of `text`, as removed by `RE_P2` (`start == end` if there is none).
+
+    The links are matched backwards from the end, so only the end of the text is
+    looked at.
+    """
+    end = len(text) - 1 if text.endswith('\n') else len(text) # '$' matches before a final newline, too
+    start = candidate = end
+    bound = text.rfind(']', 0, max(0, end - 2)) # no link can contain this bracket
+    while text.startswith(']]', start - 2):
+        candidate = text.rfind('\n[[', 0, candidate)
+        if candidate < max(0, bound):
+            break
+        match = RE_LANGUAGE_LINK.match(text, candidate)
+        if match is not None and match.end() == start:
+            start = candidate
+            bound = text.rfind(']', 0, max(0, start - 2))
+    return start, end
+
+
+def _skip_template(text, pos):
+    """
+    Return position right after the template that starts at `pos`. Templates
+    nest; all curly braces are counted, as in `remove_template`.
+    """
+    depth = 0
+    for match in RE_BRACES.finditer(text, pos):
+        depth += 1 if match.group() == '{' else -1
+        if depth == 0:
+            return match.end()
+    return len(text) # unclosed template extends until the end
+
+
+def _element_end(text, pos, level, file_end=None):
+    """
+    Return position right after the end of the element `SCAN_ELEMENTS[level]`
+    whose content starts at `pos`, or None if the element is never closed.
+
+    Templates and elements that `remove_markup` removes before this one are
+    skipped, so that e.g. a '/>' inside a footnote doesn't close a math element.
+    So is the text of file links up to their caption. `file_end` is the position
+    of the ']]' that closes the file link whose caption contains `pos`, if any;
+    the same for the end of the element is returned as the second value.
+    """
+    pattern = RE_ELEMENT_ENDS[level]
+    while True:
+        match = pattern.search(text, pos)
+        if match is None:
+            return None, None
+        if file_end is not None and match.start() > file_end:
+            file_end = None # the match comes after the end of the file link
+        if match.group('end') is not None:
+            return match.end(), (file_end if file_end is not None and match.end() <= file_end else None)
+        start = match.start()
+        if text.startswith('{{', start):
+            pos = _skip_template(text, start)
+            continue
+        pos = start + 1
+        if text.startswith('[[', start):
+            # file links don't nest, so ignore those inside the caption of another one
+            caption, end = _file_caption(text, start + 2) if file_end is None else (None, None)
+            if end is not None:
+                pos, file_end = caption, end
+            continue
+        for inner_level in xrange(level):
+            inner = RE_ELEMENT_STARTS[inner_level].match(text, start)
+            if inner is not None:
+                end, inner_file_end = _element_end(text, inner.end(), inner_level, file_end)
+                if end is not None:
+                    pos, file_end = end, inner_file_end
+                break
+
+
+def _file_caption(text, pos):
+    """
+    Find the end of the file link whose content starts at `pos`, the way `remove_file`
+    does: at the first closing bracket, ignoring templates.
+
+    Return the position where the caption starts (after the last '|' outside
+    templates) and the position of the closing ']]', or `(None, None)` if the link
+    is not closed by ']]'.
+    """
+    caption = pos
+    while True:
+        match = RE_END_BRACKET.search(text, pos)
+        end = match.start() if match is not None else len(text)
+        bar = text.rfind('|', pos, end)
+        if bar >= 0:
+            caption = bar + 1
+        if match is None:
+            return None, None
+        if match.group() != '{{':
+            break
+        pos = _skip_template(text, end)
+    if not text.startswith(']]', end):
+        return None, None
+    return caption, end
+
+
+def _remove_table_markup(text, first_line):
+    """
+    Remove table markup from the lines of `text`, the same way `remove_markup` does:
+    each table cell on a separate line, then strip formatting lines and leave only
+    cell content. If `first_line` is set, the first line does not start after a
+    newline, and is left alone.
+    """
+    lines = text.replace('||', '\n|').split('\n')
+    for lineno in xrange(1 if first_line else 0, len(lines)):
+        line = lines[lineno]
+        if line[:2] in ('{|', '|-', '|}') and lineno < len(lines) - 1:
+            lines[lineno] = ''
+        elif line[:1] in ('|', '!') and line:
+            lines[lineno] = line[max(0, line.rfind('|')) + 1:]
+    return '\n'.join(lines)
+
+
+def _simplify_link(content, clean, after):
+    """
+    Return the text that replaces the closed bracket `[content]`, whether the
+    brackets were removed (as opposed to left in the text, for `scan_markup` to
+    strip at the very end), and when they were removed.
+
+    `remove_markup` removes brackets from the inside out, in rounds of substitutions;
+    times are counted as `PHASES * round + phase`. Only `clean` brackets (with no
+    unremoved brackets nested inside) are simplified, once their content is free of
+    brackets, i.e. `after` the last bracket nested inside was removed.
+    """
+    if not clean:
+        return '[' + content + ']', False, after
+    if '\n' not in content and RE_URL.match(content):
+        # external link: keep the description only
+        when = _removal(after, 1)
+        if when < PHASES * (MAX_ROUNDS + 1):
+            space = content.find(' ')
+            return (content[space:] if space >= 0 else ''), True, when
+    elif '|' in content:
+        # link: keep the description only
+        when = _removal(after, 2)
+        if when < PHASES * (MAX_ROUNDS + 1):
+            if when >= PHASES * 2:
+                # the description is taken after table markup was removed in earlier rounds
+                content = _remove_table_markup(content, True)
+            return content[content.rfind('|') + 1:], True, when
+    elif not content:
+        when = _removal(after, 3)
+        if when < PHASES * (MAX_ROUNDS + 1):
+            return '', True, when
+    return '[' + content + ']', False, after
+
+
+def _removal(after, phase):
+    """Return the first time of substitution `phase` of `remove_markup` that comes `after`."""
+    return PHASES * max(1, (after - phase) // PHASES + 1) + phase
+
+
+def _update_parent(stack, removed, when):
+    """Record the outcome of closing a bracket in its enclosing bracket, if any."""
+    if stack:
+        if removed:
+            stack[-1][3] = max(stack[-1][3], when)
+        else:
+            stack[-1][2] = False # the brackets stay in the text, and prevent simplifying the enclosing link
+
+
 def tokenize(content):
     """
     Tokenize a piece of text from wikipedia. The input string `content` is assumed
@@ -224,13 +567,65 @@ def _extract_pages(f, filter_namespaces=False):
             elem.clear()
 
 
+def _read_multistream_index(index_fname):
+    """
+    Return the sorted byte offsets of all bz2 streams listed in a multistream
+    dump index (lines of `offset:page_id:title`).
+    """
+    offsets = set()
+    with utils.smart_open(index_fname) as fin:
+        for line in fin:
+            line = line.strip()
+            if line:
+                offsets.add(int(line.split(':', 1)[0]))
+    return sorted(offsets)
+
+
+def _read_stream(f, start, end=None):
+    """
+    Decompress the single bz2 stream starting at byte offset `start` of the
+    open file `f`. If `end` is None, read up to the end of the stream.
+    """
+    f.seek(start)
+    if end is not None:
+        return bz2.decompress(f.read(end - start))
+    decompressor, result = bz2.BZ2Decompressor(), []
+    while True:
+        data = f.read(65536)
+        if not data:
+            break
+        result.append(decompressor.decompress(data))
+        if decompressor.unused_data:
+            break
+    return ''.join(result)
+
+
+def process_stream(args):
+    """
+    Decompress and parse one stream of a multistream dump, returning the content
+    of each of its articles as a list of tokens (utf8-encoded strings).
+    """
+    fname, start, end, root, lemmatize, filter_namespaces, markup_scanner = args
+    with open(fname, 'rb') as f:
+        xml = _read_stream(f, start, end).strip()
+    # streams contain bare <page> elements; put them inside the dump's root element
+    if not xml.startswith('<mediawiki'):
+        xml = root + xml
+    if not xml.endswith('</mediawiki>'):
+        xml += '</mediawiki>'
+    return [process_article((text, lemmatize, markup_scanner))
+            for _, text in _extract_pages(BytesIO(xml), filter_namespaces)]
+
+
 def process_article(args):
     """
     Parse a wikipedia article, returning its content as a list of tokens
     (utf8-encoded strings).
+
+    `args` is a `(text, lemmatize)` or `(text, lemmatize, markup_scanner)` tuple.
     """
-    text, lemmatize = args
-    text = filter_wiki(text)
+    text, lemmatize = args[:2]
+    text = filter_wiki(text, scanner=len(args) > 2 and args[2])
     if lemmatize:
         result = utils.lemmatize(text)
     else:
@@ -249,8 +644,20 @@ class WikiCorpus(TextCorpus):
     >>> wiki = WikiCorpus('enwiki-20100622-pages-articles.xml.bz2') # create word->word_id mapping, takes almost 8h
     >>> wiki.saveAsText('wiki_en_vocab200k') # another 8h, creates a file in MatrixMarket format plus file with id->word
 
+    With a multistream dump and its index, decompression and XML parsing run in
+    parallel, too:
+
+    >>> wiki = WikiCorpus('enwiki-latest-pages-articles-multistream.xml.bz2',
+    ...     index_fname='enwiki-latest-pages-articles-multistream-index.txt.bz2')
+
+    To parse the dump only once, cache the tokenized articles on disk:
+
+    >>> wiki = WikiCorpus('enwiki-20100622-pages-articles.xml.bz2', cache_fname='/tmp/wiki_tokens')
+    >>> MmCorpus.serialize('wiki_en.mm', wiki) # streams from the cache, doesn't parse the dump again
+
     """
-    def __init__(self, fname, processes=None, lemmatize=utils.HAS_PATTERN, dictionary=None, filter_namespaces=('0',)):
+    def __init__(self, fname, processes=None, lemmatize=utils.HAS_PATTERN, dictionary=None, filter_namespaces=('0',),
+                 index_fname=None, cache_fname=None, markup_scanner=False):
         """
         Initialize the corpus. Unless a dictionary is provided, this scans the
         corpus once, to determine its vocabulary.
@@ -259,20 +666,38 @@ class WikiCorpus(TextCorpus):
         token lemmas. Otherwise, use simple regexp tokenization. You can override
         this automatic logic by forcing the `lemmatize` parameter explicitly.
 
+        If `fname` is a multistream dump, pass its index file as `index_fname` to
+        process its bz2 streams in parallel (see `get_texts`).
+
+        If `cache_fname` is set, the first full pass over the dump also stores all
+        articles to that file (plus `cache_fname.ids` and `cache_fname.offsets.npy`),
+        as int32 token ids. Further passes read the articles from there, as long as
+        the dump file and the `lemmatize`, `filter_namespaces` and `markup_scanner`
+        settings stay the same; otherwise the cache is rebuilt.
+
+        Set `markup_scanner` to strip wiki markup with the faster, single-pass
+        `scan_markup` instead of `remove_markup`. The tokens are the same, except
+        for categories whose brackets are separated by a comment or tag (see
+        `scan_markup`).
+
         """
         self.fname = fname
+        self.index_fname = index_fname
+        self.cache_fname = cache_fname
+        self.resume_offset = None
         self.filter_namespaces = filter_namespaces
         if processes is None:
             processes = max(1, multiprocessing.cpu_count() - 1)
         self.processes = processes
         self.lemmatize = lemmatize
+        self.markup_scanner = markup_scanner
         if dictionary is None:
             self.dictionary = Dictionary(self.get_texts())
         else:
             self.dictionary = dictionary
 
 
-    def get_texts(self):
+    def get_texts(self, start_offset=None):
         """
         Iterate over the dump, returning text version of each article as a list
         of tokens.
@@ -285,25 +710,211 @@ class WikiCorpus(TextCorpus):
 
         >>> for vec in wiki_corpus:
         >>>     print(vec)
+
+        For multistream dumps (`index_fname` set), whole bz2 streams are decompressed,
+        parsed and tokenized by the worker processes. Articles still come out in
+        dump order. While iterating, `self.resume_offset` is the offset of the
+        first stream whose articles have not all been returned yet; after a
+        crash, pass it as `start_offset` to continue from that stream onwards.
         """
+        if start_offset is not None and self.index_fname is None:
+            raise ValueError("resuming from an offset requires a multistream dump index")
+        cache = None
+        if start_offset is None and self.cache_fname is not None:
+            cache = self.load_cache()
+            if cache is not None:
+                id2token = cache['id2token']
+                for ids in self.iter_cache(cache):
+                    yield [id2token[tokenid] for tokenid in ids.tolist()]
+                self.length = cache['num_docs']
+                return
+            cache = TokenCacheWriter(self.cache_fname)
+
         articles, articles_all = 0, 0
         positions, positions_all = 0, 0
-        texts = ((text, self.lemmatize) for _, text in _extract_pages(bz2.BZ2File(self.fname), self.filter_namespaces))
-        pool = multiprocessing.Pool(self.processes)
-        # process the corpus in smaller chunks of docs, because multiprocessing.Pool
-        # is dumb and would load the entire input into RAM at once...
-        for group in utils.chunkize(texts, chunksize=10 * self.processes, maxsize=1):
-            for tokens in pool.imap(process_article, group): # chunksize=10):
+        try:
+            for tokens in self._get_article_tokens(start_offset):
                 articles_all += 1
                 positions_all += len(tokens)
                 if len(tokens) > ARTICLE_MIN_WORDS: # article redirects and short stubs are pruned here
                     articles += 1
                     positions += len(tokens)
+                    if cache is not None:
+                        cache.add(tokens)
                     yield tokens
-        pool.terminate()
+            if cache is not None:
+                cache.finish(self.cache_fingerprint())
+        finally:
+            if cache is not None:
+                cache.close()
 
         logger.info("finished iterating over Wikipedia corpus of %i documents with %i positions"
             " (total %i articles, %i positions before pruning articles shorter than %i words)" %
             (articles, positions, articles_all, positions_all, ARTICLE_MIN_WORDS))
-        self.length = articles # cache corpus length
+        if not start_offset:
+            self.length = articles # cache corpus length
+
+
+    def __iter__(self):
+        """
+        Iterate over the corpus, yielding one bag-of-words document per article.
+        """
+        cache = self.load_cache() if self.cache_fname is not None else None
+        if cache is None or not isinstance(self.dictionary, Dictionary):
+            for bow in super(WikiCorpus, self).__iter__():
+                yield bow
+            return
+        # translate cached token ids to dictionary ids directly, without going through strings
+        token2id = self.dictionary.token2id
+        id2dictid = numpy.array([token2id.get(token, -1) for token in cache['id2token']], dtype=numpy.int64)
+        for ids in self.iter_cache(cache):
+            ids = id2dictid[ids]
+            ids = numpy.sort(ids[ids >= 0])
+            # count each run of equal ids in the sorted array
+            first = numpy.ones(len(ids), dtype=bool)
+            first[1:] = ids[1:] != ids[:-1]
+            tokenids, counts = ids[first], numpy.diff(numpy.append(numpy.flatnonzero(first), len(ids)))
+            yield list(zip(tokenids.tolist(), counts.tolist()))
+        self.length = cache['num_docs']
+
+
+    def cache_fingerprint(self):
+        """
+        Return the settings and dump file stats that the token cache depends on.
+        """
+        files = [(fname, os.path.getsize(fname), os.path.getmtime(fname))
+                 for fname in [self.fname, self.index_fname] if fname is not None]
+        filter_namespaces = tuple(self.filter_namespaces) if self.filter_namespaces else None
+        return {'files': files, 'lemmatize': bool(self.lemmatize), 'filter_namespaces': filter_namespaces,
+                'markup_scanner': bool(self.markup_scanner),
+                'min_words': ARTICLE_MIN_WORDS}
+
+
+    def load_cache(self):
+        """
+        Return metadata of the token cache, or None if there is no valid cache.
+        """
+        if not os.path.exists(self.cache_fname):
+            return None
+        cache = utils.unpickle(self.cache_fname)
+        if cache['fingerprint'] != self.cache_fingerprint():
+            logger.info("token cache %s is out of date, ignoring it" % self.cache_fname)
+            return None
+        return cache
+
+
+    def iter_cache(self, cache, chunksize=100000):
+        """
+        Iterate over the articles stored in the token cache, as arrays of token ids.
+        """
+        offsets = numpy.load(self.cache_fname + '.offsets.npy')
+        if offsets[-1] == 0:
+            ids = numpy.empty((0,), dtype=numpy.int32)
+        else:
+            ids = numpy.memmap(self.cache_fname + '.ids', dtype=numpy.int32, mode='r', shape=(offsets[-1],))
+        logger.info("reading %i articles from token cache %s" % (len(offsets) - 1, self.cache_fname))
+        # read the token ids sequentially, in large blocks
+        for chunk_start in xrange(0, len(offsets) - 1, chunksize):
+            chunk_offsets = offsets[chunk_start : chunk_start + chunksize + 1]
+            chunk = numpy.array(ids[chunk_offsets[0] : chunk_offsets[-1]])
+            chunk_offsets = chunk_offsets - chunk_offsets[0]
+            for start, end in zip(chunk_offsets[:-1], chunk_offsets[1:]):
+                yield chunk[start : end]
+
+
+    def _get_article_tokens(self, start_offset=None):
+        """
+        Iterate over token lists of all articles in the dump, before pruning.
+        """
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            if self.index_fname is None:
+                texts = ((text, self.lemmatize, self.markup_scanner)
+                         for _, text in _extract_pages(bz2.BZ2File(self.fname), self.filter_namespaces))
+                # process the corpus in smaller chunks of docs, because multiprocessing.Pool
+                # is dumb and would load the entire input into RAM at once...
+                for group in utils.chunkize(texts, chunksize=10 * self.processes, maxsize=1):
+                    for tokens in pool.imap(process_article, group): # chunksize=10):
+                        yield tokens
+                return
+
+            streams = self.get_streams(start_offset)
+            for group in utils.chunkize_serial(streams, chunksize=4 * self.processes):
+                results = pool.imap(process_stream, group)
+                for args in group:
+                    stream = next(results)
+                    self.resume_offset = args[1] # start offset of this stream
+                    for tokens in stream:
+                        yield tokens
+            self.resume_offset = None # all done
+        finally:
+            pool.terminate()
+
+
+    def get_streams(self, start_offset=None):
+        """
+        Return the list of bz2 streams of a multistream dump, in dump order, as
+        argument tuples for `process_stream`. Skip streams that start before
+        `start_offset`.
+        """
+        offsets = _read_multistream_index(self.index_fname)
+        with open(self.fname, 'rb') as f:
+            f.seek(0, 2)
+            size = f.tell()
+            # the dump's root element is in the first stream, along with site info
+            root = re.search(r'<mediawiki[^>]*>', _read_stream(f, 0)).group(0)
+        ends = offsets[1:] + [size]
+        return [(self.fname, start, end, root, self.lemmatize, self.filter_namespaces, self.markup_scanner)
+                for start, end in zip(offsets, ends) if start_offset is None or start >= start_offset]
 #endclass WikiCorpus
+
+
+class TokenCacheWriter(object):
+    """
+    Store tokenized documents to disk, as a flat file of int32 token ids plus an
+    array of document offsets into it. The token->id mapping and the `fingerprint`
+    are pickled into `fname` itself.
+
+    The cache files only appear once `finish()` is called, so an interrupted pass
+    never leaves behind an incomplete cache.
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self.token2id = {}
+        self.num_docs = self.num_positions = 0
+        self.fout_ids = open(fname + '.ids.tmp', 'wb')
+        self.fout_lengths = open(fname + '.lengths.tmp', 'wb')
+
+
+    def add(self, tokens):
+        token2id = self.token2id
+        ids = [token2id.setdefault(token, len(token2id)) for token in tokens]
+        numpy.asarray(ids, dtype=numpy.int32).tofile(self.fout_ids)
+        numpy.asarray([len(ids)], dtype=numpy.int32).tofile(self.fout_lengths)
+        self.num_docs += 1
+        self.num_positions += len(ids)
+
+
+    def finish(self, fingerprint):
+        self.fout_ids.close()
+        self.fout_lengths.close()
+        lengths = numpy.fromfile(self.fname + '.lengths.tmp', dtype=numpy.int32)
+        offsets = numpy.concatenate(([0], numpy.cumsum(lengths, dtype=numpy.int64)))
+        numpy.save(self.fname + '.offsets.npy', offsets)
+        os.rename(self.fname + '.ids.tmp', self.fname + '.ids')
+        id2token = [None] * len(self.token2id)
+        for token, tokenid in iteritems(self.token2id):
+            id2token[tokenid] = token
+        utils.pickle({'fingerprint': fingerprint, 'id2token': id2token, 'num_docs': self.num_docs,
+                      'num_positions': self.num_positions}, self.fname)
+        logger.info("stored %i articles with %i positions to token cache %s" %
+                    (self.num_docs, self.num_positions, self.fname))
+
+
+    def close(self):
+        self.fout_ids.close()
+        self.fout_lengths.close()
+        for tmp in [self.fname + '.ids.tmp', self.fname + '.lengths.tmp']:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+#endclass TokenCacheWriter
@@ -13,12 +13,14 @@ from __future__ import with_statement
 
 import logging
 import math
+import itertools
 
 import numpy
 import scipy.sparse
 import scipy.linalg
 from scipy.linalg.lapack import get_lapack_funcs
 
+from gensim.utils import grouper
 from gensim._six import iteritems, itervalues, string_types
 from gensim._six.moves import xrange, zip as izip
 
@@ -122,6 +124,25 @@ def corpus2csc(corpus, num_terms=None, dtype=numpy.float64, num_docs=None, num_n
     return result
 
 
+def corpus2csc_chunks(corpus, chunksize, num_terms, dtype=numpy.float64):
+    """
+    Iteratively yield the `corpus` as `scipy.sparse.csc_matrix` chunks of `chunksize`
+    documents each (documents as columns, `num_terms` rows). The last chunk may be smaller.
+
+    Corpora that can produce sparse chunks directly via `iter_chunks` (such as
+    `MmCorpus` and `UciCorpus`) are read that way, without creating the intermediate
+    per-document lists of 2-tuples. Any other corpus is grouped into chunks and
+    converted with `corpus2csc`.
+    """
+    if hasattr(corpus, 'iter_chunks'):
+        for chunk in corpus.iter_chunks(chunksize, num_terms=num_terms, dtype=dtype):
+            yield chunk
+    else:
+        for chunk in grouper(corpus, chunksize):
+            nnz = sum(len(doc) for doc in chunk)
+            yield corpus2csc(chunk, num_terms=num_terms, dtype=dtype, num_docs=len(chunk), num_nnz=nnz)
+
+
 def pad(mat, padrow, padcol):
     """
     Add additional rows/columns to a numpy.matrix `mat`. The new rows/columns
@@ -608,6 +629,64 @@ class MmReader(object):
             yield previd, []
 
 
+    def iter_chunks(self, chunksize=20000, num_terms=None, dtype=numpy.float64, buffer_lines=100000):
+        """
+        Iteratively yield the matrix as `scipy.sparse.csc_matrix` chunks of `chunksize`
+        documents each (documents as columns), in order. The last chunk may be smaller.
+
+        This is much faster than `corpus2csc` over `utils.grouper(self, chunksize)`,
+        because the file is parsed by numpy in blocks of `buffer_lines` lines, and no
+        per-document lists of 2-tuples are ever created.
+
+        `num_terms` sets the number of rows in each chunk (default: the number of
+        features from the file header; it may only be set larger than that).
+        """
+        if num_terms is None:
+            num_terms = self.num_terms
+        if num_terms < self.num_terms:
+            raise ValueError("cannot fit %i features into %i rows" % (self.num_terms, num_terms))
+        chunksize = int(chunksize)
+
+        if isinstance(self.input, string_types):
+            fin = open(self.input)
+        else:
+            fin = self.input
+            fin.seek(0)
+        self.skip_headers(fin)
+
+        # pending (not yet yielded) entries, as parallel arrays sorted by docid
+        docids = numpy.empty((0,), dtype=numpy.int64)
+        termids = numpy.empty((0,), dtype=numpy.int32)
+        vals = numpy.empty((0,), dtype=dtype)
+        chunk_start, num_docs = 0, None
+        while num_docs is None or chunk_start < num_docs:
+            lines = list(itertools.islice(fin, buffer_lines))
+            if lines:
+                block = numpy.fromstring(''.join(lines), sep=' ').reshape(-1, 3)
+                if not self.transposed:
+                    block = block[:, [1, 0, 2]]
+                # -1 because matrix market indexes are 1-based => convert to 0-based
+                docids = numpy.concatenate((docids, block[:, 0].astype(numpy.int64) - 1))
+                termids = numpy.concatenate((termids, block[:, 1].astype(numpy.int32) - 1))
+                vals = numpy.concatenate((vals, block[:, 2].astype(dtype)))
+                del block
+                assert numpy.all(docids[1:] >= docids[:-1]), "matrix columns must come in ascending order"
+            else:
+                # end of input: all remaining chunks are complete now. like in `__iter__`, the
+                # number of documents is taken from the header, unless the file has more.
+                num_docs = max(self.num_docs, docids[-1] + 1 if len(docids) else chunk_start)
+            # yield all chunks that are complete = we have seen a document beyond their end
+            while (num_docs is None and len(docids) and docids[-1] >= chunk_start + chunksize) or \
+                  (num_docs is not None and chunk_start < num_docs):
+                chunk_end = chunk_start + chunksize if num_docs is None else min(num_docs, chunk_start + chunksize)
+                indptr = numpy.searchsorted(docids, numpy.arange(chunk_start, chunk_end + 1))
+                nnz = indptr[-1]
+                yield scipy.sparse.csc_matrix((vals[:nnz], termids[:nnz], indptr),
+                                              shape=(num_terms, chunk_end - chunk_start), dtype=dtype)
+                docids, termids, vals = docids[nnz:], termids[nnz:], vals[nnz:]
+                chunk_start = chunk_end
+
+
     def docbyoffset(self, offset):
         """Return document at file offset `offset` (in bytes)"""
         # empty documents are not stored explicitly in MM format, so the index marks
@@ -16,6 +16,9 @@ Example: python -m gensim.models.lda_dispatcher
 
 from __future__ import with_statement
 import os, sys, logging, threading, time
+import copy
+import socket
+import tempfile
 from Queue import Queue
 
 from gensim import utils
@@ -62,9 +65,11 @@ class Dispatcher(object):
         self.lock_update = threading.Lock()
         self._jobsdone = 0
         self._jobsreceived = 0
+        self.remote_base = None # last model state broadcast to remote workers, see `reset()`
 
         # locate all available workers and store their proxies, for subsequent RMI calls
         self.workers = {}
+        self.local_workers = set() # ids of workers running on the same machine as the dispatcher
         import Pyro4
         with utils.getNS() as ns:
             self.callback = Pyro4.Proxy('PYRONAME:gensim.lda_dispatcher') # = self
@@ -79,12 +84,23 @@ class Dispatcher(object):
                     logger.info("registering worker #%i at %s" % (workerid, uri))
                     worker.initialize(workerid, dispatcher=self.callback, **model_params)
                     self.workers[workerid] = worker
+                    if worker.gethostname() == socket.gethostname():
+                        self.local_workers.add(workerid)
                 except Pyro4.errors.PyroError, err:
                     logger.warning("unresponsive worker at %s, deleting it from the name server" % uri)
                     ns.remove(name)
 
         if not self.workers:
             raise RuntimeError('no workers found; run some lda_worker scripts on your machines first!')
+        logger.info("%i workers run on the same machine as the dispatcher" % len(self.local_workers))
+
+
+    def shared_fname(self, name):
+        """
+        File used to exchange arrays with workers on this machine, instead of
+        sending them through Pyro.
+        """
+        return os.path.join(tempfile.gettempdir(), 'gensim_lda_%i_%s.npy' % (os.getpid(), name))
 
 
     def getworkers(self):
@@ -117,10 +133,18 @@ class Dispatcher(object):
             time.sleep(0.5) # check every half a second
 
         logger.info("merging states from %i workers" % len(self.workers))
-        workers = self.workers.values()
-        result = workers[0].getstate()
-        for worker in workers[1:]:
-            result.merge(worker.getstate())
+        result = None
+        for workerid, worker in self.workers.iteritems():
+            # local workers store their state to a file; remote workers send it compressed
+            fname = self.shared_fname('worker%i' % workerid) if workerid in self.local_workers else None
+            state = worker.getstate(fname)
+            state.sstats = utils.unpack_array(state.sstats)
+            if fname is not None:
+                os.remove(fname)
+            if result is None:
+                result = state
+            else:
+                result.merge(state)
 
         logger.info("sending out merged state")
         return result
@@ -129,11 +153,27 @@ class Dispatcher(object):
     def reset(self, state):
         """
         Initialize all workers for a new EM iterations.
+
+        The model state is written once into a file shared by all workers on this
+        machine. Remote workers receive it compressed, as a difference against the
+        state broadcast in the previous call.
         """
+        local_state, remote_state = None, None
         for workerid, worker in self.workers.iteritems():
             logger.info("resetting worker %s" % workerid)
-            worker.reset(state)
+            if workerid in self.local_workers:
+                if local_state is None:
+                    local_state = copy.copy(state)
+                    local_state.sstats = utils.pack_array(state.sstats, fname=self.shared_fname('state'))
+                worker.reset(local_state)
+            else:
+                if remote_state is None:
+                    remote_state = copy.copy(state)
+                    remote_state.sstats = utils.pack_array(state.sstats, base=self.remote_base)
+                worker.reset(remote_state)
             worker.requestjob()
+        if remote_state is not None:
+            self.remote_base = state.sstats
         self._jobsdone = 0
         self._jobsreceived = 0
 
@@ -164,6 +204,8 @@ class Dispatcher(object):
         for workerid, worker in self.workers.iteritems():
             logger.info("terminating worker %s" % workerid)
             worker.exit()
+        if os.path.exists(self.shared_fname('state')):
+            os.remove(self.shared_fname('state'))
         logger.info("terminating dispatcher")
         os._exit(0) # exit the whole process (not just this thread ala sys.exit())
 #endclass Dispatcher
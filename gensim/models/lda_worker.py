@@ -18,6 +18,7 @@ Example: python -m gensim.models.lda_worker
 
 from __future__ import with_statement
 import os, sys, logging
+import socket
 import threading
 import tempfile
 import Queue
@@ -44,10 +45,15 @@ class Worker(object):
         self.myid = myid # id of this worker in the dispatcher; just a convenience var for easy access/logging TODO remove?
         self.dispatcher = dispatcher
         self.finished = False
+        self.base = None # last model state received from a remote dispatcher, see `reset()`
         logger.info("initializing worker #%s" % myid)
         self.model = ldamodel.LdaModel(**model_params)
 
 
+    def gethostname(self):
+        return socket.gethostname()
+
+
     def requestjob(self):
         """
         Request jobs from the dispatcher, in a perpetual loop until `getstate()` is called.
@@ -82,11 +88,17 @@ class Worker(object):
 
 
     @utils.synchronous('lock_update')
-    def getstate(self):
+    def getstate(self, fname=None):
+        """
+        Return the state accumulated since the last `reset()`, with its sufficient
+        statistics packed by `utils.pack_array`: stored into the file `fname`,
+        if given (the dispatcher runs on the same machine), or compressed.
+        """
         logger.info("worker #%i returning its state after %s jobs" %
                     (self.myid, self.jobsdone))
         result = self.model.state
         assert isinstance(result, ldamodel.LdaState)
+        result.sstats = utils.pack_array(result.sstats, fname=fname)
         self.model.clear() # free up mem in-between two EM cycles
         self.finished = True
         return result
@@ -96,6 +108,12 @@ class Worker(object):
     def reset(self, state):
         assert state is not None
         logger.info("resetting worker #%i" % self.myid)
+        if isinstance(state.sstats, dict) and 'delta' in state.sstats:
+            # compressed state from a remote dispatcher; remember it for decoding the next one
+            state.sstats = utils.unpack_array(state.sstats, base=self.base)
+            self.base = state.sstats.copy()
+        else:
+            state.sstats = utils.unpack_array(state.sstats)
         self.model.state = state
         self.model.sync_state()
         self.model.state.reset()
@@ -33,11 +33,13 @@ The algorithm:
 
 import logging
 import itertools
+import multiprocessing
 
 logger = logging.getLogger('gensim.models.ldamodel')
 
 
 import numpy # for arrays, array broadcasting etc.
+import scipy.sparse
 #numpy.seterr(divide='ignore') # ignore 0*log(0) errors
 
 from scipy.special import gammaln, digamma, psi # gamma function utils
@@ -66,6 +68,42 @@ def dirichlet_expectation(alpha):
 
 
 
+# the model used by each local worker process; set up by `_init_worker` in the child
+_worker_model = None
+
+
+def _init_worker(model, shared_expElogbeta):
+    """
+    Initialize a process of the local worker pool (see `LdaModel(processes=N)`).
+
+    The worker gets its own (read-only) copy of `model`, but the (large) topic
+    matrix is not copied: `expElogbeta` is a view into shared memory, which the
+    parent process overwrites after each M step.
+
+    """
+    global _worker_model
+    numpy.random.seed() # don't let all forked workers draw the same random numbers
+    model.state = None
+    model.expElogbeta = numpy.frombuffer(shared_expElogbeta).reshape(model.num_topics, model.num_terms)
+    _worker_model = model
+
+
+def _worker_estep(job):
+    """
+    Run the E step on a single chunk inside a local worker process.
+
+    Only the sufficient statistics of words that actually appear in the chunk are
+    returned, to avoid pickling a full #topics x #terms matrix for every chunk.
+
+    """
+    chunk, alpha = job
+    _worker_model.alpha = alpha
+    gamma, sstats = _worker_model.inference(chunk, collect_sstats=True)
+    ids = numpy.unique(numpy.fromiter((id for doc in chunk for id, _ in doc), dtype=numpy.intp))
+    return gamma, ids, sstats[:, ids]
+
+
+
 class LdaState(utils.SaveLoad):
     """
     Encapsulate information for distributed computation of LdaModel objects.
@@ -182,7 +220,7 @@ class LdaModel(interfaces.TransformationABC):
     """
     def __init__(self, corpus=None, num_topics=100, id2word=None, distributed=False,
                  chunksize=2000, passes=1, update_every=1, alpha='symmetric', eta=None, decay=0.5,
-                 eval_every=10, iterations=50, gamma_threshold=0.001):
+                 eval_every=10, iterations=50, gamma_threshold=0.001, processes=1):
         """
         If given, start training from the iterable `corpus` straight away. If not given,
         the model is left untrained (presumably because you want to call `update()` manually).
@@ -206,6 +244,11 @@ class LdaModel(interfaces.TransformationABC):
         Turn on `distributed` to force distributed computing (see the `web tutorial <http://radimrehurek.com/gensim/distributed.html>`_
         on how to set up a cluster of machines for gensim).
 
+        Set `processes` to a number greater than one to parallelize training on
+        this machine, without `distributed` and Pyro: the E step then runs in a
+        pool of `processes` local worker processes. Just like in distributed mode,
+        the model is updated once every `update_every * processes` chunks.
+
         Calculate and log perplexity estimate from the latest mini-batch every
         `eval_every` model updates (setting this to 1 slows down training ~2x;
         default is 10 for better performance). Set to None to disable perplexity estimation.
@@ -219,6 +262,8 @@ class LdaModel(interfaces.TransformationABC):
 
         >>> lda = LdaModel(corpus, num_topics=50, alpha='auto', eval_every=5)  # train asymmetric alpha from data
 
+        >>> lda = LdaModel(corpus, num_topics=100, processes=multiprocessing.cpu_count())  # use all CPU cores
+
         """
         # store user-supplied parameters
         self.id2word = id2word
@@ -272,10 +317,14 @@ class LdaModel(interfaces.TransformationABC):
         self.gamma_threshold = gamma_threshold
 
         # set up distributed environment if necessary
+        self.processes = max(1, int(processes))
         if not distributed:
-            logger.info("using serial LDA version on this node")
             self.dispatcher = None
-            self.numworkers = 1
+            self.numworkers = self.processes
+            if self.processes > 1:
+                logger.info("using %i local worker processes on this node" % self.processes)
+            else:
+                logger.info("using serial LDA version on this node")
         else:
             if self.optimize_alpha:
                 raise NotImplementedError("auto-optimizing alpha not implemented in distributed LDA")
@@ -319,7 +368,7 @@ class LdaModel(interfaces.TransformationABC):
         self.Elogbeta = None
 
 
-    def inference(self, chunk, collect_sstats=False):
+    def inference(self, chunk, collect_sstats=False, batch=True):
         """
         Given a chunk of sparse document vectors, estimate gamma (parameters
         controlling the topic weights) for each document in the chunk.
@@ -333,7 +382,14 @@ class LdaModel(interfaces.TransformationABC):
         `(gamma, sstats)`. Otherwise, return `(gamma, None)`. `gamma` is of shape
         `len(chunk) x topics`.
 
+        By default, the fixed-point updates run for all documents of the chunk at
+        once, as sparse matrix operations (see `inference_batch`). Set `batch=False`
+        to iterate over the documents one by one instead; the results are the same.
+
         """
+        if batch:
+            return self.inference_batch(chunk, collect_sstats=collect_sstats)
+
         try:
             _ = len(chunk)
         except:
@@ -401,6 +457,110 @@ class LdaModel(interfaces.TransformationABC):
         return gamma, sstats
 
 
+
+    def inference_batch(self, chunk, collect_sstats=False, blocksize=2**17):
+        """
+        Same as `inference`, but update gamma and phi of all documents in `chunk`
+        together, using sparse matrix operations instead of a Python loop over the
+        documents. Documents that have converged drop out of the active set.
+
+        The topic-word weights of the non-zero entries are gathered in blocks of
+        at most `blocksize` values, so that temporary arrays stay small (in CPU cache)
+        regardless of the size of the chunk.
+
+        """
+        try:
+            _ = len(chunk)
+        except:
+            chunk = list(chunk) # convert iterators/generators to plain list, so we have len() etc.
+        if len(chunk) > 1:
+            logger.debug("performing batch inference on a chunk of %i documents" % len(chunk))
+
+        # Initialize the variational distribution q(theta|gamma) for the chunk
+        gamma = numpy.random.gamma(100., 1. / 100., (len(chunk), self.num_topics))
+        Elogtheta = dirichlet_expectation(gamma)
+        expElogtheta = numpy.exp(Elogtheta)
+
+        # represent the chunk as flat arrays of non-zero entries, with word ids remapped
+        # to only those words that actually appear in the chunk
+        doclens = numpy.asarray([len(doc) for doc in chunk], dtype=numpy.intp)
+        num_nnz = int(doclens.sum())
+        ids = numpy.fromiter((id for doc in chunk for id, _ in doc), dtype=numpy.intp, count=num_nnz)
+        cts = numpy.fromiter((cnt for doc in chunk for _, cnt in doc), dtype=numpy.float64, count=num_nnz)
+        chunk_ids, cols = numpy.unique(ids, return_inverse=True)
+        expElogbetaT = self.expElogbeta[:, chunk_ids].T.copy() # C-contiguous, #chunk words x #topics
+        rows = numpy.repeat(numpy.arange(len(chunk)), doclens) # row = position of the document within `active`
+        active = numpy.arange(len(chunk))
+        if collect_sstats:
+            chunk_sstats = numpy.zeros((self.num_topics, len(chunk_ids)))
+
+        def rowdot(theta):
+            # phinorm_{dw} = dot(expElogtheta_d, expElogbeta_w) for each non-zero (d, w), in blocks
+            result = numpy.empty(len(rows))
+            step = max(1, blocksize // max(1, self.num_topics))
+            for start in xrange(0, len(rows), step):
+                end = start + step
+                betad = expElogbetaT[cols[start : end]] # expElogbeta_w for each non-zero (d, w) of the block
+                result[start : end] = numpy.einsum('ij,ij->i', theta[rows[start : end]], betad)
+            return result + 1e-100
+
+        def phimatrix(phinorm):
+            # sparse #active docs x #chunk words matrix of n_{dw} / phinorm_{dw}
+            indptr = numpy.concatenate(([0], numpy.cumsum(doclens)))
+            return scipy.sparse.csr_matrix((cts / phinorm, cols, indptr), shape=(len(active), len(chunk_ids)))
+
+        # The optimal phi_{dwk} is proportional to expElogthetad_k * expElogbetad_w.
+        # phinorm is the normalizer.
+        phinorm = rowdot(expElogtheta)
+        converged = 0
+        for _ in xrange(self.iterations):
+            if not len(active):
+                break
+            lastgamma = gamma[active]
+            # same update as in the serial version, for all active documents at once
+            gammad = self.alpha + expElogtheta[active] * (phimatrix(phinorm) * expElogbetaT)
+            expElogthetad = numpy.exp(dirichlet_expectation(gammad))
+            gamma[active] = gammad
+            expElogtheta[active] = expElogthetad
+            phinorm = rowdot(expElogthetad)
+            # If gamma hasn't changed much, we're done.
+            done = numpy.mean(abs(gammad - lastgamma), axis=1) < self.gamma_threshold
+            if done.any():
+                converged += int(done.sum())
+                if collect_sstats:
+                    # Contribution of the converged documents to the expected sufficient
+                    # statistics for the M step.
+                    keep_nnz = numpy.repeat(done, doclens)
+                    indptr = numpy.concatenate(([0], numpy.cumsum(doclens[done])))
+                    phi = scipy.sparse.csr_matrix((cts[keep_nnz] / phinorm[keep_nnz], cols[keep_nnz], indptr),
+                                                  shape=(int(done.sum()), len(chunk_ids)))
+                    chunk_sstats += (phi.T * expElogthetad[done]).T
+                # drop the converged documents from the active set
+                keep, keep_nnz = ~done, numpy.repeat(~done, doclens)
+                rows = (numpy.cumsum(keep) - 1)[rows[keep_nnz]]
+                cols, cts, phinorm = cols[keep_nnz], cts[keep_nnz], phinorm[keep_nnz]
+                active, doclens = active[keep], doclens[keep]
+                expElogthetad = expElogthetad[keep]
+
+        if collect_sstats and len(active):
+            # documents that did not converge within `self.iterations` contribute, too
+            chunk_sstats += (phimatrix(phinorm).T * expElogthetad).T
+
+        if len(chunk) > 1:
+            logger.info("%i/%i documents converged within %i iterations" %
+                         (converged, len(chunk), self.iterations))
+
+        if collect_sstats:
+            # This step finishes computing the sufficient statistics for the
+            # M step, so that
+            # sstats[k, w] = \sum_d n_{dw} * phi_{dwk}
+            # = \sum_d n_{dw} * exp{Elogtheta_{dk} + Elogbeta_{kw}} / phinorm_{dw}.
+            sstats = numpy.zeros_like(self.expElogbeta)
+            sstats[:, chunk_ids] = chunk_sstats * self.expElogbeta[:, chunk_ids]
+            return gamma, sstats
+        return gamma, None
+
+
     def do_estep(self, chunk, state=None):
         """
         Perform inference on a chunk of documents, and accumulate the collected
@@ -525,67 +685,103 @@ class LdaModel(interfaces.TransformationABC):
             logger.warning("too few updates, training might not converge; consider "
                            "increasing the number of passes or iterations to improve accuracy")
 
-        for pass_ in xrange(passes):
-            if self.dispatcher:
-                logger.info('initializing %s workers' % self.numworkers)
-                self.dispatcher.reset(self.state)
-            else:
-                other = LdaState(self.eta, self.state.sstats.shape)
-            dirty = False
-
-            reallen = 0
-            for chunk_no, chunk in enumerate(utils.grouper(corpus, chunksize, as_numpy=True)):
-                reallen += len(chunk)  # keep track of how many documents we've processed so far
-
-                if eval_every and ((reallen == lencorpus) or ((chunk_no + 1) % (eval_every * self.numworkers) == 0)):
-                    self.log_perplexity(chunk, total_docs=lencorpus)
+        pool = None
+        if not self.dispatcher and self.numworkers > 1:
+            # local parallel mode: the workers read expElogbeta from shared memory
+            shared_expElogbeta = multiprocessing.RawArray('d', self.num_topics * self.num_terms)
+            expElogbeta_view = numpy.frombuffer(shared_expElogbeta).reshape(self.expElogbeta.shape)
+            expElogbeta_view[:] = self.expElogbeta
+            logger.info("spawning %i local worker processes" % self.numworkers)
+            pool = multiprocessing.Pool(self.numworkers, _init_worker, (self, shared_expElogbeta))
+            jobs = [] # E steps submitted to the pool, but not yet merged into `other`
+
+        def collect(other, maxjobs=0):
+            # merge results of finished E steps, until at most `maxjobs` are left pending
+            while len(jobs) > maxjobs:
+                gammat, ids, sstats = jobs.pop(0).get()
+                other.sstats[:, ids] += sstats
+                other.numdocs += gammat.shape[0]
+                if self.optimize_alpha:
+                    self.update_alpha(gammat, rho)
 
+        try:
+            for pass_ in xrange(passes):
                 if self.dispatcher:
-                    # add the chunk to dispatcher's job queue, so workers can munch on it
-                    logger.info('PROGRESS: pass %i, dispatching documents up to #%i/%i' %
-                                (pass_, chunk_no * chunksize + len(chunk), lencorpus))
-                    # this will eventually block until some jobs finish, because the queue has a small finite length
-                    self.dispatcher.putjob(chunk)
+                    logger.info('initializing %s workers' % self.numworkers)
+                    self.dispatcher.reset(self.state)
                 else:
-                    logger.info('PROGRESS: pass %i, at document #%i/%i' %
-                                (pass_, chunk_no * chunksize + len(chunk), lencorpus))
-                    gammat = self.do_estep(chunk, other)
+                    other = LdaState(self.eta, self.state.sstats.shape)
+                dirty = False
 
-                    if self.optimize_alpha:
-                        self.update_alpha(gammat, rho)
+                reallen = 0
+                for chunk_no, chunk in enumerate(utils.grouper(corpus, chunksize, as_numpy=True)):
+                    reallen += len(chunk)  # keep track of how many documents we've processed so far
 
-                dirty = True
-                del chunk
+                    if eval_every and ((reallen == lencorpus) or ((chunk_no + 1) % (eval_every * self.numworkers) == 0)):
+                        self.log_perplexity(chunk, total_docs=lencorpus)
 
-                # perform an M step. determine when based on update_every, don't do this after every chunk
-                if update_every and (chunk_no + 1) % (update_every * self.numworkers) == 0:
+                    if self.dispatcher:
+                        # add the chunk to dispatcher's job queue, so workers can munch on it
+                        logger.info('PROGRESS: pass %i, dispatching documents up to #%i/%i' %
+                                    (pass_, chunk_no * chunksize + len(chunk), lencorpus))
+                        # this will eventually block until some jobs finish, because the queue has a small finite length
+                        self.dispatcher.putjob(chunk)
+                    elif pool:
+                        logger.info('PROGRESS: pass %i, dispatching documents up to #%i/%i' %
+                                    (pass_, chunk_no * chunksize + len(chunk), lencorpus))
+                        jobs.append(pool.apply_async(_worker_estep, ((chunk, self.alpha.copy()),)))
+                        collect(other, maxjobs=2 * self.numworkers)
+                    else:
+                        logger.info('PROGRESS: pass %i, at document #%i/%i' %
+                                    (pass_, chunk_no * chunksize + len(chunk), lencorpus))
+                        gammat = self.do_estep(chunk, other)
+
+                        if self.optimize_alpha:
+                            self.update_alpha(gammat, rho)
+
+                    dirty = True
+                    del chunk
+
+                    # perform an M step. determine when based on update_every, don't do this after every chunk
+                    if update_every and (chunk_no + 1) % (update_every * self.numworkers) == 0:
+                        if self.dispatcher:
+                            # distributed mode: wait for all workers to finish
+                            logger.info("reached the end of input; now waiting for all remaining jobs to finish")
+                            other = self.dispatcher.getstate()
+                        elif pool:
+                            collect(other)
+                        self.do_mstep(rho(), other)
+                        del other # free up some mem
+                        if pool:
+                            expElogbeta_view[:] = self.expElogbeta # all workers are idle now
+
+                        if self.dispatcher:
+                            logger.info('initializing workers')
+                            self.dispatcher.reset(self.state)
+                        else:
+                            other = LdaState(self.eta, self.state.sstats.shape)
+                        dirty = False
+                #endfor single corpus iteration
+                if reallen != lencorpus:
+                    raise RuntimeError("input corpus size changed during training (don't use generators as input)")
+
+                if dirty:
+                    # finish any remaining updates
                     if self.dispatcher:
                         # distributed mode: wait for all workers to finish
                         logger.info("reached the end of input; now waiting for all remaining jobs to finish")
                         other = self.dispatcher.getstate()
+                    elif pool:
+                        collect(other)
                     self.do_mstep(rho(), other)
-                    del other # free up some mem
-
-                    if self.dispatcher:
-                        logger.info('initializing workers')
-                        self.dispatcher.reset(self.state)
-                    else:
-                        other = LdaState(self.eta, self.state.sstats.shape)
+                    del other
+                    if pool:
+                        expElogbeta_view[:] = self.expElogbeta
                     dirty = False
-            #endfor single corpus iteration
-            if reallen != lencorpus:
-                raise RuntimeError("input corpus size changed during training (don't use generators as input)")
-
-            if dirty:
-                # finish any remaining updates
-                if self.dispatcher:
-                    # distributed mode: wait for all workers to finish
-                    logger.info("reached the end of input; now waiting for all remaining jobs to finish")
-                    other = self.dispatcher.getstate()
-                self.do_mstep(rho(), other)
-                del other
-                dirty = False
-        #endfor entire corpus update
+            #endfor entire corpus update
+        finally:
+            if pool is not None:
+                pool.terminate()
 
 
     def do_mstep(self, rho, other):
@@ -16,6 +16,8 @@ Example: python -m gensim.models.lsi_dispatcher
 
 from __future__ import with_statement
 import os, sys, logging, threading, time
+import socket
+import tempfile
 from Queue import Queue
 
 from gensim import utils
@@ -66,6 +68,7 @@ class Dispatcher(object):
 
         # locate all available workers and store their proxies, for subsequent RMI calls
         self.workers = {}
+        self.local_workers = set() # ids of workers running on the same machine as the dispatcher
         with utils.getNS() as ns:
             import Pyro4
             self.callback = Pyro4.Proxy('PYRONAME:gensim.lsi_dispatcher') # = self
@@ -80,12 +83,37 @@ class Dispatcher(object):
                     logger.info("registering worker #%i from %s" % (workerid, uri))
                     worker.initialize(workerid, dispatcher=self.callback, **model_params)
                     self.workers[workerid] = worker
+                    if worker.gethostname() == socket.gethostname():
+                        self.local_workers.add(workerid)
                 except Pyro4.errors.PyroError, err:
                     logger.exception("unresponsive worker at %s, deleting it from the name server" % uri)
                     ns.remove(name)
 
         if not self.workers:
             raise RuntimeError('no workers found; run some lsi_worker scripts on your machines first!')
+        logger.info("%i workers run on the same machine as the dispatcher" % len(self.local_workers))
+
+
+    def shared_fname(self, name):
+        """
+        File used to exchange arrays with workers on this machine, instead of
+        sending them through Pyro.
+        """
+        return os.path.join(tempfile.gettempdir(), 'gensim_lsi_%i_%s.npy' % (os.getpid(), name))
+
+
+    def pullstate(self, workerid):
+        """
+        Get the projection of a single worker. Workers on this machine pass the
+        (large) `u` matrix through a file; remote workers send it compressed.
+        """
+        fname = self.shared_fname('worker%i' % workerid) if workerid in self.local_workers else None
+        result = self.workers[workerid].getstate(fname)
+        if result.u is not None:
+            result.u = utils.unpack_array(result.u)
+        if fname is not None and os.path.exists(fname):
+            os.remove(fname)
+        return result
 
 
     def getworkers(self):
@@ -122,11 +150,11 @@ class Dispatcher(object):
         # but merging only takes place once, after all input data has been processed,
         # so the overall effect would be small... compared to the amount of coding :-)
         logger.info("merging states from %i workers" % len(self.workers))
-        workers = self.workers.items()
-        result = workers[0][1].getstate()
-        for workerid, worker in workers[1:]:
+        workerids = sorted(self.workers)
+        result = self.pullstate(workerids[0])
+        for workerid in workerids[1:]:
             logger.info("pulling state from worker %s" % workerid)
-            result.merge(worker.getstate())
+            result.merge(self.pullstate(workerid))
         logger.info("sending out merged projection")
         return result
 
@@ -18,6 +18,8 @@ Example: python -m gensim.models.lsi_worker
 
 from __future__ import with_statement
 import os, sys, logging
+import copy
+import socket
 import threading
 import tempfile
 import Queue
@@ -47,6 +49,10 @@ class Worker(object):
         self.model = lsimodel.LsiModel(**model_params)
 
 
+    def gethostname(self):
+        return socket.gethostname()
+
+
     def requestjob(self):
         """
         Request jobs from the dispatcher, in a perpetual loop until `getstate()` is called.
@@ -79,12 +85,20 @@ class Worker(object):
 
 
     @utils.synchronous('lock_update')
-    def getstate(self):
+    def getstate(self, fname=None):
+        """
+        Return the projection computed since the last `reset()`, with its `u`
+        matrix packed by `utils.pack_array`: stored into the file `fname`, if
+        given (the dispatcher runs on the same machine), or compressed.
+        """
         logger.info("worker #%i returning its state after %s jobs" %
                     (self.myid, self.jobsdone))
         assert isinstance(self.model.projection, lsimodel.Projection)
         self.finished = True
-        return self.model.projection
+        result = copy.copy(self.model.projection)
+        if result.u is not None:
+            result.u = utils.pack_array(result.u, fname=fname)
+        return result
 
 
     @utils.synchronous('lock_update')
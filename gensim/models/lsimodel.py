@@ -368,14 +368,10 @@ class LsiModel(interfaces.TransformationABC):
                 if self.dispatcher:
                     logger.info('initializing %s workers' % self.numworkers)
                     self.dispatcher.reset()
-                for chunk_no, chunk in enumerate(utils.grouper(corpus, chunksize)):
+                # construct each job as a sparse matrix, to minimize memory overhead
+                # definitely avoid materializing it as a dense matrix!
+                for chunk_no, job in enumerate(matutils.corpus2csc_chunks(corpus, chunksize, self.num_terms)):
                     logger.info("preparing a new chunk of documents")
-                    nnz = sum(len(doc) for doc in chunk)
-                    # construct the job as a sparse matrix, to minimize memory overhead
-                    # definitely avoid materializing it as a dense matrix!
-                    logger.debug("converting corpus to csc format")
-                    job = matutils.corpus2csc(chunk, num_docs=len(chunk), num_terms=self.num_terms, num_nnz=nnz)
-                    del chunk
                     doc_no += job.shape[1]
                     if self.dispatcher:
                         # distributed version: add this job to the job queue, so workers can work on it
@@ -664,12 +660,10 @@ def stochastic_svd(corpus, rank, num_terms, chunksize=20000, extra_dims=None,
             q, _ = matutils.qr_destroy(q) # orthonormalize the range after each power iteration step
     else:
         num_docs = 0
-        for chunk_no, chunk in enumerate(utils.grouper(corpus, chunksize)):
+        # construct the chunks as sparse matrices (documents = columns of sparse CSC), to minimize
+        # memory overhead. definitely avoid materializing it as a dense (num_terms x chunksize) matrix!
+        for chunk_no, chunk in enumerate(matutils.corpus2csc_chunks(corpus, chunksize, num_terms, dtype=dtype)):
             logger.info('PROGRESS: at document #%i' % (chunk_no * chunksize))
-            # construct the chunk as a sparse matrix, to minimize memory overhead
-            # definitely avoid materializing it as a dense (num_terms x chunksize) matrix!
-            s = sum(len(doc) for doc in chunk)
-            chunk = matutils.corpus2csc(chunk, num_terms=num_terms, dtype=dtype) # documents = columns of sparse CSC
             m, n = chunk.shape
             assert m == num_terms
             assert n <= chunksize # the very last chunk of A is allowed to be smaller in size
@@ -686,9 +680,8 @@ def stochastic_svd(corpus, rank, num_terms, chunksize=20000, extra_dims=None,
             logger.info("running power iteration #%i" % (power_iter + 1))
             yold = q.copy()
             q[:] = 0.0
-            for chunk_no, chunk in enumerate(utils.grouper(corpus, chunksize)):
+            for chunk_no, chunk in enumerate(matutils.corpus2csc_chunks(corpus, chunksize, num_terms, dtype=dtype)):
                 logger.info('PROGRESS: at document #%i/%i' % (chunk_no * chunksize, num_docs))
-                chunk = matutils.corpus2csc(chunk, num_terms=num_terms, dtype=dtype) # documents = columns of sparse CSC
                 tmp = chunk.T * yold
                 tmp = chunk * tmp
                 del chunk
@@ -711,9 +704,8 @@ def stochastic_svd(corpus, rank, num_terms, chunksize=20000, extra_dims=None,
         # input corpus A, to avoid using O(number of documents) memory
         x = numpy.zeros(shape=(qt.shape[0], qt.shape[0]), dtype=numpy.float64)
         logger.info("2nd phase: constructing %s covariance matrix" % str(x.shape))
-        for chunk_no, chunk in enumerate(utils.grouper(corpus, chunksize)):
+        for chunk_no, chunk in enumerate(matutils.corpus2csc_chunks(corpus, chunksize, num_terms, dtype=qt.dtype)):
             logger.info('PROGRESS: at document #%i/%i' % (chunk_no * chunksize, num_docs))
-            chunk = matutils.corpus2csc(chunk, num_terms=num_terms, dtype=qt.dtype)
             b = qt * chunk # dense * sparse matrix multiply
             del chunk
             x += numpy.dot(b, b.T) # TODO should call the BLAS routine SYRK, but there is no SYRK wrapper in scipy :(
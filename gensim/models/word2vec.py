@@ -6,12 +6,13 @@
 
 
 """
-Deep learning via word2vec's "hierarchical softmax skip-gram model" [1]_.
+Deep learning via word2vec's "skip-gram and CBOW models", using either
+hierarchical softmax or negative sampling [1]_ [2]_.
 
-The training algorithm was originally ported from the C package https://code.google.com/p/word2vec/
+The training algorithms were originally ported from the C package https://code.google.com/p/word2vec/
 and extended with additional functionality.
 
-**Install Cython with `pip install cython` to use optimized word2vec training** (70x speedup [2]_).
+**Install Cython with `pip install cython` to use optimized word2vec training** (70x speedup [3]_).
 
 Initialize a model with e.g.::
 
@@ -50,31 +51,43 @@ If you're finished training a model (=no more updates, only querying), you can d
 
 to trim unneeded model memory = use (much) less RAM.
 
+For faster `most_similar` queries over large vocabularies, build an approximate
+nearest neighbour index (see `gensim.similarities.ivf`) and ask for approximate results::
+
+  >>> model.init_ann_index(nprobe=20)
+  >>> model.most_similar('queen', approx=True)
+
 For a tutorial with an interactive word2vec model trained on GoogleNews, visit http://radimrehurek.com/2014/02/word2vec-tutorial/
 
 .. [1] Tomas Mikolov, Kai Chen, Greg Corrado, and Jeffrey Dean. Efficient Estimation of Word Representations in Vector Space. In Proceedings of Workshop at ICLR, 2013.
-.. [2] Optimizing word2vec in gensim, http://radimrehurek.com/2013/09/word2vec-in-python-part-two-optimizing/
+.. [2] Tomas Mikolov, Ilya Sutskever, Kai Chen, Greg Corrado, and Jeffrey Dean. Distributed Representations of Words and Phrases and their Compositionality. In Proceedings of NIPS, 2013.
+.. [3] Optimizing word2vec in gensim, http://radimrehurek.com/2013/09/word2vec-in-python-part-two-optimizing/
 """
 
 import logging
 import sys
 import os
-import heapq
 import time
 import threading
+from itertools import chain
 try:
     from queue import Queue
 except ImportError:
     from Queue import Queue
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 from numpy import exp, dot, zeros, outer, random, dtype, get_include, float32 as REAL,\
-    uint32, seterr, array, uint8, vstack, argsort, fromstring, sqrt, newaxis, ndarray, empty
+    uint32, seterr, array, uint8, vstack, argsort, fromstring, sqrt, newaxis, ndarray, empty,\
+    arange, repeat, diff, concatenate, cumsum, int32, int64, ones, minimum, fromiter, nonzero, sum as np_sum
 
 logger = logging.getLogger("gensim.models.word2vec")
 
 
 from gensim import utils, matutils  # utility fnc for pickling, common scipy operations etc
-from gensim._six import iteritems, itervalues, string_types
+from gensim._six import iteritems, string_types
 from gensim._six.moves import xrange
 
 
@@ -82,43 +95,117 @@ try:
     # try to compile and use the faster cython version
     import pyximport
     pyximport.install(setup_args={"include_dirs": get_include()})
-    from word2vec_inner import train_sentence, FAST_VERSION
+    from word2vec_inner import train_batch_sg, train_batch_cbow, FAST_VERSION
 except:
     # failed... fall back to plain numpy (20-80x slower training than the above)
     FAST_VERSION = -1
 
-    def train_sentence(model, sentence, alpha, work=None):
+    def train_batch_sg(model, indexes, sentence_ends, alpha, work=None):
         """
-        Update skip-gram hierarchical softmax model by training on a single sentence.
+        Update skip-gram model by training on a batch of sentences, using hierarchical
+        softmax and/or negative sampling (`model.hs`, `model.negative`).
 
-        The sentence is a list of Vocab objects (or None, where the corresponding
-        word is not in the vocabulary. Called internally from `Word2Vec.train()`.
+        The sentences are concatenated in `indexes`, an array of vocabulary indexes
+        (-1 where the corresponding word is not in the vocabulary); `sentence_ends`
+        are the positions just after the last word of each sentence. Return the number
+        of words trained on. Called internally from `Word2Vec.train()`.
 
         """
-        for pos, word in enumerate(sentence):
-            if word is None:
-                continue  # OOV word in the input sentence => skip
-            reduced_window = random.randint(model.window)  # `b` in the original word2vec code
-
-            # now go over all words from the (reduced) window, predicting each one in turn
-            start = max(0, pos - model.window + reduced_window)
-            for pos2, word2 in enumerate(sentence[start : pos + model.window + 1 - reduced_window], start):
-                if pos2 == pos or word2 is None:
-                    # don't train on OOV words and on the `word` itself
-                    continue
+        indexes = indexes.tolist()
+        reduced_windows = random.randint(model.window, size=len(indexes)).tolist()  # `b` in the original word2vec code
+        sentence_start = 0
+        for sentence_end in sentence_ends.tolist():
+            for pos in xrange(sentence_start, sentence_end):
+                word = indexes[pos]
+                if word < 0:
+                    continue  # OOV word in the input sentence => skip
+
+                # now go over all words from the (reduced) window, predicting each one in turn
+                start = max(sentence_start, pos - model.window + reduced_windows[pos])
+                for pos2 in xrange(start, min(sentence_end, pos + model.window + 1 - reduced_windows[pos])):
+                    word2 = indexes[pos2]
+                    if pos2 == pos or word2 < 0:
+                        # don't train on OOV words and on the `word` itself
+                        continue
+
+                    l1 = model.syn0[word2]
+                    if model.hs:
+                        # work on the entire tree at once, to push as much work into numpy's C routines as possible (performance)
+                        point, code = model.word_tree(word)
+                        l2a = model.syn1[point]  # 2d matrix, codelen x layer1_size
+                        fa = 1.0 / (1.0 + exp(-dot(l1, l2a.T)))  #  propagate hidden -> output
+                        ga = (1 - code - fa) * alpha  # vector of error gradients multiplied by the learning rate
+                        model.syn1[point] += outer(ga, l1)  # learn hidden -> output
+
+                        l1 += dot(ga, l2a)  # learn input -> hidden
+
+                    if model.negative:
+                        l1 += train_negative(model, word, l1, alpha)
+            sentence_start = sentence_end
+
+        return len(indexes) - indexes.count(-1)
+
+
+    def train_batch_cbow(model, indexes, sentence_ends, alpha, work=None, neu1=None):
+        """
+        Update CBOW model by training on a batch of sentences, using hierarchical
+        softmax and/or negative sampling (`model.hs`, `model.negative`).
 
-                l1 = model.syn0[word2.index]
-                # work on the entire tree at once, to push as much work into numpy's C routines as possible (performance)
-                l2a = model.syn1[word.point]  # 2d matrix, codelen x layer1_size
-                fa = 1.0 / (1.0 + exp(-dot(l1, l2a.T)))  #  propagate hidden -> output
-                ga = (1 - word.code - fa) * alpha  # vector of error gradients multiplied by the learning rate
-                model.syn1[word.point] += outer(ga, l1)  # learn hidden -> output
+        See `train_batch_sg` for the input format.
 
-                # TODO add negative sampling?
+        """
+        indexes = indexes.tolist()
+        reduced_windows = random.randint(model.window, size=len(indexes)).tolist()  # `b` in the original word2vec code
+        sentence_start = 0
+        for sentence_end in sentence_ends.tolist():
+            for pos in xrange(sentence_start, sentence_end):
+                word = indexes[pos]
+                if word < 0:
+                    continue  # OOV word in the input sentence => skip
+                start = max(sentence_start, pos - model.window + reduced_windows[pos])
+                end = min(sentence_end, pos + model.window + 1 - reduced_windows[pos])
+                word2_indices = [indexes[pos2] for pos2 in xrange(start, end) if pos2 != pos and indexes[pos2] >= 0]
+                if not word2_indices:
+                    continue
 
-                l1 += dot(ga, l2a)  # learn input -> hidden
+                # the hidden layer = sum (or mean) of the context word vectors
+                l1 = np_sum(model.syn0[word2_indices], axis=0)
+                if model.cbow_mean:
+                    l1 /= len(word2_indices)
+                neu1e = zeros(l1.shape, dtype=REAL)  # error accumulated for the context words
+                if model.hs:
+                    point, code = model.word_tree(word)
+                    l2a = model.syn1[point]  # 2d matrix, codelen x layer1_size
+                    fa = 1.0 / (1.0 + exp(-dot(l1, l2a.T)))  #  propagate hidden -> output
+                    ga = (1 - code - fa) * alpha  # vector of error gradients multiplied by the learning rate
+                    model.syn1[point] += outer(ga, l1)  # learn hidden -> output
+                    neu1e += dot(ga, l2a)
+                if model.negative:
+                    neu1e += train_negative(model, word, l1, alpha)
+                for word2_index in word2_indices:
+                    model.syn0[word2_index] += neu1e  # learn input -> hidden, once for each context word
+            sentence_start = sentence_end
+
+        return len(indexes) - indexes.count(-1)
+
+
+    def train_negative(model, word, l1, alpha):
+        """
+        Update the output weights `model.syn1neg` for predicting the word with index
+        `word` from the hidden layer `l1` against `model.negative` noise words, and
+        return the error gradient for `l1`.
 
-        return len([word for word in sentence if word is not None])
+        """
+        # noise words equal to the predicted word are skipped, like in the C word2vec
+        noise = model.table[random.randint(len(model.table), size=model.negative)]
+        word_indices = concatenate(([word], noise[noise != word]))
+        labels = zeros(len(word_indices), dtype=REAL)
+        labels[0] = 1.0
+        l2b = model.syn1neg[word_indices]  # 2d matrix, (1 + #noise) x layer1_size
+        fb = 1.0 / (1.0 + exp(-dot(l1, l2b.T)))  #  propagate hidden -> output
+        gb = (labels - fb) * alpha  # vector of error gradients multiplied by the learning rate
+        model.syn1neg[word_indices] += outer(gb, l1)  # learn hidden -> output
+        return dot(gb, l2b)
 
 
 class Vocab(object):
@@ -135,6 +222,39 @@ class Vocab(object):
         return "<" + ', '.join(vals) + ">"
 
 
+class CompactVocab(Mapping):
+    """
+    Read-only mapping of words to `Vocab` objects, on top of the array-backed
+    vocabulary of a `Word2Vec` model (`word2index`, `index2word`, `vocab_counts`,
+    `vocab_sample_probabilities` and the packed Huffman tree).
+
+    The `Vocab` objects are created on the fly for each lookup; modifying them has
+    no effect on the model.
+
+    """
+    def __init__(self, model):
+        self.model = model
+
+    def __getitem__(self, word):
+        model = self.model
+        index = model.word2index[word]
+        result = Vocab(index=index, count=int(model.vocab_counts[index]),
+                       sample_probability=float(model.vocab_sample_probabilities[index]))
+        if getattr(model, 'code_offsets', None) is not None:
+            result.point, result.code = model.word_tree(index)
+        return result
+
+    def __contains__(self, word):
+        return word in self.model.word2index
+
+    def __iter__(self):
+        return iter(self.model.index2word)
+
+    def __len__(self):
+        return len(self.model.index2word)
+#endclass CompactVocab
+
+
 class Word2Vec(utils.SaveLoad):
     """
     Class for training, using and evaluating neural networks described in https://code.google.com/p/word2vec/
@@ -143,7 +263,8 @@ class Word2Vec(utils.SaveLoad):
     compatible with the original word2vec implementation via `save_word2vec_format()` and `load_word2vec_format()`.
 
     """
-    def __init__(self, sentences=None, size=100, alpha=0.025, window=5, min_count=5, seed=1, workers=1, min_alpha=0.0001):
+    def __init__(self, sentences=None, size=100, alpha=0.025, window=5, min_count=5, seed=1, workers=1, min_alpha=0.0001,
+                 sg=1, hs=1, negative=0, cbow_mean=0, sample=0):
         """
         Initialize the model from an iterable of `sentences`. Each sentence is a
         list of words (utf8 strings) that will be used for training.
@@ -162,10 +283,21 @@ class Word2Vec(utils.SaveLoad):
         `seed` = for the random number generator.
         `min_count` = ignore all words with total frequency lower than this.
         `workers` = use this many worker threads to train the model (=faster training with multicore machines)
+        `sg` defines the training algorithm. By default (`sg=1`), skip-gram is used. Otherwise, CBOW is used.
+        `hs` = if 1 (default), hierarchical softmax will be used for model training.
+        `negative` = if > 0, negative sampling will be used, the int for negative
+        specifies how many "noise words" should be drawn (usually between 5-20).
+        Noise words are drawn from the unigram distribution raised to the 3/4rd power.
+        `cbow_mean` = if 0 (default), use the sum of the context word vectors. If 1, use the mean.
+        Only applies when CBOW is used.
+        `sample` = threshold for configuring which higher-frequency words are randomly downsampled;
+        default is 0 (off), useful value is 1e-5.
 
         """
-        self.vocab = {}  # mapping from a word (string) to a Vocab object
+        self.word2index = {}  # map from a word (string) to its matrix index (int)
         self.index2word = []  # map from a word's matrix index (int) to word (string)
+        self.vocab_counts = zeros(0, dtype=int64)  # word frequencies, by matrix index
+        self.vocab_sample_probabilities = zeros(0)  # see precalc_sampling()
         self.layer1_size = int(size)
         if size % 4 != 0:
             logger.warning("consider setting layer size to a multiple of 4 for greater performance")
@@ -175,42 +307,126 @@ class Word2Vec(utils.SaveLoad):
         self.min_count = min_count
         self.workers = workers
         self.min_alpha = min_alpha
+        self.sg = int(sg)
+        self.hs = int(hs)
+        self.negative = int(negative)
+        self.cbow_mean = int(cbow_mean)
+        self.sample = sample
+        if not self.hs and not self.negative:
+            raise ValueError("at least one of hierarchical softmax (hs=1) and negative sampling (negative>0) must be on")
+        self.table = None  # for negative sampling, see make_table()
         if sentences is not None:
             self.build_vocab(sentences)
             self.train(sentences)
 
 
+    @property
+    def vocab(self):
+        """
+        Mapping from a word (string) to a `Vocab` object with its `index`, `count`,
+        `sample_probability` and Huffman `code` and `point` (see `CompactVocab`).
+
+        """
+        return CompactVocab(self)
+
+
+    def make_table(self, table_size=None, power=0.75):
+        """
+        Create a table of word indexes for drawing "noise words" in negative sampling.
+        Each word takes up a number of consecutive cells proportional to its count
+        raised to `power`, so that a uniformly random cell is a sample from the
+        smoothed unigram distribution (in O(1)). Called internally from `build_vocab()`.
+
+        The table has `table_size` cells; by default 1000 per vocabulary word, but
+        at most 1e8 (like in the C word2vec).
+
+        """
+        if table_size is None:
+            table_size = min(100000000, 1000 * len(self.vocab))
+        logger.info("constructing a table with noise distribution from %i words" % len(self.vocab))
+        counts = self.vocab_counts.astype(float) ** power
+        # cumulative distribution => the last cell of each word in the table
+        bounds = (cumsum(counts) / counts.sum() * table_size).round().astype(int64)
+        self.table = repeat(arange(len(counts), dtype=uint32), diff(concatenate(([0], bounds))))
+
+
     def create_binary_tree(self):
         """
         Create a binary Huffman tree using stored vocabulary word counts. Frequent words
         will have shorter binary codes. Called internally from `build_vocab()`.
 
+        Like in the C word2vec, the tree is built in linear time (after sorting the
+        counts) from two queues: the words by increasing count, and the inner nodes,
+        which are created in order of increasing count, too. The codes and points are
+        written into the packed arrays directly (see `pack_tree()`).
+
         """
-        logger.info("constructing a huffman tree from %i words" % len(self.vocab))
-
-        # build the huffman tree
-        heap = self.vocab.values()
-        heapq.heapify(heap)
-        for i in xrange(len(self.vocab) - 1):
-            min1, min2 = heapq.heappop(heap), heapq.heappop(heap)
-            heapq.heappush(heap, Vocab(count=min1.count + min2.count, index=i + len(self.vocab), left=min1, right=min2))
-
-        # recurse over the tree, assigning a binary code to each vocabulary word
-        if heap:
-            max_depth, stack = 0, [(heap[0], [], [])]
-            while stack:
-                node, codes, points = stack.pop()
-                if node.index < len(self.vocab):
-                    # leaf node => store its path from the root
-                    node.code, node.point = codes, points
-                    max_depth = max(len(codes), max_depth)
+        vocab_size = len(self.vocab_counts)
+        logger.info("constructing a huffman tree from %i words" % vocab_size)
+
+        # node ids: words (leaves) are 0..vocab_size-1, followed by the inner nodes in order of creation
+        num_nodes = max(2 * vocab_size - 1, 0)
+        order = argsort(self.vocab_counts, kind='mergesort').tolist()
+        counts = self.vocab_counts.tolist() + [0] * (num_nodes - vocab_size)
+        parent, binary = [0] * num_nodes, [0] * num_nodes
+        leaf, inner = 0, vocab_size  # heads of the two queues
+        for node in xrange(vocab_size, num_nodes):
+            for bit in (0, 1):
+                # take the smaller of the two queue heads; prefer words on ties, for a shallower tree
+                if leaf < vocab_size and (inner == node or counts[order[leaf]] <= counts[inner]):
+                    child = order[leaf]
+                    leaf += 1
                 else:
-                    # inner node => continue recursion
-                    points = array(list(points) + [node.index - len(self.vocab)], dtype=uint32)
-                    stack.append((node.left, array(list(codes) + [0], dtype=uint8), points))
-                    stack.append((node.right, array(list(codes) + [1], dtype=uint8), points))
+                    child = inner
+                    inner += 1
+                counts[node] += counts[child]
+                parent[child], binary[child] = node, bit
+        parent, binary = array(parent, dtype=int64), array(binary, dtype=uint8)
+        del order, counts
+
+        # walk up from all words to the root at once, to get their code lengths...
+        root = num_nodes - 1
+        nodes, lengths = arange(vocab_size), zeros(vocab_size, dtype=int64)
+        active = nonzero(nodes != root)[0]
+        while len(active):
+            nodes[active] = parent[nodes[active]]
+            lengths[active] += 1
+            active = active[nodes[active] != root]
+        self.code_offsets = concatenate(([0], cumsum(lengths))).astype(int64)
+
+        # ...and once more to fill in the codes & points, from the last one backwards
+        self.vocab_codes = empty(self.code_offsets[-1], dtype=uint8)
+        self.vocab_points = empty(self.code_offsets[-1], dtype=uint32)
+        nodes, positions = arange(vocab_size), self.code_offsets[1:] - 1
+        active = nonzero(lengths)[0]
+        while len(active):
+            self.vocab_codes[positions[active]] = binary[nodes[active]]
+            nodes[active] = parent[nodes[active]]
+            self.vocab_points[positions[active]] = (nodes[active] - vocab_size).astype(uint32)
+            positions[active] -= 1
+            active = active[nodes[active] != root]
+
+        if vocab_size:
+            logger.info("built huffman tree with maximum node depth %i" % lengths.max())
+
+
+    def pack_tree(self, codes, points):
+        """
+        Concatenate the Huffman `codes` and `points` of all words (lists, by word index)
+        into flat arrays, for the training routines: the code of the word with index
+        `i` is `vocab_codes[code_offsets[i] : code_offsets[i + 1]]`, its points likewise
+        in `vocab_points`. Used to convert models from older versions on `load()`.
 
-            logger.info("built huffman tree with maximum node depth %i" % max_depth)
+        """
+        self.code_offsets = concatenate(([0], cumsum([len(code) for code in codes], dtype=int64))).astype(int64)
+        self.vocab_codes = fromiter(chain.from_iterable(codes), dtype=uint8, count=self.code_offsets[-1])
+        self.vocab_points = fromiter(chain.from_iterable(points), dtype=uint32, count=self.code_offsets[-1])
+
+
+    def word_tree(self, index):
+        """Return the `(points, code)` arrays of the word with the given index."""
+        start, end = self.code_offsets[index], self.code_offsets[index + 1]
+        return self.vocab_points[start : end], self.vocab_codes[start : end]
 
     def build_vocab(self, sentences):
         """
@@ -227,27 +443,48 @@ class Word2Vec(utils.SaveLoad):
                     (sentence_no, total_words, len(vocab)))
             for word in sentence:
                 total_words += 1
-                if word in vocab:
-                    vocab[word].count += 1
-                else:
-                    vocab[word] = Vocab(count=1)
+                vocab[word] = vocab.get(word, 0) + 1
         logger.info("collected %i word types from a corpus of %i words and %i sentences" %
             (len(vocab), total_words, sentence_no + 1))
 
         # assign a unique index to each word
-        self.vocab, self.index2word = {}, []
-        for word, v in iteritems(vocab):
-            if v.count >= self.min_count:
-                v.index = len(self.vocab)
+        self.word2index, self.index2word, counts = {}, [], []
+        for word, count in iteritems(vocab):
+            if count >= self.min_count:
+                self.word2index[word] = len(self.index2word)
                 self.index2word.append(word)
-                self.vocab[word] = v
-        logger.info("total %i word types after removing those with count<%s" % (len(self.vocab), self.min_count))
+                counts.append(count)
+        self.vocab_counts = array(counts, dtype=int64)
+        del vocab, counts
+        logger.info("total %i word types after removing those with count<%s" % (len(self.index2word), self.min_count))
+
+        # precalculate downsampling thresholds
+        self.precalc_sampling()
 
         # add info about each word's Huffman encoding
-        self.create_binary_tree()
+        if self.hs:
+            self.create_binary_tree()
+        if self.negative:
+            self.make_table()
         self.reset_weights()
 
 
+    def precalc_sampling(self):
+        """
+        Precalculate each vocabulary word's probability of being kept in training,
+        `vocab_sample_probabilities`, according to the `sample` threshold (like in the
+        C word2vec). Called internally from `build_vocab()`.
+
+        """
+        if not self.sample:
+            self.vocab_sample_probabilities = ones(len(self.vocab_counts))
+            return
+        logger.info("frequent-word downsampling, threshold %g" % self.sample)
+        counts = self.vocab_counts.astype(float)
+        threshold_count = float(self.sample) * counts.sum()
+        self.vocab_sample_probabilities = minimum(1.0, (sqrt(counts / threshold_count) + 1) * threshold_count / counts)
+
+
     def train(self, sentences, total_words=None, word_count=0, chunksize=100):
         """
         Update the model's neural weights from a sequence of sentences (can be a once-only generator stream).
@@ -257,19 +494,23 @@ class Word2Vec(utils.SaveLoad):
         if FAST_VERSION < 0:
             import warnings
             warnings.warn("Cython compilation failed, training will be slow. Do you have Cython installed? `pip install cython`")
-        logger.info("training model with %i workers on %i vocabulary and %i features" % (self.workers, len(self.vocab), self.layer1_size))
+        logger.info("training model with %i workers on %i vocabulary and %i features, using 'skipgram'=%s 'hierarchical softmax'=%s 'negative sampling'=%s" %
+            (self.workers, len(self.vocab), self.layer1_size, self.sg, self.hs, self.negative))
 
-        if not self.vocab:
+        if not self.index2word:
             raise RuntimeError("you must first build vocabulary before training the model")
 
         start, next_report = time.time(), [1.0]
-        word_count, total_words = [word_count], total_words or sum(v.count for v in itervalues(self.vocab))
+        # `word_count` counts words before downsampling, so that it goes up to `total_words`
+        word_count, total_words = [word_count], total_words or int(self.vocab_counts.sum())
+        trained_count = [0]  # words actually trained on, after downsampling
         jobs = Queue(maxsize=2 * self.workers)  # buffer ahead only a limited number of jobs.. this is the reason we can't simply use ThreadPool :(
         lock = threading.Lock()  # for shared state (=number of words trained so far, log reports...)
 
         def worker_train():
             """Train the model, lifting lists of sentences from the jobs queue."""
             work = zeros(self.layer1_size, dtype=REAL)  # each thread must have its own work memory
+            neu1 = zeros(self.layer1_size, dtype=REAL)  # hidden layer of CBOW
 
             while True:
                 job = jobs.get()
@@ -278,9 +519,14 @@ class Word2Vec(utils.SaveLoad):
                 # update the learning rate before every job
                 alpha = max(self.min_alpha, self.alpha * (1 - 1.0 * word_count[0] / total_words))
                 # how many words did we train on? out-of-vocabulary (unknown) words do not count
-                job_words = sum(train_sentence(self, sentence, alpha, work) for sentence in job)
+                indexes, sentence_ends, raw_words = job
+                if self.sg:
+                    job_words = train_batch_sg(self, indexes, sentence_ends, alpha, work)
+                else:
+                    job_words = train_batch_cbow(self, indexes, sentence_ends, alpha, work, neu1)
                 with lock:
-                    word_count[0] += job_words
+                    word_count[0] += raw_words
+                    trained_count[0] += job_words
                     elapsed = time.time() - start
                     if elapsed >= next_report[0]:
                         logger.info("PROGRESS: at %.2f%% words, alpha %.05f, %.0f words/s" %
@@ -292,9 +538,34 @@ class Word2Vec(utils.SaveLoad):
             thread.daemon = True  # make interrupting the process with ctrl+c easier
             thread.start()
 
-        # convert input strings to Vocab objects (or None for OOV words), and start filling the jobs queue
-        no_oov = ([self.vocab.get(word, None) for word in sentence] for sentence in sentences)
-        for job_no, job in enumerate(utils.grouper(no_oov, chunksize)):
+        # downsampling gets its own random generator, so that results don't depend on thread timing
+        sampler = random.RandomState(random.randint(2**31 - 1)) if self.sample else None
+
+        def prepare_jobs():
+            """
+            Yield jobs of `chunksize` sentences, as `(indexes, sentence_ends, raw_words)`:
+            the vocabulary indexes of all words in the job (-1 for OOV words) as one int32
+            array, the positions where each sentence ends, and the number of words before
+            downsampling.
+            """
+            word2index = self.word2index
+            for job in utils.grouper(sentences, chunksize):
+                # convert input strings to word indexes (or -1 for OOV words)
+                indexes, sentence_ends = [], []
+                for sentence in job:
+                    indexes.extend(word2index.get(word, -1) for word in sentence)
+                    sentence_ends.append(len(indexes))
+                indexes, sentence_ends = array(indexes, dtype=int32), array(sentence_ends, dtype=int32)
+                raw_words = int((indexes >= 0).sum())
+                if sampler is not None:
+                    # drop occurrences of frequent words at random; rarer words are always kept
+                    keep = (indexes < 0) | (self.vocab_sample_probabilities[indexes] >= sampler.random_sample(len(indexes)))
+                    sentence_ends = concatenate(([0], cumsum(keep)))[sentence_ends].astype(int32)
+                    indexes = indexes[keep]
+                yield indexes, sentence_ends, raw_words
+
+        # start filling the jobs queue
+        for job_no, job in enumerate(prepare_jobs()):
             logger.debug("putting job #%i in the queue, qsize=%i" % (job_no, jobs.qsize()))
             jobs.put(job)
         logger.info("reached the end of input; waiting to finish %i outstanding jobs" % jobs.qsize())
@@ -305,8 +576,8 @@ class Word2Vec(utils.SaveLoad):
             thread.join()
 
         elapsed = time.time() - start
-        logger.info("training on %i words took %.1fs, %.0f words/s" %
-            (word_count[0], elapsed, word_count[0] / elapsed if elapsed else 0.0))
+        logger.info("training on %i words (%i after downsampling) took %.1fs, %.0f words/s" %
+            (word_count[0], trained_count[0], elapsed, word_count[0] / elapsed if elapsed else 0.0))
 
         return word_count[0]
 
@@ -319,7 +590,10 @@ class Word2Vec(utils.SaveLoad):
         # randomize weights vector by vector, rather than materializing a huge random matrix in RAM at once
         for i in xrange(len(self.vocab)):
             self.syn0[i] = (random.rand(self.layer1_size) - 0.5) / self.layer1_size
-        self.syn1 = zeros((len(self.vocab), self.layer1_size), dtype=REAL)
+        if self.hs:
+            self.syn1 = zeros((len(self.vocab), self.layer1_size), dtype=REAL)
+        if self.negative:
+            self.syn1neg = zeros((len(self.vocab), self.layer1_size), dtype=REAL)
         self.syn0norm = None
 
 
@@ -329,19 +603,20 @@ class Word2Vec(utils.SaveLoad):
         C word2vec-tool, for compatibility.
 
         """
+        # store in sorted order: most frequent words at the top
+        order = argsort(-self.vocab_counts, kind='mergesort')
         if fvocab is not None:
             logger.info("Storing vocabulary in %s" % (fvocab))
             with utils.smart_open(fvocab, 'wb') as vout:
-                for word, vocab in sorted(iteritems(self.vocab), key=lambda item: -item[1].count):
-                    vout.write("%s %s\n" % (word, vocab.count))
-        logger.info("storing %sx%s projection weights into %s" % (len(self.vocab), self.layer1_size, fname))
-        assert (len(self.vocab), self.layer1_size) == self.syn0.shape
+                for index in order:
+                    vout.write("%s %s\n" % (self.index2word[index], self.vocab_counts[index]))
+        logger.info("storing %sx%s projection weights into %s" % (len(self.index2word), self.layer1_size, fname))
+        assert (len(self.index2word), self.layer1_size) == self.syn0.shape
         with utils.smart_open(fname, 'wb') as fout:
             fout.write("%s %s\n" % self.syn0.shape)
-            # store in sorted order: most frequent words at the top
-            for word, vocab in sorted(iteritems(self.vocab), key=lambda item: -item[1].count):
-                word = utils.to_utf8(word)  # always store in utf8
-                row = self.syn0[vocab.index]
+            for index in order:
+                word = utils.to_utf8(self.index2word[index])  # always store in utf8
+                row = self.syn0[index]
                 if binary:
                     fout.write("%s %s\n" % (word, row.tostring()))
                 else:
@@ -375,6 +650,7 @@ class Word2Vec(utils.SaveLoad):
             vocab_size, layer1_size = map(int, header.split())  # throws for invalid file format
             result = Word2Vec(size=layer1_size)
             result.syn0 = zeros((vocab_size, layer1_size), dtype=REAL)
+            word_counts = []
             if binary:
                 binary_len = dtype(REAL).itemsize * layer1_size
                 for line_no in xrange(vocab_size):
@@ -388,12 +664,13 @@ class Word2Vec(utils.SaveLoad):
                         if ch != '\n':  # ignore newlines in front of words (some binary files have newline, some not)
                             word.append(ch)
                     if counts is None:
-                        result.vocab[word] = Vocab(index=line_no, count=vocab_size - line_no)
+                        word_counts.append(vocab_size - line_no)
                     elif counts.has_key(word):
-                        result.vocab[word] = Vocab(index=line_no, count=counts[word])
+                        word_counts.append(counts[word])
                     else:
                         logger.warning("vocabulary file is incomplete")
-                        result.vocab[word] = Vocab(index=line_no, count=None)
+                        word_counts.append(0)
+                    result.word2index[word] = line_no
                     result.index2word.append(word)
                     result.syn0[line_no] = fromstring(fin.read(binary_len), dtype=REAL)
             else:
@@ -403,20 +680,23 @@ class Word2Vec(utils.SaveLoad):
                         raise ValueError("invalid vector on line %s (is this really the text format?)" % (line_no))
                     word, weights = parts[0], map(REAL, parts[1:])
                     if counts is None:
-                        result.vocab[word] = Vocab(index=line_no, count=vocab_size - line_no)
+                        word_counts.append(vocab_size - line_no)
                     elif counts.has_key(word):
-                        result.vocab[word] = Vocab(index=line_no, count=counts[word])
+                        word_counts.append(counts[word])
                     else:
                         logger.warning("vocabulary file is incomplete")
-                        result.vocab[word] = Vocab(index=line_no, count=None)
+                        word_counts.append(0)
+                    result.word2index[word] = line_no
                     result.index2word.append(word)
                     result.syn0[line_no] = weights
+        result.vocab_counts = array(word_counts, dtype=int64)
+        result.vocab_sample_probabilities = ones(vocab_size)
         logger.info("loaded %s matrix from %s" % (result.syn0.shape, fname))
         result.init_sims(norm_only)
         return result
 
 
-    def most_similar(self, positive=[], negative=[], topn=10):
+    def most_similar(self, positive=[], negative=[], topn=10, approx=False, nprobe=None):
         """
         Find the top-N most similar words. Positive words contribute positively towards the
         similarity, negative words negatively.
@@ -430,6 +710,11 @@ class Word2Vec(utils.SaveLoad):
           >>> trained_model.most_similar(positive=['woman', 'king'], negative=['man'])
           [('queen', 0.50882536), ...]
 
+        With `approx=True`, only words found by the approximate nearest neighbour
+        index are considered (see `init_ann_index`); this is much faster for large
+        vocabularies, but may miss some of the true top-N words. `nprobe` overrides the
+        index's recall/speed setting (higher = more accurate, slower).
+
         """
         self.init_sims()
 
@@ -448,15 +733,21 @@ class Word2Vec(utils.SaveLoad):
         for word, weight in positive + negative:
             if isinstance(word, ndarray):
                 mean.append(weight * word)
-            elif word in self.vocab:
-                mean.append(weight * self.syn0norm[self.vocab[word].index])
-                all_words.add(self.vocab[word].index)
+            elif word in self.word2index:
+                mean.append(weight * self.syn0norm[self.word2index[word]])
+                all_words.add(self.word2index[word])
             else:
                 raise KeyError("word '%s' not in vocabulary" % word)
         if not mean:
             raise ValueError("cannot compute similarity with no input")
         mean = matutils.unitvec(array(mean).mean(axis=0)).astype(REAL)
 
+        if approx and topn:
+            if getattr(self, 'ann_index', None) is None:
+                raise ValueError("no approximate index; call init_ann_index() first")
+            best, dists = self.ann_index.most_similar(self.syn0norm, mean, topn=topn, nprobe=nprobe, exclude=all_words)
+            return [(self.index2word[sim], float(dist)) for sim, dist in zip(best, dists)]
+
         dists = dot(self.syn0norm, mean)
         if not topn:
             return dists
@@ -478,11 +769,11 @@ class Word2Vec(utils.SaveLoad):
         """
         self.init_sims()
 
-        words = [word for word in words if word in self.vocab]  # filter out OOV words
+        words = [word for word in words if word in self.word2index]  # filter out OOV words
         logger.debug("using words %s" % words)
         if not words:
             raise ValueError("cannot select a word from an empty list")
-        vectors = vstack(self.syn0norm[self.vocab[word].index] for word in words).astype(REAL)
+        vectors = vstack(self.syn0norm[self.word2index[word]] for word in words).astype(REAL)
         mean = matutils.unitvec(vectors.mean(axis=0)).astype(REAL)
         dists = dot(vectors, mean)
         return sorted(zip(dists, words))[0][1]
@@ -498,11 +789,11 @@ class Word2Vec(utils.SaveLoad):
           array([ -1.40128313e-02, ...]
 
         """
-        return self.syn0[self.vocab[word].index]
+        return self.syn0[self.word2index[word]]
 
 
     def __contains__(self, word):
-        return word in self.vocab
+        return word in self.word2index
 
 
     def similarity(self, w1, w2):
@@ -540,10 +831,29 @@ class Word2Vec(utils.SaveLoad):
                 self.syn0norm = self.syn0
                 if hasattr(self, 'syn1'):
                     del self.syn1
+                if hasattr(self, 'syn1neg'):
+                    del self.syn1neg
             else:
                 self.syn0norm = (self.syn0 / sqrt((self.syn0 ** 2).sum(-1))[..., newaxis]).astype(REAL)
 
 
+    def init_ann_index(self, num_clusters=None, nprobe=None, **kwargs):
+        """
+        Build an approximate nearest neighbour index over the normalized word vectors,
+        used by `most_similar(..., approx=True)`. See `gensim.similarities.ivf.InvertedFileIndex`
+        for the parameters.
+
+        The index must be rebuilt if the model is trained further. It is stored along
+        with the model by `save()`; to mmap it instead, store it separately with
+        `model.ann_index.save(fname)` and restore with
+        `model.ann_index = InvertedFileIndex.load(fname, mmap='r')`.
+
+        """
+        from gensim.similarities.ivf import InvertedFileIndex
+        self.init_sims()
+        self.ann_index = InvertedFileIndex(self.syn0norm, num_clusters=num_clusters, nprobe=nprobe, **kwargs)
+
+
     def accuracy(self, questions, restrict_vocab=30000):
         """
         Compute accuracy of the model. `questions` is a filename where lines are
@@ -559,9 +869,8 @@ class Word2Vec(utils.SaveLoad):
         This method corresponds to the `compute-accuracy` script of the original C word2vec.
 
         """
-        ok_vocab = dict(sorted(iteritems(self.vocab),
-                               key=lambda item: -item[1].count)[:restrict_vocab])
-        ok_index = set(v.index for v in itervalues(ok_vocab))
+        ok_index = set(argsort(-self.vocab_counts, kind='mergesort')[:restrict_vocab].tolist())
+        ok_vocab = dict((self.index2word[index], index) for index in ok_index)
 
         def log_accuracy(section):
             correct, incorrect = section['correct'], section['incorrect']
@@ -590,7 +899,7 @@ class Word2Vec(utils.SaveLoad):
                     logger.debug("skipping line #%i with OOV words: %s" % (line_no, line))
                     continue
 
-                ignore = set(self.vocab[v].index for v in [a, b, c])  # indexes of words to ignore
+                ignore = set(ok_vocab[v] for v in [a, b, c])  # indexes of words to ignore
                 predicted = None
                 # find the most likely prediction, ignoring OOV words and input words
                 for index in argsort(self.most_similar(positive=[b, c], negative=[a], topn=False))[::-1]:
@@ -620,6 +929,25 @@ class Word2Vec(utils.SaveLoad):
         super(Word2Vec, self).save(*args, **kwargs)
 
 
+    @classmethod
+    def load(cls, *args, **kwargs):
+        model = super(Word2Vec, cls).load(*args, **kwargs)
+        # models from older versions were always trained with skip-gram & hierarchical softmax
+        for attr, default in [('sg', 1), ('hs', 1), ('negative', 0), ('cbow_mean', 0), ('table', None), ('sample', 0)]:
+            if not hasattr(model, attr):
+                setattr(model, attr, default)
+        if 'vocab' in model.__dict__:
+            # older versions stored a dict of Vocab objects => convert to arrays
+            vocab = model.__dict__.pop('vocab')
+            vocab = [vocab[word] for word in model.index2word]
+            model.word2index = dict((word, index) for index, word in enumerate(model.index2word))
+            model.vocab_counts = array([v.count or 0 for v in vocab], dtype=int64)
+            model.vocab_sample_probabilities = array([getattr(v, 'sample_probability', 1.0) for v in vocab])
+            if model.hs and vocab and hasattr(vocab[0], 'code'):
+                model.pack_tree([v.code for v in vocab], [v.point for v in vocab])
+        return model
+
+
 class BrownCorpus(object):
     """Iterate over sentences from the Brown corpus (part of NLTK data)."""
     def __init__(self, dirname):
@@ -30,6 +30,8 @@ ctypedef void (*fast_sentence_ptr) (
     const np.uint32_t *word_point, const np.uint8_t *word_code, const int codelen,
     REAL_t *syn0, REAL_t *syn1, const int size,
     const np.uint32_t word2_index, const REAL_t alpha, REAL_t *work) nogil
+ctypedef REAL_t (*our_dot_ptr) (const int *N, const float *X, const int *incX, const float *Y, const int *incY) nogil
+ctypedef void (*our_saxpy_ptr) (const int *N, const float *alpha, const float *X, const int *incX, float *Y, const int *incY) nogil
 
 cdef scopy_ptr scopy=<scopy_ptr>PyCObject_AsVoidPtr(fblas.scopy._cpointer)  # y = x
 cdef saxpy_ptr saxpy=<saxpy_ptr>PyCObject_AsVoidPtr(fblas.saxpy._cpointer)  # y += alpha * x
@@ -37,6 +39,8 @@ cdef sdot_ptr sdot=<sdot_ptr>PyCObject_AsVoidPtr(fblas.sdot._cpointer)  # float
 cdef dsdot_ptr dsdot=<dsdot_ptr>PyCObject_AsVoidPtr(fblas.sdot._cpointer)  # double = dot(x, y)
 cdef snrm2_ptr snrm2=<snrm2_ptr>PyCObject_AsVoidPtr(fblas.snrm2._cpointer)  # sqrt(x^2)
 cdef fast_sentence_ptr fast_sentence
+cdef our_dot_ptr our_dot  # dot product and saxpy used by the negative sampling & CBOW kernels, picked by init()
+cdef our_saxpy_ptr our_saxpy
 
 
 DEF EXP_TABLE_SIZE = 1000
@@ -47,6 +51,8 @@ cdef REAL_t[EXP_TABLE_SIZE] EXP_TABLE
 cdef int ONE = 1
 cdef REAL_t ONEF = <REAL_t>1.0
 
+cdef unsigned long long RANDOM_MODULO = 281474976710655ULL  # 2**48 - 1, as in the C word2vec
+
 
 cdef void fast_sentence0(
     const np.uint32_t *word_point, const np.uint8_t *word_code, const int codelen,
@@ -120,57 +126,297 @@ cdef void fast_sentence2(
         syn0[row1 + a] += work[a]
 
 
-DEF MAX_SENTENCE_LEN = 1000
+cdef REAL_t our_dot_double(const int *N, const float *X, const int *incX, const float *Y, const int *incY) nogil:
+    return <REAL_t>dsdot(N, X, incX, Y, incY)
+
+
+cdef REAL_t our_dot_float(const int *N, const float *X, const int *incX, const float *Y, const int *incY) nogil:
+    return <REAL_t>sdot(N, X, incX, Y, incY)
+
+
+cdef REAL_t our_dot_noblas(const int *N, const float *X, const int *incX, const float *Y, const int *incY) nogil:
+    cdef int i
+    cdef REAL_t a = <REAL_t>0.0
+    for i in range(N[0]):
+        a += X[i * incX[0]] * Y[i * incY[0]]
+    return a
+
+
+cdef void our_saxpy_noblas(const int *N, const float *alpha, const float *X, const int *incX, float *Y, const int *incY) nogil:
+    cdef int i
+    for i in range(N[0]):
+        Y[i * incY[0]] += alpha[0] * X[i * incX[0]]
+
+
+cdef inline REAL_t negative_gradient(const REAL_t f, const REAL_t label, const REAL_t alpha) nogil:
+    # outside [-MAX_EXP, MAX_EXP], the sigmoid is taken as 0 or 1, like in the C word2vec
+    if f <= -MAX_EXP:
+        return label * alpha
+    if f >= MAX_EXP:
+        return (label - ONEF) * alpha
+    return (label - EXP_TABLE[<int>((f + MAX_EXP) * (EXP_TABLE_SIZE / MAX_EXP / 2))]) * alpha
+
+
+cdef unsigned long long fast_sentence_sg_neg(
+    const int negative, const np.uint32_t *table, const unsigned long long table_len,
+    REAL_t *syn0, REAL_t *syn1neg, const int size, const np.uint32_t word_index,
+    const np.uint32_t word2_index, const REAL_t alpha, REAL_t *work,
+    unsigned long long next_random) nogil:
+
+    cdef long long row1 = word2_index * size, row2
+    cdef REAL_t f, g, label
+    cdef np.uint32_t target_index
+    cdef int d
+
+    memset(work, 0, size * cython.sizeof(REAL_t))
+    for d in range(negative + 1):
+        if d == 0:
+            target_index = word_index
+            label = ONEF
+        else:
+            target_index = table[(next_random >> 16) % table_len]
+            next_random = (next_random * <unsigned long long>25214903917ULL + 11) & RANDOM_MODULO
+            if target_index == word_index:
+                continue
+            label = <REAL_t>0.0
+        row2 = target_index * size
+        f = our_dot(&size, &syn0[row1], &ONE, &syn1neg[row2], &ONE)
+        g = negative_gradient(f, label, alpha)
+        our_saxpy(&size, &g, &syn1neg[row2], &ONE, work, &ONE)
+        our_saxpy(&size, &g, &syn0[row1], &ONE, &syn1neg[row2], &ONE)
+    our_saxpy(&size, &ONEF, work, &ONE, &syn0[row1], &ONE)
+    return next_random
+
+
+cdef unsigned long long fast_sentence_cbow(
+    const int hs, const np.uint32_t *word_point, const np.uint8_t *word_code, const int codelen,
+    const int negative, const np.uint32_t *table, const unsigned long long table_len,
+    REAL_t *neu1, REAL_t *syn0, REAL_t *syn1, REAL_t *syn1neg, const int size,
+    const np.int32_t *indexes, const REAL_t alpha, REAL_t *work,
+    const int i, const int j, const int k, const int cbow_mean,
+    unsigned long long next_random) nogil:
+
+    cdef long long a, b, row2
+    cdef REAL_t f, g, label, count = <REAL_t>0.0
+    cdef np.uint32_t word_index = <np.uint32_t>indexes[i], target_index
+    cdef int m, d
+
+    # the hidden layer = sum (or mean) of the context word vectors
+    memset(neu1, 0, size * cython.sizeof(REAL_t))
+    for m in range(j, k):
+        if m == i or indexes[m] < 0:
+            continue
+        count += ONEF
+        our_saxpy(&size, &ONEF, &syn0[<long long>indexes[m] * size], &ONE, neu1, &ONE)
+    if count == 0:
+        return next_random
+    if cbow_mean:
+        for a in range(size):
+            neu1[a] /= count
+
+    memset(work, 0, size * cython.sizeof(REAL_t))
+    if hs:
+        for b in range(codelen):
+            row2 = word_point[b] * size
+            f = our_dot(&size, neu1, &ONE, &syn1[row2], &ONE)
+            if f <= -MAX_EXP or f >= MAX_EXP:
+                continue
+            f = EXP_TABLE[<int>((f + MAX_EXP) * (EXP_TABLE_SIZE / MAX_EXP / 2))]
+            g = (1 - word_code[b] - f) * alpha
+            our_saxpy(&size, &g, &syn1[row2], &ONE, work, &ONE)
+            our_saxpy(&size, &g, neu1, &ONE, &syn1[row2], &ONE)
+    if negative:
+        for d in range(negative + 1):
+            if d == 0:
+                target_index = word_index
+                label = ONEF
+            else:
+                target_index = table[(next_random >> 16) % table_len]
+                next_random = (next_random * <unsigned long long>25214903917ULL + 11) & RANDOM_MODULO
+                if target_index == word_index:
+                    continue
+                label = <REAL_t>0.0
+            row2 = target_index * size
+            f = our_dot(&size, neu1, &ONE, &syn1neg[row2], &ONE)
+            g = negative_gradient(f, label, alpha)
+            our_saxpy(&size, &g, &syn1neg[row2], &ONE, work, &ONE)
+            our_saxpy(&size, &g, neu1, &ONE, &syn1neg[row2], &ONE)
+
+    # propagate the error back to each of the context words
+    for m in range(j, k):
+        if m == i or indexes[m] < 0:
+            continue
+        our_saxpy(&size, &ONEF, work, &ONE, &syn0[<long long>indexes[m] * size], &ONE)
+    return next_random
+
+
+def train_batch_sg(model, indexes, sentence_ends, alpha, _work):
+    """
+    Train skip-gram on a batch of sentences: `indexes` (int32 array) are the vocabulary
+    indexes of all their words (-1 for OOV words), `sentence_ends` (int32 array) the
+    position after the last word of each sentence. Return the number of words trained on.
+
+    """
+    cdef int hs = model.hs
+    cdef int negative = model.negative
 
-def train_sentence(model, sentence, alpha, _work):
     cdef REAL_t *syn0 = <REAL_t *>(np.PyArray_DATA(model.syn0))
-    cdef REAL_t *syn1 = <REAL_t *>(np.PyArray_DATA(model.syn1))
     cdef REAL_t *work
-    cdef np.uint32_t word2_index
     cdef REAL_t _alpha = alpha
     cdef int size = model.layer1_size
+    cdef int window = model.window
+
+    cdef np.int32_t *c_indexes = <np.int32_t *>np.PyArray_DATA(indexes)
+    cdef np.int32_t *c_ends = <np.int32_t *>np.PyArray_DATA(sentence_ends)
+    cdef np.int32_t *reduced_windows
+    cdef int num_sentences = len(sentence_ends)
+    cdef int sentence, sentence_start, sentence_end
+    cdef np.int32_t word_index
+
+    cdef int i, j, k
+    cdef long result = 0
+
+    # for hierarchical softmax
+    cdef REAL_t *syn1 = NULL
+    cdef np.uint32_t *points = NULL
+    cdef np.uint8_t *codes = NULL
+    cdef np.int64_t *offsets = NULL
+
+    # for negative sampling
+    cdef REAL_t *syn1neg = NULL
+    cdef np.uint32_t *table = NULL
+    cdef unsigned long long table_len = 0
+    cdef unsigned long long next_random = 0
+
+    if hs:
+        syn1 = <REAL_t *>(np.PyArray_DATA(model.syn1))
+        points = <np.uint32_t *>(np.PyArray_DATA(model.vocab_points))
+        codes = <np.uint8_t *>(np.PyArray_DATA(model.vocab_codes))
+        offsets = <np.int64_t *>(np.PyArray_DATA(model.code_offsets))
+    if negative:
+        syn1neg = <REAL_t *>(np.PyArray_DATA(model.syn1neg))
+        table = <np.uint32_t *>(np.PyArray_DATA(model.table))
+        table_len = len(model.table)
+        next_random = (2**24) * np.random.randint(0, 2**24) + np.random.randint(0, 2**24)
+
+    work = <REAL_t *>np.PyArray_DATA(_work)
+    _reduced_windows = np.random.randint(window, size=len(indexes)).astype(np.int32)  # `b` in the original word2vec code
+    reduced_windows = <np.int32_t *>np.PyArray_DATA(_reduced_windows)
+
+    # release GIL & train on the whole batch
+    with nogil:
+        sentence_start = 0
+        for sentence in range(num_sentences):
+            sentence_end = c_ends[sentence]
+            for i in range(sentence_start, sentence_end):
+                word_index = c_indexes[i]
+                if word_index < 0:
+                    continue
+                result += 1
+                j = i - window + reduced_windows[i]
+                if j < sentence_start:
+                    j = sentence_start
+                k = i + window + 1 - reduced_windows[i]
+                if k > sentence_end:
+                    k = sentence_end
+                for j in range(j, k):
+                    if j == i or c_indexes[j] < 0:
+                        continue
+                    if hs:
+                        fast_sentence(&points[offsets[word_index]], &codes[offsets[word_index]],
+                                      <int>(offsets[word_index + 1] - offsets[word_index]),
+                                      syn0, syn1, size, <np.uint32_t>c_indexes[j], _alpha, work)
+                    if negative:
+                        next_random = fast_sentence_sg_neg(negative, table, table_len, syn0, syn1neg, size,
+                                                           <np.uint32_t>word_index, <np.uint32_t>c_indexes[j],
+                                                           _alpha, work, next_random)
+            sentence_start = sentence_end
+
+    return result
 
-    cdef np.uint32_t *points[MAX_SENTENCE_LEN]
-    cdef np.uint8_t *codes[MAX_SENTENCE_LEN]
-    cdef int codelens[MAX_SENTENCE_LEN]
-    cdef np.uint32_t indexes[MAX_SENTENCE_LEN]
-    cdef np.uint32_t reduced_windows[MAX_SENTENCE_LEN]
-    cdef int sentence_len
+
+def train_batch_cbow(model, indexes, sentence_ends, alpha, _work, _neu1):
+    """
+    Train CBOW on a batch of sentences, see `train_batch_sg`. Return the number
+    of words trained on.
+
+    """
+    cdef int hs = model.hs
+    cdef int negative = model.negative
+    cdef int cbow_mean = model.cbow_mean
+
+    cdef REAL_t *syn0 = <REAL_t *>(np.PyArray_DATA(model.syn0))
+    cdef REAL_t *work
+    cdef REAL_t *neu1
+    cdef REAL_t _alpha = alpha
+    cdef int size = model.layer1_size
     cdef int window = model.window
 
+    cdef np.int32_t *c_indexes = <np.int32_t *>np.PyArray_DATA(indexes)
+    cdef np.int32_t *c_ends = <np.int32_t *>np.PyArray_DATA(sentence_ends)
+    cdef np.int32_t *reduced_windows
+    cdef int num_sentences = len(sentence_ends)
+    cdef int sentence, sentence_start, sentence_end
+    cdef np.int32_t word_index
+
     cdef int i, j, k
     cdef long result = 0
 
-    # convert Python structures to primitive types, so we can release the GIL
+    # for hierarchical softmax
+    cdef REAL_t *syn1 = NULL
+    cdef np.uint32_t *points = NULL
+    cdef np.uint8_t *codes = NULL
+    cdef np.int64_t *offsets = NULL
+    cdef np.uint32_t *word_point = NULL
+    cdef np.uint8_t *word_code = NULL
+    cdef int codelen = 0
+
+    # for negative sampling
+    cdef REAL_t *syn1neg = NULL
+    cdef np.uint32_t *table = NULL
+    cdef unsigned long long table_len = 0
+    cdef unsigned long long next_random = 0
+
+    if hs:
+        syn1 = <REAL_t *>(np.PyArray_DATA(model.syn1))
+        points = <np.uint32_t *>(np.PyArray_DATA(model.vocab_points))
+        codes = <np.uint8_t *>(np.PyArray_DATA(model.vocab_codes))
+        offsets = <np.int64_t *>(np.PyArray_DATA(model.code_offsets))
+    if negative:
+        syn1neg = <REAL_t *>(np.PyArray_DATA(model.syn1neg))
+        table = <np.uint32_t *>(np.PyArray_DATA(model.table))
+        table_len = len(model.table)
+        next_random = (2**24) * np.random.randint(0, 2**24) + np.random.randint(0, 2**24)
+
     work = <REAL_t *>np.PyArray_DATA(_work)
-    sentence_len = <int>min(MAX_SENTENCE_LEN, len(sentence))
-    for i in range(sentence_len):
-        word = sentence[i]
-        if word is None:
-            codelens[i] = 0
-        else:
-            indexes[i] = word.index
-            codelens[i] = <int>len(word.code)
-            codes[i] = <np.uint8_t *>np.PyArray_DATA(word.code)
-            points[i] = <np.uint32_t *>np.PyArray_DATA(word.point)
-            reduced_windows[i] = np.random.randint(window)
-            result += 1
-
-    # release GIL & train on the sentence
+    neu1 = <REAL_t *>np.PyArray_DATA(_neu1)
+    _reduced_windows = np.random.randint(window, size=len(indexes)).astype(np.int32)  # `b` in the original word2vec code
+    reduced_windows = <np.int32_t *>np.PyArray_DATA(_reduced_windows)
+
+    # release GIL & train on the whole batch
     with nogil:
-        for i in range(sentence_len):
-            if codelens[i] == 0:
-                continue
-            j = i - window + reduced_windows[i]
-            if j < 0:
-                j = 0
-            k = i + window + 1 - reduced_windows[i]
-            if k > sentence_len:
-                k = sentence_len
-            for j in range(j, k):
-                if j == i or codelens[j] == 0:
+        sentence_start = 0
+        for sentence in range(num_sentences):
+            sentence_end = c_ends[sentence]
+            for i in range(sentence_start, sentence_end):
+                word_index = c_indexes[i]
+                if word_index < 0:
                     continue
-                fast_sentence(points[i], codes[i], codelens[i], syn0, syn1, size, indexes[j], _alpha, work)
+                result += 1
+                j = i - window + reduced_windows[i]
+                if j < sentence_start:
+                    j = sentence_start
+                k = i + window + 1 - reduced_windows[i]
+                if k > sentence_end:
+                    k = sentence_end
+                if hs:
+                    word_point = &points[offsets[word_index]]
+                    word_code = &codes[offsets[word_index]]
+                    codelen = <int>(offsets[word_index + 1] - offsets[word_index])
+                next_random = fast_sentence_cbow(hs, word_point, word_code, codelen, negative, table, table_len,
+                                                 neu1, syn0, syn1, syn1neg, size, c_indexes, _alpha, work,
+                                                 i, j, k, cbow_mean, next_random)
+            sentence_start = sentence_end
 
     return result
 
@@ -181,7 +427,7 @@ def init():
     into table EXP_TABLE.
 
     """
-    global fast_sentence
+    global fast_sentence, our_dot, our_saxpy
     cdef int i
     cdef float *x = [<float>10.0]
     cdef float *y = [<float>0.01]
@@ -200,14 +446,17 @@ def init():
     p_res = <float *>&d_res
     if (abs(d_res - expected) < 0.0001):
         fast_sentence = fast_sentence0
+        our_dot, our_saxpy = our_dot_double, saxpy
         return 0  # double
     elif (abs(p_res[0] - expected) < 0.0001):
         fast_sentence = fast_sentence1
+        our_dot, our_saxpy = our_dot_float, saxpy
         return 1  # float
     else:
         # neither => use cython loops, no BLAS
         # actually, the BLAS is so messed up we'll probably have segfaulted above and never even reach here
         fast_sentence = fast_sentence2
+        our_dot, our_saxpy = our_dot_noblas, our_saxpy_noblas
         return 2
 
 FAST_VERSION = init()  # initialize the module
@@ -32,6 +32,9 @@ Optimizations and cleanup of the code by Lars Buitinck, July 2012.
 """
 
 
+import threading
+
+from gensim import utils
 from gensim._six.moves import xrange
 
 
@@ -318,6 +321,79 @@ class PorterStemmer(object):
 
     def stem_documents(self, docs):
         return map(self.stem_sentence, docs)
+#endclass PorterStemmer
+
+
+class CachedPorterStemmer(PorterStemmer, utils.SaveLoad):
+    """
+    Porter stemmer that remembers the stems of recently seen words, so that
+    frequent words are only run through the stemming algorithm once.
+
+    The cache is bounded to roughly `2 * cache_size` words: when it fills up, it
+    becomes the "old" generation and a new, empty cache is started. Words found
+    in the old generation are moved back into the new one, so frequently used
+    words survive while rare ones are eventually dropped (an approximation of
+    LRU that only needs plain dicts).
+
+    The cache can be stored with `save()` and restored with `load()`, to warm
+    it up for the next run.
+
+    Unlike `PorterStemmer`, one instance can be shared by several threads: only
+    the word->stem dicts are shared, words missing from the cache are stemmed by
+    a separate `PorterStemmer` for each thread.
+
+    >>> stemmer = CachedPorterStemmer()
+    >>> stemmer.stem_documents(["running dogs", "dogs ran"])
+    ['run dog', 'dog ran']
+
+    """
+    def __init__(self, cache_size=100000):
+        super(CachedPorterStemmer, self).__init__()
+        self.cache_size = cache_size
+        self.cache, self.old_cache = {}, {}
+
+    def stem(self, w):
+        """Stem the word w, return the stemmed form."""
+        try:
+            return self.cache[w]
+        except KeyError:
+            pass
+        stemmed = self.old_cache.get(w)
+        if stemmed is None:
+            stemmed = _thread_stemmer().stem(w)
+        if len(self.cache) >= self.cache_size:
+            self.old_cache, self.cache = self.cache, {}
+        self.cache[w] = stemmed
+        return stemmed
+
+    def stem_documents(self, docs):
+        """
+        Stem a batch of documents (strings), returning a list of stemmed strings.
+
+        Each distinct word of the batch is stemmed only once.
+        """
+        docs = [doc.split() for doc in docs]
+        stems = {}
+        for doc in docs:
+            for word in doc:
+                if word not in stems:
+                    stems[word] = self.stem(word)
+        return [" ".join([stems[word] for word in doc]) for doc in docs]
+
+    def clear_cache(self):
+        self.cache, self.old_cache = {}, {}
+#endclass CachedPorterStemmer
+
+
+_local = threading.local()
+
+def _thread_stemmer():
+    """Return the `PorterStemmer` of the current thread (stemming is not reentrant)."""
+    try:
+        return _local.stemmer
+    except AttributeError:
+        _local.stemmer = PorterStemmer()
+        return _local.stemmer
 
 
 if __name__ == '__main__':
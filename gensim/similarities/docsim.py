@@ -52,9 +52,11 @@ already uses the faster, batch queries internally:
 
 
 import logging
-import itertools
 import os
-import heapq
+import hashlib
+import glob
+import struct
+import threading
 
 import numpy
 import scipy.sparse
@@ -68,12 +70,26 @@ logger = logging.getLogger('gensim.similarities.docsim')
 PARALLEL_SHARDS = False
 try:
     import multiprocessing
-    # by default, don't parallelize queries. uncomment the following line if you want that.
+    import multiprocessing.pool
+    # by default, don't parallelize queries. uncomment the following line if you want that,
+    # or set `parallel_shards` of individual Similarity objects.
 #    PARALLEL_SHARDS = multiprocessing.cpu_count() # use #parallel processes = #CPus
 except ImportError:
     pass
 
 
+# shards opened by this process, when it is a query worker process; see `open_shard`
+WORKER_SHARDS = None
+
+# size of the .npy header written by out-of-core `MatrixSimilarity`; fixed, so that
+# the header can be overwritten with the final shape once all documents are written
+NPY_HEADER_SIZE = 128
+
+# `SparseMatrixSimilarity.get_topn` accumulates similarities in a dense array once the
+# posting lists of the query hold more than ACCUMULATOR_RATIO * #documents entries
+ACCUMULATOR_RATIO = 1.0
+
+
 class Shard(utils.SaveLoad):
     """
     A proxy class that represents a single shard instance within a Similarity
@@ -82,11 +98,21 @@ class Shard(utils.SaveLoad):
     Basically just wraps (Sparse)MatrixSimilarity so that it mmaps from disk on
     request (query).
 
+    The shard also keeps the external ids of its documents (`ids`) and a tombstone
+    bitmap of the deleted ones (`deleted`, None if there are none). Deleted documents
+    stay in the index matrix until the shard is rewritten by `Similarity.compact()`.
+
+    Summary vectors of the shard's documents (see `init_summary`) are kept in memory,
+    so that `Similarity` can skip shards without opening them.
+
     """
-    def __init__(self, fname, index):
+    def __init__(self, fname, index, ids=None):
         self.dirname, self.fname = os.path.split(fname)
         self.length = len(index)
         self.cls = index.__class__
+        self.ids = numpy.arange(self.length, dtype=numpy.int64) if ids is None else numpy.asarray(ids, dtype=numpy.int64)
+        self.deleted, self.num_deleted = None, 0
+        self.init_summary(index)
         logger.info("saving index shard to %s" % self.fullname())
         index.save(self.fullname())
         self.index = self.get_index()
@@ -105,7 +131,79 @@ class Shard(utils.SaveLoad):
         return result
 
     def __str__(self):
-        return ("%s Shard(%i documents in %s)" % (self.cls.__name__, len(self), self.fullname()))
+        return ("%s Shard(%i documents, %i deleted, in %s)" %
+                (self.cls.__name__, len(self), self.num_deleted, self.fullname()))
+
+
+    def init_summary(self, index, blocksize=8192):
+        """
+        Compute the summary vectors of the documents in `index`: their centroid
+        (`centroid`) and the greatest and smallest weight of each feature over all
+        documents (`max_weights`, `min_weights`).
+
+        The similarity of any document to a query `q` is at most
+        `sum(q_i * max_weights_i for positive q_i) + sum(q_i * min_weights_i for negative q_i)`.
+        For quantized dense indexes, the bounds cover both the quantized and the
+        full-precision vectors.
+
+        The summary vectors of sparse indexes are sparse, too (1 x #features CSR
+        matrices); those of dense indexes are dense arrays.
+        """
+        if isinstance(index, SparseMatrixSimilarity):
+            matrix = index.index
+            self.max_weights = scipy.sparse.csr_matrix(matrix.max(axis=0), dtype=numpy.float32)
+            self.min_weights = scipy.sparse.csr_matrix(matrix.min(axis=0), dtype=numpy.float32)
+            # sum the rows by a sparse product, so that no dense vector is ever created
+            ones = scipy.sparse.csr_matrix(numpy.ones((1, matrix.shape[0]), dtype=numpy.float32))
+            self.centroid = (ones * matrix / float(len(index))).astype(numpy.float32)
+            return
+        matrices = [index.index]
+        full = index.get_full_index()
+        if full is not None and full is not index.index:
+            matrices.append(full)
+        self.max_weights = self.min_weights = None
+        for matrix in matrices:
+            for start in xrange(0, len(matrix), blocksize):
+                block = numpy.asarray(matrix[start : start + blocksize], dtype=numpy.float32)
+                if self.max_weights is None:
+                    self.max_weights, self.min_weights = block.max(axis=0), block.min(axis=0)
+                    self.centroid = numpy.zeros(block.shape[1], dtype=numpy.float32)
+                else:
+                    numpy.maximum(self.max_weights, block.max(axis=0), out=self.max_weights)
+                    numpy.minimum(self.min_weights, block.min(axis=0), out=self.min_weights)
+                if matrix is index.index:
+                    self.centroid += block.sum(axis=0)
+        self.centroid /= len(index)
+
+
+    def worker_copy(self, expired=()):
+        """
+        Return a copy of this shard without its index, ids, tombstones and summary
+        vectors, cheap to send to a query worker process.
+
+        `expired` are the filenames of shards removed from the index, which the
+        worker process must no longer keep open (see `open_shard`).
+        """
+        result = Shard.__new__(Shard)
+        result.__dict__ = dict((attr, val) for attr, val in self.__dict__.items()
+                               if attr not in ('index', 'ids', 'deleted', 'max_weights', 'min_weights', 'centroid'))
+        result.expired = expired
+        return result
+
+
+    def live(self):
+        """Return the positions of documents that are not deleted, as an array."""
+        if self.deleted is None:
+            return numpy.arange(len(self))
+        return numpy.flatnonzero(~self.deleted)
+
+
+    def delete(self, positions):
+        """Mark the documents at `positions` within this shard as deleted."""
+        # copy on write, so that queries running concurrently see a consistent bitmap
+        deleted = numpy.zeros(len(self), dtype=bool) if self.deleted is None else self.deleted.copy()
+        deleted[positions] = True
+        self.deleted, self.num_deleted = deleted, int(deleted.sum())
 
 
     def get_index(self):
@@ -135,14 +233,98 @@ class Shard(utils.SaveLoad):
         return index[query]
 
 
+def init_query_worker():
+    """Initialize a query worker process, so that it keeps its shards open between queries."""
+    global WORKER_SHARDS
+    WORKER_SHARDS = {}
+
+
+def open_shard(shard):
+    """
+    Return the shard, with its index loaded.
+
+    Shards are sent to query worker processes without their (mmap'ed) index, see
+    `Shard.__getstate__`. Instead of loading the index again for each query, each
+    worker process keeps the shards it opened, until the shard file changes or the
+    shard is removed from the index.
+    """
+    if WORKER_SHARDS is None:
+        return shard # not a worker process: the shard object itself keeps its index open
+    expired = getattr(shard, 'expired', ())
+    for fname in expired:
+        WORKER_SHARDS.pop(fname, None)
+    fname = shard.fullname()
+    if fname in expired:
+        return shard # a query still running on a removed shard: don't keep it open any longer
+
+    key = (len(shard), os.path.getmtime(fname))
+    cached = WORKER_SHARDS.get(fname)
+    if cached is None or cached[0] != key:
+        logger.debug("opening shard %s in process %s" % (shard, os.getpid()))
+        shard.get_index()
+        WORKER_SHARDS[fname] = cached = (key, shard)
+    result = cached[1]
+    result.num_best, result.normalize = shard.num_best, shard.normalize
+    return result
+
+
 def query_shard(args):
     query, shard = args # simulate starmap (not part of multiprocessing in older Pythons)
+    shard = open_shard(shard)
     logger.debug("querying shard %s num_best=%s in process %s" % (shard, shard.num_best, os.getpid()))
     result = shard[query]
     logger.debug("finished querying shard %s in process %s" % (shard, os.getpid()))
     return result
 
 
+def query_shard_topn(args):
+    """
+    Query a shard for the `topn` most similar documents of each query, without
+    converting the result to Python tuples.
+
+    Return a `(positions, sims)` 2-tuple of arrays, as in `topn_rows`.
+    """
+    query, shard, topn = args
+    shard.num_best = None # get the full similarity arrays, top-n is selected below
+    return topn_rows(numpy.atleast_2d(query_shard((query, shard))), topn)
+
+
+def topn_rows(sims, topn, eps=1e-9):
+    """
+    Select the `topn` greatest values in each row of the 2d array `sims`, in
+    linear time.
+
+    Return a `(positions, sims)` 2-tuple of arrays of shape `#rows x min(topn, #columns)`,
+    where `positions` are column numbers within `sims`. The returned values are
+    not sorted (use `merge_topn` for that). Values smaller than `eps` in absolute
+    value are ignored (like in `matutils.full2sparse_clipped`); their place is
+    taken by -inf. Of equal values, those in later columns are preferred.
+    """
+    sims = numpy.where(abs(sims) > eps, sims, -numpy.inf)
+    num_rows, num_cols = sims.shape
+    topn = max(0, min(topn, num_cols))
+    if topn == num_cols or topn == 0:
+        return numpy.tile(numpy.arange(topn), (num_rows, 1)), sims[:, : topn]
+    # the topn-th greatest value of each row; everything greater is selected, and
+    # values equal to it fill up the remaining places, starting from the last column
+    kth = numpy.sort(sims, axis=1)[:, num_cols - topn : num_cols - topn + 1]
+    greater, equal = sims > kth, sims == kth
+    missing = topn - greater.sum(axis=1)
+    equal &= numpy.cumsum(equal[:, ::-1], axis=1)[:, ::-1] <= missing[:, numpy.newaxis]
+    positions = numpy.nonzero(greater | equal)[1].reshape(num_rows, topn)
+    return positions, sims[numpy.arange(num_rows)[:, numpy.newaxis], positions]
+
+
+def merge_topn(positions, sims, topn):
+    """
+    Sort each row of `sims` by decreasing value (ties by decreasing position)
+    and return the `topn` greatest values of each row, along with their `positions`.
+    """
+    order = numpy.lexsort((-positions, -sims), axis=1)[:, : topn]
+    rows = numpy.arange(sims.shape[0])[:, numpy.newaxis]
+    return positions[rows, order], sims[rows, order]
+
+
 
 class Similarity(interfaces.SimilarityABC):
     """
@@ -153,8 +335,14 @@ class Similarity(interfaces.SimilarityABC):
     fits into core memory (see the `(Sparse)MatrixSimilarity` classes in this module).
     The shards themselves are simply stored as files to disk and mmap'ed back as needed.
 
+    Each document has an external id, which stays the same as documents are deleted
+    (`delete_documents`), replaced (`update_documents`) and the shards are compacted
+    (`compact`). By default, documents are numbered in the order they were added, so
+    that ids and positions coincide as long as nothing is deleted.
+
     """
-    def __init__(self, output_prefix, corpus, num_features, num_best=None, chunksize=256, shardsize=32768):
+    def __init__(self, output_prefix, corpus, num_features, num_best=None, chunksize=256, shardsize=32768,
+                 cache_size=0, parallel_shards=None, parallel_type='thread', quantize=None, rerank=0):
         """
         Construct the index from `corpus`. The index can be later extended by calling
         the `add_documents` method. **Note**: documents are split (internally, transparently)
@@ -188,6 +376,32 @@ class Similarity(interfaces.SimilarityABC):
         You can also override `num_best` dynamically, simply by setting e.g.
         `self.num_best = 10` before doing a query.
 
+        Set `cache_size` to remember results of the last `cache_size` queries;
+        repeating one of these queries then returns the remembered result directly,
+        as long as the index has not changed. Queries are recognized by their content
+        (plain lists of sparse vectors, numpy arrays and scipy.sparse matrices are
+        supported). The cache is emptied whenever documents are added, and is
+        not saved with the index.
+
+        Set `parallel_shards` to query up to that many shards in parallel (default:
+        module-level `PARALLEL_SHARDS`, which is off). The shards are queried by a
+        pool of `parallel_type='thread'` threads (numpy and scipy release the GIL
+        during the actual matrix multiplications) or `'process'` processes. The
+        pool is started on the first query and kept for subsequent queries, until
+        `close_pool()` is called, the index is garbage collected, or the `with`
+        block using the index ends. Worker processes keep their shards open between
+        queries.
+
+        `quantize` and `rerank` are passed to the dense (`MatrixSimilarity`) shards,
+        to store them with reduced precision; see `MatrixSimilarity`. With `rerank`,
+        the full-precision vectors of each dense shard are kept in an extra file,
+        `output_prefix.shard_number.full.npy`.
+
+        Queries for the `num_best` most similar documents visit the shards in order
+        of the similarity of their centroid to the query, and skip shards whose upper
+        bound on similarity is below the `num_best`-th best similarity found so far
+        (see `Shard.init_summary`). Skipped shards are not even opened.
+
         """
         if output_prefix is None:
             # undocumented feature: set output_prefix=None to create the server in temp
@@ -202,13 +416,29 @@ class Similarity(interfaces.SimilarityABC):
         self.shardsize = shardsize
         self.shards = []
         self.fresh_docs, self.fresh_nnz = [], 0
+        self.cache_size = cache_size
+        self.clear_cache()
+        if parallel_type not in ('thread', 'process'):
+            raise ValueError("parallel_type must be 'thread' or 'process', not %r" % parallel_type)
+        self.parallel_shards = parallel_shards
+        self.parallel_type = parallel_type
+        self.pool = None
+        self.quantize = quantize
+        self.rerank = rerank
+        self.fresh_ids, self.next_id = [], 0
+        self.id_index = None
+        self.lock = threading.RLock()
+        self.compactor = None
+        self.summaries = None
+        self.next_shardid = 0
+        self.init_snapshots()
 
         if corpus is not None:
             self.add_documents(corpus)
 
 
     def __len__(self):
-        return len(self.fresh_docs) + sum([len(shard) for shard in self.shards])
+        return len(self.fresh_docs) + sum([len(shard) - shard.num_deleted for shard in self.shards])
 
 
     def __str__(self):
@@ -216,18 +446,52 @@ class Similarity(interfaces.SimilarityABC):
                 (len(self), len(self.shards), self.output_prefix))
 
 
-    def add_documents(self, corpus):
+    def add_documents(self, corpus, ids=None):
         """
         Extend the index with new documents.
 
+        `ids` are the external (integer) ids of the documents, one for each document
+        in `corpus`. By default, documents are numbered consecutively, continuing
+        from the greatest id so far. Ids already in the index are rejected with
+        a `ValueError`; use `update_documents` to replace documents.
+
         Internally, documents are buffered and then spilled to disk when there's
         `self.shardsize` of them (or when a query is issued).
         """
+        with self.lock:
+            self._add_documents(corpus, ids)
+
+
+    @staticmethod
+    def match_ids(corpus, ids):
+        """
+        Return `corpus` and `ids` (as a list), after checking that there is exactly
+        one id for each document. A streamed corpus is read into a list first, so
+        that a mismatch is detected before the index is changed.
+        """
+        ids = [int(docid) for docid in ids]
+        if not hasattr(corpus, '__len__'):
+            corpus = list(corpus)
+        num_docs = corpus.shape[0] if scipy.sparse.issparse(corpus) else len(corpus)
+        if num_docs != len(ids):
+            raise ValueError("got %i ids for %i documents" % (len(ids), num_docs))
+        return corpus, ids
+
+
+    def _add_documents(self, corpus, ids):
+        if ids is not None:
+            corpus, ids = self.match_ids(corpus, ids)
+            known = set(self.fresh_ids)
+            if len(set(ids)) < len(ids) or any(docid in known for docid in ids) or self.contains(ids).any():
+                raise ValueError("document ids must be unique and not in the index yet")
+        self.clear_cache()
         min_ratio = 1.0 # 0.5 to only reopen shards that are <50% complete
         if self.shards and len(self.shards[-1]) < min_ratio * self.shardsize:
             # The last shard was incomplete (<; load it back and add the documents there, don't start a new shard
             self.reopen_shard()
-        for doc in corpus:
+        for docno, doc in enumerate(corpus):
+            docid = self.next_id if ids is None else ids[docno]
+            self.next_id = max(self.next_id, docid + 1)
             if isinstance(doc, numpy.ndarray):
                 doclen = len(doc)
             elif scipy.sparse.issparse(doc):
@@ -239,7 +503,9 @@ class Similarity(interfaces.SimilarityABC):
                 else:
                     doc = matutils.unitvec(matutils.sparse2full(doc, self.num_features))
             self.fresh_docs.append(doc)
+            self.fresh_ids.append(docid)
             self.fresh_nnz += doclen
+            self.id_index = None
             if len(self.fresh_docs) >= self.shardsize:
                 self.close_shard()
             if len(self.fresh_docs) % 10000 == 0:
@@ -253,6 +519,96 @@ class Similarity(interfaces.SimilarityABC):
             return "%s.%s" % (self.output_prefix, shardid)
 
 
+    def new_shard_filename(self):
+        """
+        Return the filename for a new shard: `output_prefix.shard_number`, with a
+        shard number never used before, so that queries still running on removed
+        shards (see `compact`) never open a different shard under the same name.
+        """
+        used = set(shard.fullname() for shard in self.shards) | set(self.retired_fnames)
+        shardid = max(getattr(self, 'next_shardid', 0), len(self.shards))
+        while self.shardid2filename(shardid) in used:
+            shardid += 1
+        self.next_shardid = shardid + 1
+        return self.shardid2filename(shardid)
+
+
+    def init_snapshots(self):
+        """
+        Start counting the queries that use each shard (see `acquire_shards`). The
+        counts are not saved.
+        """
+        self.snapshot_lock = threading.Lock()
+        self.shard_users = {} # shard => number of queries using it
+        self.retired = set() # removed shards whose files are waiting for their queries to finish
+        self.retired_fnames = [] # filenames of all shards removed since the index was created or loaded
+
+
+    def acquire_shards(self):
+        """
+        Return a snapshot of the current shards, for a query. The files of shards
+        removed from the index meanwhile are kept until `release_shards()` is called
+        with the snapshot.
+        """
+        with self.snapshot_lock:
+            shards = list(self.shards)
+            for shard in shards:
+                self.shard_users[shard] = self.shard_users.get(shard, 0) + 1
+        return shards
+
+
+    def release_shards(self, shards):
+        """Release a snapshot of `acquire_shards()`, removing the files no longer used."""
+        with self.snapshot_lock:
+            for shard in shards:
+                self.shard_users[shard] -= 1
+                if not self.shard_users[shard]:
+                    del self.shard_users[shard]
+                    if shard in self.retired:
+                        self.retired.remove(shard)
+                        self.remove_files(shard)
+
+
+    def replace_shard(self, shard, new_shard=None):
+        """
+        Replace `shard` by `new_shard` in the index (or just remove it, if `new_shard`
+        is None). The files of the old shard are removed as soon as no query uses them.
+        """
+        with self.snapshot_lock:
+            if new_shard is None:
+                self.shards.remove(shard)
+            else:
+                self.shards[self.shards.index(shard)] = new_shard
+            # query workers must drop the old shard, too (see `open_shard`)
+            self.retired_fnames.append(shard.fullname())
+            if self.shard_users.get(shard):
+                self.retired.add(shard)
+            else:
+                self.remove_files(shard)
+
+
+    @staticmethod
+    def remove_files(shard):
+        """Remove the files of `shard` from disk."""
+        shard.__dict__.pop('index', None) # close the mmap'ed files first
+        for fname in [shard.fullname()] + glob.glob(shard.fullname() + '.*'):
+            logger.debug("removing %s" % fname)
+            os.remove(fname)
+
+
+    def create_index(self, docs, num_nnz, issparse, fname):
+        """
+        Return a new (Sparse)MatrixSimilarity index over `docs` (a list of vectors,
+        as stored in `fresh_docs`), to be stored as shard `fname`.
+        """
+        if issparse:
+            return SparseMatrixSimilarity(docs, num_terms=self.num_features, num_docs=len(docs), num_nnz=num_nnz)
+        rerank = getattr(self, 'rerank', 0)
+        return MatrixSimilarity(docs, num_features=self.num_features,
+                                quantize=getattr(self, 'quantize', None), rerank=rerank,
+                                output_fname=fname + '.full.npy' if rerank else None)
+
+
     def close_shard(self):
         """
         Force the latest shard to close (be converted to a matrix and stored
@@ -264,20 +620,20 @@ class Similarity(interfaces.SimilarityABC):
         """
         if not self.fresh_docs:
             return
-        shardid = len(self.shards)
-        # consider the shard sparse if its density is < 30%
-        issparse = 0.3 > 1.0 * self.fresh_nnz / (len(self.fresh_docs) * self.num_features)
-        if issparse:
-            index = SparseMatrixSimilarity(self.fresh_docs, num_terms=self.num_features,
-                                           num_docs=len(self.fresh_docs), num_nnz=self.fresh_nnz)
-        else:
-            index = MatrixSimilarity(self.fresh_docs, num_features=self.num_features)
-        logger.info("creating %s shard #%s" % ('sparse' if issparse else 'dense', shardid))
-        shard = Shard(self.shardid2filename(shardid), index)
-        shard.num_best = self.num_best
-        shard.num_nnz = self.fresh_nnz
-        self.shards.append(shard)
-        self.fresh_docs, self.fresh_nnz = [], 0
+        with self.lock:
+            if not self.fresh_docs:
+                return # closed by another thread meanwhile
+            shardid = len(self.shards)
+            fname = self.new_shard_filename()
+            # consider the shard sparse if its density is < 30%
+            issparse = 0.3 > 1.0 * self.fresh_nnz / (len(self.fresh_docs) * self.num_features)
+            logger.info("creating %s shard #%s" % ('sparse' if issparse else 'dense', shardid))
+            shard = Shard(fname, self.create_index(self.fresh_docs, self.fresh_nnz, issparse, fname), self.fresh_ids)
+            shard.num_best = self.num_best
+            shard.num_nnz = self.fresh_nnz
+            self.shards.append(shard)
+            self.fresh_docs, self.fresh_ids, self.fresh_nnz = [], [], 0
+            self.id_index = None
 
 
     def reopen_shard(self):
@@ -285,33 +641,197 @@ class Similarity(interfaces.SimilarityABC):
         if self.fresh_docs:
             raise ValueError("cannot reopen a shard with fresh documents in index")
         last_shard = self.shards[-1]
-        last_index = last_shard.get_index()
         logger.info("reopening an incomplete shard of %i documents" % len(last_shard))
 
-        self.fresh_docs = list(last_index.index)
-        self.fresh_nnz = last_shard.num_nnz
-        del self.shards[-1] # remove the shard from index, *but its file on disk is not deleted*
+        live = last_shard.live() # deleted documents are dropped here
+        self.fresh_docs = self.shard_docs(last_shard, live)
+        self.fresh_ids = last_shard.ids[live].tolist()
+        self.fresh_nnz = self.docs_nnz(self.fresh_docs)
+        self.replace_shard(last_shard) # the shard is written again, under a new name, by `close_shard()`
+        self.id_index = None
         logger.debug("reopen complete")
 
 
-    def query_shards(self, query):
+    def shard_docs(self, shard, positions):
+        """
+        Return the vectors at `positions` within `shard`, as a list of documents
+        in the format of `fresh_docs`.
+        """
+        index = shard.get_index()
+        if isinstance(index, MatrixSimilarity) and index.get_full_index() is not None:
+            # start from the full-precision vectors, in memory (their file may be removed)
+            return list(numpy.array(index.get_full_index()[positions]))
+        return list(index.index[positions])
+
+
+    @staticmethod
+    def docs_nnz(docs):
         """
-        Return the result of applying shard[query] for each shard in self.shards,
-        as a sequence.
+        Return the exact number of non-zeroes in `docs` (a list of documents in the
+        format of `fresh_docs`), as needed by `create_index()`.
+        """
+        return sum(doc.nnz if scipy.sparse.issparse(doc) else int(numpy.count_nonzero(doc)) for doc in docs)
+
+
+    def query_shards(self, query, topn=None, shards=None):
+        """
+        Return the result of applying shard[query] for each shard in `shards`
+        (default: self.shards), as a sequence.
+
+        If `topn` is set, return the `(positions, sims)` arrays of the `topn` most
+        similar documents of each shard instead (see `query_shard_topn`).
+
+        Deleted documents are *not* filtered out here; with `topn`, each shard
+        returns `topn` + its number of deleted documents, so that at least `topn`
+        remain after filtering.
 
         If PARALLEL_SHARDS is set, the shards are queried in parallel, using
         the multiprocessing module.
         """
-        args = zip([query] * len(self.shards), self.shards)
-        if PARALLEL_SHARDS and PARALLEL_SHARDS > 1:
-            logger.debug("spawning %i query processes" % PARALLEL_SHARDS)
-            pool = multiprocessing.Pool(PARALLEL_SHARDS)
-            result = pool.imap(query_shard, args, chunksize=1 + len(args) / PARALLEL_SHARDS)
+        if shards is None:
+            shards = self.shards
+        pool = self.get_pool() if len(shards) > 1 else None
+        if pool is not None and getattr(self, 'parallel_type', 'thread') == 'process':
+            expired = tuple(self.retired_fnames)
+            shards = [shard.worker_copy(expired) for shard in shards] # don't send ids and tombstones along
+        if topn is None:
+            worker, args = query_shard, zip([query] * len(shards), shards)
+        else:
+            worker = query_shard_topn
+            args = zip([query] * len(shards), shards, [topn + shard.num_deleted for shard in shards])
+        if pool is not None:
+            # one shard per task, so that results can be merged as soon as they arrive
+            result = pool.imap(worker, args, chunksize=1)
         else:
             # serial processing, one shard after another
-            pool = None
-            result = imap(query_shard, args)
-        return pool, result
+            result = imap(worker, args)
+        return result
+
+
+    def get_pool(self):
+        """
+        Return the pool for querying shards in parallel (starting it, if needed),
+        or None if shards are to be queried serially.
+        """
+        parallel_shards = self.num_workers()
+        if parallel_shards <= 1:
+            return None
+        if getattr(self, 'pool', None) is None:
+            if getattr(self, 'parallel_type', 'thread') == 'thread':
+                logger.info("starting %i query threads" % parallel_shards)
+                self.pool = multiprocessing.pool.ThreadPool(parallel_shards)
+            else:
+                logger.info("spawning %i query processes" % parallel_shards)
+                self.pool = multiprocessing.Pool(parallel_shards, init_query_worker)
+        return self.pool
+
+
+    def num_workers(self):
+        """Return the number of shards to query in parallel (1 = serial queries)."""
+        parallel_shards = getattr(self, 'parallel_shards', None)
+        if parallel_shards is None:
+            parallel_shards = PARALLEL_SHARDS
+        return max(1, int(parallel_shards or 1))
+
+
+    def get_summaries(self, shards):
+        """
+        Return the `(max_weights, min_weights, centroids)` summary vectors of `shards`,
+        as #features x #shards matrices, or None if there are no shards or some of
+        them have no summary (shards from older versions).
+
+        The matrices are sparse (CSC) as soon as one of the shards is sparse.
+        """
+        if not shards:
+            return None
+        key = tuple(shards)
+        summaries = getattr(self, 'summaries', None)
+        if summaries is None or summaries[0] != key:
+            if not all(hasattr(shard, 'max_weights') for shard in shards):
+                return None
+            summaries = [key]
+            for attr in ('max_weights', 'min_weights', 'centroid'):
+                vectors = [getattr(shard, attr) for shard in shards]
+                if any(scipy.sparse.issparse(vector) for vector in vectors):
+                    vectors = [vector if scipy.sparse.issparse(vector) else scipy.sparse.csr_matrix(numpy.atleast_2d(vector))
+                               for vector in vectors]
+                    summaries.append(scipy.sparse.vstack(vectors, format='csr').T)
+                else:
+                    summaries.append(numpy.column_stack(vectors))
+            self.summaries = summaries = tuple(summaries)
+        return summaries[1:]
+
+
+    def query2csr(self, query, is_corpus):
+        """
+        Return `query` (a document or a corpus) as a #queries x #features scipy.sparse
+        matrix, normalized the same way the shards normalize it.
+        """
+        if scipy.sparse.issparse(query):
+            return query.tocsr() # matrices are never normalized, see SimilarityABC
+        if isinstance(query, numpy.ndarray):
+            if query.ndim == 1 and self.normalize:
+                query = matutils.unitvec(query)
+            return scipy.sparse.csr_matrix(numpy.atleast_2d(query))
+        docs = query if is_corpus else [query]
+        if self.normalize:
+            docs = [matutils.unitvec(doc) for doc in docs]
+        return matutils.corpus2csc(docs, self.num_features).T.tocsr()
+
+
+    def shard_bounds(self, query, is_corpus, shards):
+        """
+        Return the upper bounds on similarity of the documents in each of `shards`
+        to each document in `query` (a #queries x #shards array), along with the
+        order in which the shards should be queried (best candidates first).
+
+        Return `None, None` if the bounds cannot be computed.
+        """
+        if not shards:
+            return None, None
+        summaries = self.get_summaries(shards)
+        if summaries is None:
+            return None, None
+        max_weights, min_weights, centroids = summaries
+        query = self.query2csr(query, is_corpus)
+        positive, negative = query.copy(), query.copy()
+        positive.data = numpy.maximum(positive.data, 0)
+        negative.data = numpy.minimum(negative.data, 0)
+        bounds = positive * max_weights + negative * min_weights
+        bounds = bounds.toarray() if scipy.sparse.issparse(bounds) else numpy.asarray(bounds)
+        order = numpy.argsort(-numpy.asarray((query * centroids).sum(axis=0)).ravel(), kind='mergesort')
+        return bounds, order
+
+
+    def close_pool(self):
+        """
+        Stop the threads or processes used for parallel queries, if any. A new
+        pool will be started automatically by the next query.
+        """
+        if getattr(self, 'pool', None) is not None:
+            logger.info("stopping the query pool")
+            self.pool.terminate()
+            self.pool = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.close_pool()
+
+
+    def __del__(self):
+        """
+        Automatic destructor which stops the query pool, so that its threads or
+        processes don't outlive the index.
+
+        There must be no circular references contained in the object for __del__
+        to work! Stopping the pool explicitly via `close_pool()` (or using the
+        index in a `with` block) is preferred and safer.
+        """
+        self.close_pool()
 
 
     def __getitem__(self, query):
@@ -322,76 +842,148 @@ class Similarity(interfaces.SimilarityABC):
         If `query` is a corpus (iterable of documents), return a matrix of similarities
         of all query documents vs. all corpus document. This batch query is more
         efficient than computing the similarities one document after another.
+
+        Full similarity arrays list the documents in the order of `get_ids()`; with
+        `num_best`, the result is a list of `(document id, similarity)` 2-tuples.
         """
         self.close_shard() # no-op if no documents added to index since last query
 
-        # reset num_best and normalize parameters, in case they were changed dynamically
-        for shard in self.shards:
-            shard.num_best = self.num_best
-            shard.normalize = self.normalize
-
-        # there are 4 distinct code paths, depending on whether input `query` is
-        # a corpus (or numpy/scipy matrix) or a single document, and whether the
-        # similarity result should be a full array or only num_best most similar
-        # documents.
-        pool, shard_results = self.query_shards(query)
-        if self.num_best is None:
-            # user asked for all documents => just stack the sub-results into a single matrix
-            # (works for both corpus / single doc query)
-            result = numpy.hstack(shard_results)
-        else:
-            # the following uses a lot of lazy evaluation and (optionally) parallel
-            # processing, to improve query latency and minimize memory footprint.
-            offsets = numpy.cumsum([0] + [len(shard) for shard in self.shards])
-            convert = lambda doc, shard_no: [(doc_index + offsets[shard_no], sim)
-                                             for doc_index, sim in doc]
-            is_corpus, query = utils.is_corpus(query)
-            is_corpus = is_corpus or hasattr(query, 'ndim') and query.ndim > 1 and query.shape[0] > 1
-            if not is_corpus:
-                # user asked for num_best most similar and query is a single doc
-                results = (convert(result, shard_no) for shard_no, result in enumerate(shard_results))
-                result = heapq.nlargest(self.num_best, itertools.chain(*results), key=lambda item: item[1])
+        key = self.cache_key(query)
+        if key is not None and key in self.query_cache:
+            logger.debug("returning cached result")
+            self.query_cache_order.remove(key)
+            self.query_cache_order.append(key)
+            return self.copy_result(self.query_cache[key])
+
+        # a snapshot of the shards and their tombstones, in case they change during the query
+        shards = self.acquire_shards()
+        deleted = [shard.deleted for shard in shards]
+        try:
+
+            # reset num_best and normalize parameters, in case they were changed dynamically
+            for shard in shards:
+                shard.num_best = self.num_best
+                shard.normalize = self.normalize
+
+            # there are 4 distinct code paths, depending on whether input `query` is
+            # a corpus (or numpy/scipy matrix) or a single document, and whether the
+            # similarity result should be a full array or only num_best most similar
+            # documents.
+            if self.num_best is None:
+                # user asked for all documents => just stack the sub-results into a single matrix
+                # (works for both corpus / single doc query)
+                shard_results = self.query_shards(query, shards=shards)
+                result = numpy.hstack([sims if tombstones is None else sims[..., ~tombstones]
+                                       for sims, tombstones in izip(shard_results, deleted)])
             else:
-                # the trickiest combination: returning num_best results when query was a corpus
-                results = []
-                for shard_no, result in enumerate(shard_results):
-                    shard_result = [convert(doc, shard_no) for doc in result]
-                    results.append(shard_result)
+                is_corpus, query = utils.is_corpus(query)
+                is_corpus = is_corpus or hasattr(query, 'ndim') and query.ndim > 1 and query.shape[0] > 1
+                if is_corpus and not (isinstance(query, (list, numpy.ndarray)) or scipy.sparse.issparse(query)):
+                    query = list(query) # the query is sent to every shard; don't let the first shard exhaust it
+                # each shard selects its own num_best candidates, as numpy arrays; these are
+                # merged with the best candidates so far as soon as they arrive, so that only
+                # #queries x num_best candidates are ever kept in memory.
+                # shards are queried in waves (one shard at a time, unless querying in parallel),
+                # skipping shards that cannot beat the num_best-th best candidates so far.
+                bounds, order = self.shard_bounds(query, is_corpus, shards)
+                pending = list(xrange(len(shards)) if order is None else order)
+                ids, sims = [], []
+                while pending:
+                    wave = []
+                    while pending and len(wave) < self.num_workers():
+                        shardno = pending.pop(0)
+                        if bounds is not None and len(sims) and 0 < self.num_best == sims.shape[1]:
+                            # leave some slack for the rounding errors of float32 similarities
+                            bound = bounds[:, shardno]
+                            if (bound + 1e-5 * (1.0 + abs(bound)) < sims[:, -1]).all():
+                                logger.debug("skipping shard %s" % shards[shardno])
+                                continue
+                        wave.append(shardno)
+                    if not wave:
+                        break
+                    shard_results = self.query_shards(query, topn=self.num_best, shards=[shards[i] for i in wave])
+                    for shardno, (shard_positions, shard_sims) in izip(wave, shard_results):
+                        if deleted[shardno] is not None:
+                            shard_sims = numpy.where(deleted[shardno][shard_positions], -numpy.inf, shard_sims)
+                        shard_ids = shards[shardno].ids[shard_positions]
+                        if len(sims):
+                            shard_ids = numpy.hstack((ids, shard_ids))
+                            shard_sims = numpy.hstack((sims, shard_sims))
+                        ids, sims = merge_topn(shard_ids, shard_sims, self.num_best)
                 result = []
-                for parts in izip(*results):
-                    merged = heapq.nlargest(self.num_best, itertools.chain(*parts), key=lambda item: item[1])
-                    result.append(merged)
-        if pool:
-            # gc doesn't seem to collect the Pools, eventually leading to
-            # "IOError 24: too many open files". so let's terminate it manually.
-            pool.terminate()
-
+                for doc_ids, doc_sims in izip(ids, sims):
+                    found = numpy.isfinite(doc_sims) # skip near-zero similarities and deleted documents
+                    result.append(list(izip(doc_ids[found].tolist(), doc_sims[found].tolist())))
+                if not is_corpus:
+                    # user asked for num_best most similar and query is a single doc
+                    result = result[0] if result else []
+        finally:
+            self.release_shards(shards)
+        if key is not None:
+            self.query_cache[key] = self.copy_result(result)
+            self.query_cache_order.append(key)
+            while len(self.query_cache_order) > self.cache_size:
+                del self.query_cache[self.query_cache_order.pop(0)] # evict the least recently used
         return result
 
 
-    def vector_by_id(self, docpos):
+    def cache_key(self, query):
+        """
+        Return a hashable key that identifies the query (together with the
+        current `num_best` and `normalize` settings), or None if the query cannot
+        be cached (caching is off or the query is a stream).
+        """
+        if not getattr(self, 'cache_size', 0):
+            return None
+        if isinstance(query, numpy.ndarray):
+            arrays = [query]
+        elif scipy.sparse.issparse(query):
+            query = query.tocsr()
+            arrays = [query.data, query.indices, query.indptr]
+        elif isinstance(query, (list, tuple)):
+            # sparse vector = list of 2-tuples, or a corpus = list of sparse vectors
+            try:
+                content = tuple(tuple(item) for item in query)
+                hash(content)
+            except TypeError:
+                return None
+            return (self.num_best, self.normalize, 'bow', content)
+        else:
+            return None
+        digest = hashlib.sha1()
+        for array in arrays:
+            digest.update(numpy.ascontiguousarray(array).view(numpy.uint8))
+        return (self.num_best, self.normalize, type(query).__name__, query.shape, query.dtype.str, digest.hexdigest())
+
+
+    @staticmethod
+    def copy_result(result):
+        # results are handed out to the caller; keep the cached copy safe from modification
+        if isinstance(result, numpy.ndarray):
+            return result.copy()
+        return [list(item) if isinstance(item, list) else item for item in result]
+
+
+    def clear_cache(self):
+        """Forget all cached query results."""
+        self.query_cache, self.query_cache_order = {}, []
+
+
+    def vector_by_id(self, docid):
         """
-        Return indexed vector corresponding to the document at position `docpos`.
+        Return indexed vector corresponding to the document with id `docid`.
         """
         self.close_shard() # no-op if no documents added to index since last query
-        pos = 0
-        for shard in self.shards:
-            pos += len(shard)
-            if docpos < pos:
-                break
-        if not self.shards or docpos < 0 or docpos >= pos:
-            raise ValueError("invalid document position: %s (must be 0 <= x < %s)" %
-                             (docpos, len(self)))
-        result = shard.get_document_id(docpos - pos + len(shard))
-        return result
+        shardnos, positions = self.locate([docid])
+        return self.shards[shardnos[0]].get_document_id(positions[0])
 
 
-    def similarity_by_id(self, docpos):
+    def similarity_by_id(self, docid):
         """
-        Return similarity of the given document only. `docpos` is the position
-        of the query document within index.
+        Return similarity of the given document only. `docid` is the id of the
+        query document within index.
         """
-        query = self.vector_by_id(docpos)
+        query = self.vector_by_id(docid)
         norm, self.normalize = self.normalize, False
         result = self[query]
         self.normalize = norm
@@ -430,15 +1022,158 @@ class Similarity(interfaces.SimilarityABC):
             # if not explicitly specified, use the chunksize from the constructor
             chunksize = self.chunksize
 
-        for shard in self.shards:
-            query = shard.get_index().index
-            for chunk_start in xrange(0, query.shape[0], chunksize):
-                # scipy.sparse doesn't allow slicing beyond real size of the matrix
-                # (unlike numpy). so, clip the end of the chunk explicitly to make
-                # scipy.sparse happy
-                chunk_end = min(query.shape[0], chunk_start + chunksize)
-                chunk = query[chunk_start: chunk_end] # create a view
-                yield chunk
+        shards = self.acquire_shards()
+        try:
+            for shard in shards:
+                query = shard.get_index().index
+                live = None if shard.deleted is None else shard.live()
+                num_docs = query.shape[0] if live is None else len(live)
+                for chunk_start in xrange(0, num_docs, chunksize):
+                    # scipy.sparse doesn't allow slicing beyond real size of the matrix
+                    # (unlike numpy). so, clip the end of the chunk explicitly to make
+                    # scipy.sparse happy
+                    chunk_end = min(num_docs, chunk_start + chunksize)
+                    if live is None:
+                        chunk = query[chunk_start: chunk_end] # create a view
+                    else:
+                        chunk = query[live[chunk_start: chunk_end]] # skip deleted documents
+                    yield chunk
+        finally:
+            self.release_shards(shards)
+
+
+    def get_ids(self):
+        """
+        Return the ids of all documents in the index, as an array, in the order
+        of the full similarity arrays returned by queries.
+        """
+        self.close_shard()
+        ids = [shard.ids[shard.live()] for shard in list(self.shards)]
+        return numpy.hstack(ids) if ids else numpy.zeros(0, dtype=numpy.int64)
+
+
+    def get_id_index(self):
+        """
+        Return the `(ids, shardnos, positions)` arrays of all documents in closed
+        shards, sorted by id. The arrays are rebuilt lazily after each change.
+        """
+        with self.lock:
+            if self.id_index is None:
+                ids, shardnos, positions = [], [], []
+                for shardno, shard in enumerate(self.shards):
+                    live = shard.live()
+                    ids.append(shard.ids[live])
+                    shardnos.append(numpy.repeat(shardno, len(live)))
+                    positions.append(live)
+                if ids:
+                    ids, shardnos, positions = numpy.hstack(ids), numpy.hstack(shardnos), numpy.hstack(positions)
+                else:
+                    ids, shardnos, positions = [numpy.zeros(0, dtype=numpy.int64)] * 3
+                order = numpy.argsort(ids, kind='mergesort')
+                self.id_index = ids[order], shardnos[order], positions[order]
+            return self.id_index
+
+
+    def contains(self, ids):
+        """Return a boolean array: which of `ids` belong to documents in closed shards."""
+        sorted_ids = self.get_id_index()[0]
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        found = numpy.searchsorted(sorted_ids, ids)
+        found[found == len(sorted_ids)] = 0
+        return sorted_ids[found] == ids if len(sorted_ids) else numpy.zeros(len(ids), dtype=bool)
+
+
+    def locate(self, ids):
+        """
+        Return the `(shardnos, positions)` arrays of the documents with the given `ids`.
+
+        Raise `ValueError` if any of the ids is not in the (closed shards of the) index.
+        """
+        with self.lock:
+            sorted_ids, shardnos, positions = self.get_id_index()
+            ids = numpy.asarray(ids, dtype=numpy.int64)
+            missing = ~self.contains(ids)
+            if missing.any():
+                raise ValueError("unknown document ids: %s" % ids[missing][:10].tolist())
+            found = numpy.searchsorted(sorted_ids, ids)
+            return shardnos[found], positions[found]
+
+
+    def delete_documents(self, ids):
+        """
+        Remove the documents with the given `ids` from the index.
+
+        The documents are only marked as deleted (tombstoned) in their shards; they
+        disappear from all query results immediately, but the space they take is
+        only reclaimed by `compact()`. Unknown ids raise `ValueError`, in which case
+        no document is deleted.
+        """
+        with self.lock:
+            self.close_shard()
+            self.clear_cache()
+            shardnos, positions = self.locate(list(ids))
+            for shardno in numpy.unique(shardnos):
+                self.shards[shardno].delete(positions[shardnos == shardno])
+            self.id_index = None
+            logger.info("deleted %i documents, %i documents remain" % (len(positions), len(self)))
+
+
+    def update_documents(self, corpus, ids):
+        """
+        Replace the documents with the given `ids` by the (new versions of) documents
+        in `corpus`, keeping their ids.
+
+        The ids must be unique and all in the index, otherwise `ValueError` is raised
+        and the index is left unchanged.
+        """
+        corpus, ids = self.match_ids(corpus, ids) # before deleting anything
+        if len(set(ids)) < len(ids):
+            raise ValueError("document ids must be unique")
+        with self.lock:
+            # `delete_documents` checks that all ids exist before deleting any of them
+            self.delete_documents(ids)
+            self.add_documents(corpus, ids=ids)
+
+
+    def compact(self, max_deleted=0.2, background=False):
+        """
+        Rewrite shards where more than `max_deleted` (a fraction) of the documents
+        are deleted, reclaiming their space. Shards with no documents left are removed.
+
+        Document ids, and therefore query results, stay the same. Shards are rewritten
+        one at a time; queries can run meanwhile, while adding and deleting documents
+        waits for the shard being rewritten.
+
+        If `background` is set, the compaction runs in a separate thread, which is
+        returned; otherwise return None.
+        """
+        if background:
+            self.compactor = threading.Thread(target=self.compact, kwargs={'max_deleted': max_deleted})
+            self.compactor.daemon = True
+            self.compactor.start()
+            return self.compactor
+        self.close_shard()
+        for shard in list(self.shards):
+            if shard.num_deleted <= max_deleted * len(shard):
+                continue
+            with self.lock:
+                if shard not in self.shards:
+                    continue
+                live = shard.live()
+                logger.info("compacting %s to %i documents" % (shard, len(live)))
+                if len(live):
+                    fname = self.new_shard_filename()
+                    docs = self.shard_docs(shard, live)
+                    num_nnz = self.docs_nnz(docs)
+                    issparse = issubclass(shard.cls, SparseMatrixSimilarity)
+                    new_shard = Shard(fname, self.create_index(docs, num_nnz, issparse, fname), shard.ids[live])
+                    new_shard.num_best, new_shard.normalize = self.num_best, self.normalize
+                    new_shard.num_nnz = num_nnz
+                else:
+                    new_shard = None
+                # queries still running on the old shard keep its files; new ones don't see it
+                self.replace_shard(shard, new_shard)
+                self.id_index = None
 
 
     def check_moved(self):
@@ -455,17 +1190,162 @@ class Similarity(interfaces.SimilarityABC):
         Save the object via pickling (also see load) under filename specified in
         the constructor.
 
-        Calls `close_shard` internally to spill any unfinished shards to disk first.
+        Calls `close_shard` internally to spill any unfinished shards to disk first,
+        and waits for a background `compact()` to finish. Cached query results and
+        the query pool are not saved.
 
         """
+        if getattr(self, 'compactor', None) is not None:
+            self.compactor.join()
+            self.compactor = None
         self.close_shard()
+        self.clear_cache()
         if fname is None:
             fname = self.output_prefix
+        kwargs['ignore'] = frozenset(kwargs.get('ignore', [])) | frozenset(['pool', 'lock', 'id_index', 'compactor', 'summaries',
+                                                                        'snapshot_lock', 'shard_users', 'retired', 'retired_fnames'])
         super(Similarity, self).save(fname, *args, **kwargs)
+
+
+    @classmethod
+    def load(cls, fname, mmap=None):
+        """
+        Load a previously saved index (also see `save`). Indexes saved before
+        documents had ids get sequential ids.
+        """
+        result = super(Similarity, cls).load(fname, mmap=mmap)
+        result.lock = threading.RLock()
+        result.init_snapshots()
+        result.id_index = None # rebuilt on demand (also missing from indexes saved by older versions)
+        if not hasattr(result, 'fresh_ids'):
+            offset = 0
+            for shard in result.shards:
+                shard.ids = numpy.arange(offset, offset + len(shard), dtype=numpy.int64)
+                shard.deleted, shard.num_deleted = None, 0
+                offset += len(shard)
+            result.fresh_ids = list(xrange(offset, offset + len(result.fresh_docs)))
+            result.next_id = offset + len(result.fresh_docs)
+        return result
 #endclass Similarity
 
 
 
+class QuantizedMatrix(utils.SaveLoad):
+    """
+    Dense matrix of document vectors (rows), stored with reduced precision to save
+    memory:
+
+    * `quantize='float16'`: half-precision floats (2x smaller than float32),
+    * `quantize='int8'`: 8-bit integers, with one float32 scale per row (4x smaller),
+    * `quantize='int8_column'`: 8-bit integers, with one float32 scale per column.
+
+    Supports the part of the numpy array interface used by the similarity classes:
+    `shape`, `dtype`, `len()`, iteration, indexing and slicing (which return
+    float32 rows, dequantized) and `dot()`.
+
+    """
+    def __init__(self, matrix, quantize='int8', blocksize=8192):
+        """
+        Quantize the 2d array `matrix` (which may also be a memory-mapped file),
+        `blocksize` rows at a time. Matrix products are computed in blocks of
+        `blocksize` rows too, dequantized on the fly.
+
+        """
+        if quantize not in ('float16', 'int8', 'int8_column'):
+            raise ValueError("quantize must be 'float16', 'int8' or 'int8_column', not %r" % quantize)
+        self.quantize = quantize
+        self.blocksize = blocksize
+        num_rows, num_cols = matrix.shape
+        blocks = [(start, min(num_rows, start + blocksize)) for start in xrange(0, num_rows, blocksize)]
+        self.scales = None
+        if quantize == 'float16':
+            self.data = numpy.empty((num_rows, num_cols), dtype=numpy.float16)
+        else:
+            self.data = numpy.empty((num_rows, num_cols), dtype=numpy.int8)
+            if quantize == 'int8':
+                self.scales = numpy.empty(num_rows, dtype=numpy.float32)
+            else:
+                # the largest absolute value of each column must be known before quantizing any row
+                maxabs = numpy.zeros(num_cols, dtype=numpy.float32)
+                for start, end in blocks:
+                    maxabs = numpy.maximum(maxabs, abs(numpy.asarray(matrix[start : end])).max(axis=0))
+                self.scales = numpy.where(maxabs > 0, maxabs / 127.0, 1.0).astype(numpy.float32)
+        for start, end in blocks:
+            block = numpy.array(matrix[start : end], dtype=numpy.float32)
+            if quantize == 'float16':
+                self.data[start : end] = block
+                continue
+            if quantize == 'int8':
+                maxabs = abs(block).max(axis=1) if num_cols else numpy.zeros(len(block), dtype=numpy.float32)
+                self.scales[start : end] = numpy.where(maxabs > 0, maxabs / 127.0, 1.0)
+                block /= self.scales[start : end, numpy.newaxis]
+            else:
+                block /= self.scales
+            self.data[start : end] = numpy.rint(block)
+        logger.info("quantized %i x %i matrix to %s (%i bytes)" % (num_rows, num_cols, quantize, self.nbytes))
+
+
+    def __str__(self):
+        return "QuantizedMatrix(%i x %i, %s)" % (self.shape[0], self.shape[1], self.quantize)
+
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+
+    @property
+    def dtype(self):
+        return numpy.dtype(numpy.float32) # the dtype of dequantized rows
+
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+
+    def __len__(self):
+        return self.data.shape[0]
+
+
+    def __getitem__(self, rows):
+        """Return the given row(s), dequantized to float32."""
+        result = numpy.asarray(self.data[rows], dtype=numpy.float32)
+        if self.quantize == 'int8':
+            result *= numpy.asarray(self.scales[rows])[..., numpy.newaxis]
+        elif self.quantize == 'int8_column':
+            result *= self.scales
+        return result
+
+
+    def __iter__(self):
+        for start in xrange(0, len(self), self.blocksize):
+            for row in self[start : start + self.blocksize]:
+                yield row
+
+
+    def dot(self, other):
+        """
+        Return the matrix product of this matrix with `other` (a 1d or 2d array),
+        as float32. Only one block of rows is dequantized at a time.
+        """
+        other = numpy.asarray(other, dtype=numpy.float32)
+        if self.quantize == 'int8_column':
+            # fold the column scales into `other` once, instead of into every block
+            other = other * (self.scales if other.ndim == 1 else self.scales[:, numpy.newaxis])
+        result = numpy.empty((len(self),) + other.shape[1:], dtype=numpy.float32)
+        for start in xrange(0, len(self), self.blocksize):
+            block = numpy.asarray(self.data[start : start + self.blocksize], dtype=numpy.float32)
+            sims = numpy.dot(block, other)
+            if self.quantize == 'int8':
+                scales = self.scales[start : start + self.blocksize]
+                sims *= scales if other.ndim == 1 else scales[:, numpy.newaxis]
+            result[start : start + len(block)] = sims
+        return result
+#endclass QuantizedMatrix
+
+
+
 class MatrixSimilarity(interfaces.SimilarityABC):
     """
     Compute similarity against a corpus of documents by storing the index matrix
@@ -480,13 +1360,39 @@ class MatrixSimilarity(interfaces.SimilarityABC):
     See also `Similarity` and `SparseMatrixSimilarity` in this module.
 
     """
-    def __init__(self, corpus, num_best=None, dtype=numpy.float32, num_features=None, chunksize=256):
+    def __init__(self, corpus, num_best=None, dtype=numpy.float32, num_features=None, chunksize=256,
+                 output_fname=None, quantize=None, rerank=0):
         """
         `num_features` is the number of features in the corpus (will be determined
         automatically by scanning the corpus if not specified). See `Similarity`
         class for description of the other parameters.
 
+        If `output_fname` is set, the index is built out-of-core instead: the
+        (normalized) document vectors are written to the `.npy` file `output_fname`,
+        `chunksize` documents at a time, in a single pass over `corpus`. The corpus
+        doesn't need to support `len()` and the full matrix is never held in RAM;
+        the finished file is memory-mapped (read-only) as `self.index`. `num_features`
+        must be given explicitly in this mode.
+
+        `save()` only stores a reference to `output_fname`, not the matrix itself;
+        `load(mmap='r')` memory-maps it back.
+
+        Set `quantize` to 'float16', 'int8' (one scale per document) or 'int8_column'
+        (one scale per feature) to keep the index in memory with reduced precision,
+        2-4x smaller (see `QuantizedMatrix`). Queries dequantize the index on the fly,
+        one block of documents at a time. Together with `output_fname`, the
+        full-precision matrix stays on disk and only the quantized copy is held in RAM.
+
+        With `rerank` set (and `output_fname` given), the `rerank` most similar
+        documents of each query are re-scored exactly, from the full-precision
+        vectors on disk. Set it to a few times `num_best`, so that the top documents
+        come out the same as without quantization.
+
         """
+        if num_features is None and output_fname is not None and corpus is not None:
+            raise ValueError("specify num_features explicitly when building an index out-of-core")
+        if rerank and (not quantize or output_fname is None):
+            raise ValueError("re-ranking needs a quantized index with full-precision vectors in `output_fname`")
         if num_features is None:
             logger.warning("scanning corpus to determine the number of features (consider setting `num_features` explicitly)")
             num_features = 1 + utils.get_max_id(corpus)
@@ -495,29 +1401,144 @@ class MatrixSimilarity(interfaces.SimilarityABC):
         self.num_best = num_best
         self.normalize = True
         self.chunksize = chunksize
+        self.index_fname = output_fname
+        self.quantize = quantize
+        self.rerank = rerank
+        self.full_index = None
 
         if corpus is not None:
             if self.num_features <= 0:
                 raise ValueError("cannot index a corpus with zero features (you must specify either `num_features` or a non-empty corpus in the constructor)")
-            logger.info("creating matrix for %s documents and %i features" %
+            if output_fname is not None:
+                self.index = self.corpus2npy(corpus, output_fname, num_features, dtype, chunksize)
+            else:
+                self.index = self.corpus2dense(corpus, num_features, dtype)
+            if quantize:
+                self.index = QuantizedMatrix(self.index, quantize)
+
+
+    @staticmethod
+    def corpus2dense(corpus, num_features, dtype):
+        """
+        Return the documents of `corpus` as unit-length rows of a dense matrix,
+        in memory.
+        """
+        logger.info("creating matrix for %s documents and %i features" %
                          (len(corpus), num_features))
-            self.index = numpy.empty(shape=(len(corpus), num_features), dtype=dtype)
-            # iterate over corpus, populating the numpy index matrix with (normalized)
-            # document vectors
-            for docno, vector in enumerate(corpus):
-                if docno % 1000 == 0:
-                    logger.debug("PROGRESS: at document #%i/%i" % (docno, len(corpus)))
-                # individual documents in fact may be in numpy.scipy.sparse format as well.
-                # it's not documented because other it's not fully supported throughout.
-                # the user better know what he's doing (no normalization, must
-                # explicitly supply num_features etc).
-                if isinstance(vector, numpy.ndarray):
-                    pass
-                elif scipy.sparse.issparse(vector):
-                    vector = vector.toarray().flatten()
-                else:
-                    vector = matutils.unitvec(matutils.sparse2full(vector, num_features))
-                self.index[docno] = vector
+        result = numpy.empty(shape=(len(corpus), num_features), dtype=dtype)
+        # iterate over corpus, populating the numpy index matrix with (normalized)
+        # document vectors
+        for docno, vector in enumerate(corpus):
+            if docno % 1000 == 0:
+                logger.debug("PROGRESS: at document #%i/%i" % (docno, len(corpus)))
+            # individual documents in fact may be in numpy.scipy.sparse format as well.
+            # it's not documented because other it's not fully supported throughout.
+            # the user better know what he's doing (no normalization, must
+            # explicitly supply num_features etc).
+            if isinstance(vector, numpy.ndarray):
+                pass
+            elif scipy.sparse.issparse(vector):
+                vector = vector.toarray().flatten()
+            else:
+                vector = matutils.unitvec(matutils.sparse2full(vector, num_features))
+            result[docno] = vector
+        return result
+
+
+    @staticmethod
+    def corpus2npy(corpus, fname, num_features, dtype, chunksize):
+        """
+        Write the documents of `corpus`, as unit-length dense rows, into the `.npy`
+        file `fname`, and return the result memory-mapped (read-only).
+
+        The documents are converted and normalized `chunksize` at a time, so only
+        a single pass over `corpus` is needed and memory use stays bounded.
+
+        """
+        dtype = numpy.dtype(dtype)
+        logger.info("creating matrix for %i features in %s" % (num_features, fname))
+        num_docs = 0
+        with open(fname, 'wb') as fout:
+            fout.write(b'\0' * NPY_HEADER_SIZE) # placeholder, the final shape isn't known yet
+            for chunk in utils.grouper(corpus, chunksize):
+                logger.debug("PROGRESS: at document #%i" % num_docs)
+                rows = numpy.zeros((len(chunk), num_features), dtype=dtype)
+                sparse_docs, ids, weights = [], [], []
+                for docno, vector in enumerate(chunk):
+                    # dense and scipy.sparse documents are copied as they are, like in the in-memory index
+                    if isinstance(vector, numpy.ndarray):
+                        rows[docno] = vector
+                    elif scipy.sparse.issparse(vector):
+                        rows[docno] = vector.toarray().flatten()
+                    else:
+                        sparse_docs.extend([docno] * len(vector))
+                        ids.extend(fieldid for fieldid, _ in vector)
+                        weights.extend(weight for _, weight in vector)
+                if sparse_docs:
+                    # scatter all sparse documents of the chunk at once, then scale them to unit length
+                    rows[sparse_docs, ids] = weights
+                    sparse_docs = numpy.unique(sparse_docs)
+                    lens = numpy.sqrt((rows[sparse_docs].astype(numpy.float64) ** 2).sum(axis=1))
+                    lens[lens == 0.0] = 1.0 # leave empty documents alone
+                    rows[sparse_docs] /= lens[:, numpy.newaxis]
+                fout.write(rows.tostring())
+                num_docs += len(chunk)
+            header = "{'descr': %r, 'fortran_order': False, 'shape': (%i, %i), }" % (
+                str(numpy.lib.format.dtype_to_descr(dtype)), num_docs, num_features)
+            header = header.ljust(NPY_HEADER_SIZE - 11) + '\n'
+            fout.seek(0)
+            fout.write(numpy.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header.encode('latin1'))
+        logger.info("created %i x %i matrix in %s" % (num_docs, num_features, fname))
+        return numpy.load(fname, mmap_mode='r')
+
+
+    def save(self, fname, *args, **kwargs):
+        """
+        Save the object to file (also see `load`).
+
+        An index built out-of-core (see `output_fname` in the constructor) is already
+        stored on disk, so only its filename is saved, not the matrix. A quantized
+        index is stored under `fname.index`.
+
+        """
+        ignore = set(kwargs.get('ignore', [])) | set(['full_index'])
+        if isinstance(self.index, QuantizedMatrix):
+            self.index.save(fname + '.index', *args, **kwargs)
+            ignore.add('index')
+        elif getattr(self, 'index_fname', None) is not None:
+            ignore.add('index')
+        kwargs['ignore'] = ignore
+        super(MatrixSimilarity, self).save(fname, *args, **kwargs)
+
+
+    @classmethod
+    def load(cls, fname, mmap=None):
+        """
+        Load a previously saved object from file (also see `save`). An index built
+        out-of-core is loaded from its `.npy` file, memory-mapped if `mmap` is set.
+
+        """
+        obj = super(MatrixSimilarity, cls).load(fname, mmap)
+        if getattr(obj, 'quantize', None):
+            obj.index = QuantizedMatrix.load(fname + '.index', mmap)
+        elif getattr(obj, 'index_fname', None) is not None:
+            logger.info("loading index from %s with mmap=%s" % (obj.index_fname, mmap))
+            obj.index = numpy.load(obj.index_fname, mmap_mode=mmap)
+        return obj
+
+
+    def get_full_index(self):
+        """
+        Return the index matrix in full precision, memory-mapped from disk if the
+        index is quantized; None if it is quantized and was built in memory.
+        """
+        if not getattr(self, 'quantize', None):
+            return self.index
+        if self.index_fname is None:
+            return None
+        if self.full_index is None:
+            self.full_index = numpy.load(self.index_fname, mmap_mode='r')
+        return self.full_index
 
 
     def __len__(self):
@@ -552,8 +1573,28 @@ class MatrixSimilarity(interfaces.SimilarityABC):
 
         # do a little transposition dance to stop numpy from making a copy of
         # self.index internally in numpy.dot (very slow).
-        result = numpy.dot(self.index, query.T).T # return #queries x #index
+        result = self.index.dot(query.T).T # return #queries x #index
+        if getattr(self, 'rerank', 0):
+            self.rerank_similarities(query, result)
         return result # XXX: removed casting the result from array to list; does anyone care?
+
+
+    def rerank_similarities(self, query, result):
+        """
+        Replace the (approximate) similarities of the `self.rerank` most similar
+        documents of each query in `result` by exact ones, computed from the
+        full-precision index vectors. `result` is modified in place.
+        """
+        sims, query = numpy.atleast_2d(result), numpy.atleast_2d(query)
+        topn = min(self.rerank, sims.shape[1])
+        if topn == 0:
+            return
+        candidates = numpy.array([matutils.argsort(row, topn) for row in sims], dtype=numpy.intp)
+        # fetch each candidate vector from disk only once, in file order
+        unique = numpy.unique(candidates)
+        exact = numpy.dot(numpy.asarray(self.get_full_index()[unique], dtype=numpy.float32), query.T).T
+        rows = numpy.arange(len(sims))[:, numpy.newaxis]
+        sims[rows, candidates] = exact[rows, numpy.searchsorted(unique, candidates)]
 #endclass MatrixSimilarity
 
 
@@ -572,10 +1613,18 @@ class SparseMatrixSimilarity(interfaces.SimilarityABC):
     See also `Similarity` and `MatrixSimilarity` in this module.
     """
     def __init__(self, corpus, num_features=None, num_terms=None, num_docs=None, num_nnz=None,
-                 num_best=None, chunksize=500, dtype=numpy.float32):
+                 num_best=None, chunksize=500, dtype=numpy.float32, inverted_index=False):
+        """
+        Set `inverted_index` to also keep the index as posting lists (documents of
+        each term, see `init_postings`), at the cost of twice the memory. Queries
+        with `num_best` set then only touch the postings of the query terms, instead
+        of computing similarities against all documents (see `get_topn`).
+
+        """
         self.num_best = num_best
         self.normalize = True
         self.chunksize = chunksize
+        self.postings = None
 
         if corpus is not None:
             logger.info("creating sparse index")
@@ -595,21 +1644,169 @@ class SparseMatrixSimilarity(interfaces.SimilarityABC):
                 num_terms = num_features
             if num_terms is None:
                 raise ValueError("refusing to guess the number of sparse features: specify num_features explicitly")
-            corpus = (matutils.scipy2sparse(v) if scipy.sparse.issparse(v) else
-                      (matutils.full2sparse(v) if isinstance(v, numpy.ndarray) else
-                       matutils.unitvec(v)) for v in corpus)
-            self.index = matutils.corpus2csc(corpus, num_terms=num_terms, num_docs=num_docs, num_nnz=num_nnz,
-                                              dtype=dtype, printprogress=10000).T
+            if hasattr(corpus, 'iter_chunks') and num_nnz is not None:
+                # the corpus can stream itself as sparse matrices (MmCorpus-like) => normalize
+                # and copy whole chunks at once, without going through per-document 2-tuples
+                self.index = self.chunks2csr(corpus.iter_chunks(chunksize=10000, num_terms=num_terms, dtype=dtype),
+                                             num_terms, num_nnz, dtype)
+            else:
+                corpus = (matutils.scipy2sparse(v) if scipy.sparse.issparse(v) else
+                          (matutils.full2sparse(v) if isinstance(v, numpy.ndarray) else
+                           matutils.unitvec(v)) for v in corpus)
+                self.index = matutils.corpus2csc(corpus, num_terms=num_terms, num_docs=num_docs, num_nnz=num_nnz,
+                                                  dtype=dtype, printprogress=10000).T
 
             # convert to Compressed Sparse Row for efficient row slicing and multiplications
             self.index = self.index.tocsr() # currently no-op, CSC.T is already CSR
             logger.info("created %r" % self.index)
+            if inverted_index:
+                self.init_postings()
+
+
+    def init_postings(self):
+        """
+        Build the inverted index: for each term, the (sorted) positions and weights of
+        the documents that contain it, plus the maximum weight of each term, which
+        bounds its contribution to any similarity.
+        """
+        self.postings = self.index.tocsc()
+        self.postings.sort_indices()
+        indptr, data = self.postings.indptr, self.postings.data
+        self.max_weights = numpy.zeros(self.postings.shape[1], dtype=numpy.float64)
+        nonempty = numpy.diff(indptr) > 0
+        if nonempty.any():
+            self.max_weights[nonempty] = numpy.maximum.reduceat(data, indptr[:-1][nonempty])
+        # pruning by upper bounds is only valid if similarities can't decrease by adding terms
+        self.nonnegative = not len(data) or data.min() >= 0
+        logger.info("created inverted index over %i terms" % self.postings.shape[1])
+
+
+    @staticmethod
+    def chunks2csr(chunks, num_terms, num_nnz, dtype):
+        """
+        Stack a stream of CSC `chunks` (documents as columns) into a single CSR
+        matrix with unit-length documents as rows, preallocated for `num_nnz` non-zeroes.
+        """
+        indptr = [numpy.array([0], dtype=numpy.int64)]
+        indices = numpy.empty((num_nnz,), dtype=numpy.int32)
+        data = numpy.empty((num_nnz,), dtype=dtype)
+        posnow, num_docs = 0, 0
+        for chunk in chunks:
+            logger.debug("PROGRESS: at document #%i" % num_docs)
+            posnext = posnow + chunk.nnz
+            # scale each column (document) to unit length, all columns at once
+            lens = numpy.sqrt(numpy.asarray(chunk.multiply(chunk).sum(axis=0)).ravel())
+            lens[lens == 0.0] = 1.0 # leave empty documents alone
+            data[posnow: posnext] = chunk.data / numpy.repeat(lens, numpy.diff(chunk.indptr))
+            indices[posnow: posnext] = chunk.indices
+            indptr.append(posnow + chunk.indptr[1:])
+            posnow = posnext
+            num_docs += chunk.shape[1]
+        assert posnow == num_nnz, "mismatch between supplied and computed number of non-zeros"
+        indptr = numpy.concatenate(indptr)
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, num_terms), dtype=dtype)
 
 
     def __len__(self):
         return self.index.shape[0]
 
 
+    def __getitem__(self, query):
+        """
+        Get similarities of document `query` (or of each document of a corpus) to
+        all documents in the index; see `SimilarityABC.__getitem__`.
+
+        With the inverted index built and `num_best` set, queries in sparse gensim
+        format are answered from the posting lists, via `get_topn`.
+
+        """
+        if (getattr(self, 'postings', None) is None or self.num_best is None or
+                isinstance(query, numpy.ndarray) or scipy.sparse.issparse(query)):
+            return super(SparseMatrixSimilarity, self).__getitem__(query)
+        is_corpus, query = utils.is_corpus(query)
+        if not is_corpus:
+            return self.get_topn(matutils.unitvec(query) if self.normalize else query, self.num_best)
+        return [self.get_topn(matutils.unitvec(doc) if self.normalize else doc, self.num_best) for doc in query]
+
+
+    def get_topn(self, query, topn):
+        """
+        Return the `topn` documents most similar to the sparse vector `query`, as
+        a list of `(document position, similarity)` 2-tuples sorted by decreasing
+        similarity, leaving out zero similarities (like `self[query]` with `num_best`).
+
+        The similarities are accumulated term-at-a-time over the posting lists of
+        the query terms, in order of decreasing maximum contribution. As soon as the
+        terms left cannot lift a document not seen yet into the `topn` (their summed
+        maximum contributions drop below the current `topn`-th best similarity),
+        only the scores of the candidates found so far are updated, and candidates
+        that can no longer make it are dropped (MaxScore-style pruning). The cost
+        depends on the length of the posting lists touched, not on the index size.
+
+        """
+        postings = self.postings
+        indptr, num_terms = postings.indptr, postings.shape[1]
+        terms = [(termid, weight) for termid, weight in query
+                 if 0 <= termid < num_terms and weight and indptr[termid] < indptr[termid + 1]]
+        if topn <= 0 or not terms:
+            return []
+        volume = sum(indptr[termid + 1] - indptr[termid] for termid, _ in terms)
+        if volume > self.index.nnz // 4:
+            # the query touches a large part of the index anyway; a full sparse matrix product is faster
+            return matutils.full2sparse_clipped(self.get_similarities(query), topn)
+        prune = self.nonnegative and all(weight > 0 for _, weight in terms)
+        bounds = numpy.array([abs(weight) * self.max_weights[termid] for termid, weight in terms])
+        order = numpy.argsort(-bounds, kind='mergesort')
+        remaining = numpy.append(numpy.cumsum(bounds[order][::-1])[::-1], 0.0) # remaining[i] = sum(bounds[i:])
+
+        docs, scores = numpy.empty(0, dtype=postings.indices.dtype), numpy.empty(0, dtype=numpy.float64)
+        pending_docs, pending_sims, num_pending = [], [], 0
+        new_docs = True
+        # if the query touches many documents, accumulate the similarities in a dense
+        # array instead: cheaper than merging sorted candidates over and over again
+        num_docs = postings.shape[0]
+        accumulator = numpy.zeros(num_docs, dtype=numpy.float64) if volume >= ACCUMULATOR_RATIO * num_docs else None
+        for i, termno in enumerate(order):
+            termid, weight = terms[termno]
+            start, end = indptr[termid], indptr[termid + 1]
+            term_docs, term_sims = postings.indices[start : end], weight * postings.data[start : end]
+            if not new_docs:
+                # only update the candidates that are left
+                pos = numpy.minimum(numpy.searchsorted(term_docs, docs), len(term_docs) - 1)
+                found = term_docs[pos] == docs
+                scores[found] += term_sims[pos[found]]
+            elif accumulator is not None:
+                accumulator[term_docs] += term_sims # no duplicates within a posting list
+                num_pending += len(term_docs)
+                if num_pending < max(len(docs), num_docs // 4) and i + 1 < len(order):
+                    continue
+                docs = numpy.flatnonzero(accumulator)
+                scores = accumulator[docs]
+                num_pending = 0
+            else:
+                # collect posting lists until they outweigh the candidates, then merge them all at once
+                pending_docs.append(term_docs)
+                pending_sims.append(term_sims)
+                num_pending += len(term_docs)
+                if num_pending < max(len(docs), topn) and i + 1 < len(order):
+                    continue
+                docs, inverse = numpy.unique(numpy.concatenate([docs] + pending_docs), return_inverse=True)
+                scores = numpy.bincount(inverse, weights=numpy.concatenate([scores] + pending_sims))
+                pending_docs, pending_sims, num_pending = [], [], 0
+            if prune and len(docs) >= topn and i + 1 < len(order):
+                threshold = numpy.sort(scores)[len(scores) - topn]
+                if remaining[i + 1] < threshold:
+                    new_docs = False
+                if not new_docs:
+                    keep = scores + remaining[i + 1] >= threshold
+                    docs, scores = docs[keep], scores[keep]
+
+        nonzero = abs(scores) > 1e-9
+        docs, scores = docs[nonzero], scores[nonzero]
+        best = numpy.argsort(-scores, kind='mergesort')[: topn]
+        return list(zip(docs[best].tolist(), scores[best].tolist()))
+
+
     def get_similarities(self, query):
         """
         Return similarity of sparse vector `query` to all documents in the corpus,
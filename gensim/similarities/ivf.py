@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Radim Rehurek <radimrehurek@seznam.cz>
+# Licensed under the GNU LGPL v2.1 - http://www.gnu.org/licenses/lgpl.html
+
+"""
+Approximate nearest neighbour search over dense, unit-length vectors (such as
+the normalized word vectors of a `Word2Vec` model), by cosine similarity.
+
+The vectors are clustered by spherical k-means. For each cluster, the index stores
+the positions of the vectors that belong to it (an "inverted file"). A query only
+scans the vectors of the `nprobe` clusters whose centroids are most similar to the
+query, instead of all vectors:
+
+>>> index = InvertedFileIndex(model.syn0norm, num_clusters=2000, nprobe=20)
+>>> positions, sims = index.most_similar(model.syn0norm, query_vector, topn=10)
+
+`nprobe` is the recall vs. speed trade-off: the more clusters are probed, the more
+likely the true nearest neighbours are found, but the more vectors are scanned.
+Probing all clusters gives exact results.
+
+The index itself only holds the centroids and the inverted lists, not the vectors;
+these are passed to each query. The index can be stored with `save()` and loaded
+back with `load(mmap='r')`.
+
+"""
+
+
+import logging
+
+import numpy
+
+from gensim import utils, matutils
+from gensim._six.moves import xrange
+
+
+logger = logging.getLogger('gensim.similarities.ivf')
+
+
+class InvertedFileIndex(utils.SaveLoad):
+    """
+    Inverted file index over unit-length vectors, clustered by spherical k-means.
+
+    """
+    def __init__(self, vectors, num_clusters=None, nprobe=None, iterations=10, sample_size=None,
+                 chunksize=10000, seed=1):
+        """
+        Build the index from the 2d array `vectors` (one unit-length vector per row).
+
+        `num_clusters` defaults to the square root of the number of vectors. `nprobe`
+        is the default number of clusters scanned by queries (default: ~5% of the
+        clusters, at least 1).
+
+        The centroids are trained on a random sample of `sample_size` vectors
+        (default: 100 vectors per cluster), for `iterations` iterations of k-means.
+        Afterwards, all vectors are assigned to their closest centroid, in chunks of
+        `chunksize` vectors.
+
+        """
+        num_vectors = vectors.shape[0]
+        if num_vectors == 0:
+            raise ValueError("cannot build an index over no vectors")
+        if num_clusters is None:
+            num_clusters = int(numpy.sqrt(num_vectors))
+        self.num_clusters = max(1, min(int(num_clusters), num_vectors))
+        if nprobe is None:
+            nprobe = int(numpy.ceil(0.05 * self.num_clusters))
+        self.nprobe = max(1, nprobe)
+        self.num_vectors = num_vectors
+        self.chunksize = chunksize
+        random = numpy.random.RandomState(seed)
+
+        if sample_size is None:
+            sample_size = 100 * self.num_clusters
+        if sample_size < num_vectors:
+            sample = numpy.sort(random.permutation(num_vectors)[: sample_size])
+            sample = numpy.asarray(vectors[sample], dtype=numpy.float32)
+        else:
+            sample = numpy.asarray(vectors, dtype=numpy.float32)
+        logger.info("training %i centroids on %i vectors" % (self.num_clusters, len(sample)))
+        centroids = sample[random.permutation(len(sample))[: self.num_clusters]].copy()
+        for iteration in xrange(iterations):
+            clusters, sims = self.assign(centroids, sample)
+            logger.info("k-means iteration #%i: average similarity to centroid %.4f" %
+                        (iteration, sims.mean()))
+            for cluster in numpy.nonzero(numpy.bincount(clusters, minlength=self.num_clusters) == 0)[0]:
+                # re-seed empty clusters with the vector that is furthest from its centroid
+                furthest = numpy.argmin(sims)
+                clusters[furthest], sims[furthest] = cluster, 1.0
+            for dim in xrange(centroids.shape[1]):
+                centroids[:, dim] = numpy.bincount(clusters, weights=sample[:, dim], minlength=self.num_clusters)
+            centroids /= numpy.sqrt((centroids ** 2).sum(axis=1))[:, numpy.newaxis] + 1e-30
+        self.centroids = centroids
+
+        # assign all vectors to their closest centroid, and build the inverted lists
+        clusters = self.assign(centroids, vectors)[0]
+        self.order = numpy.argsort(clusters, kind='mergesort').astype(numpy.int32) # vector positions, by cluster
+        self.starts = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(clusters, minlength=self.num_clusters))))
+        logger.info("built %s" % self)
+
+
+    def __str__(self):
+        return ("InvertedFileIndex(%i vectors, %i clusters, nprobe=%i)" %
+                (self.num_vectors, self.num_clusters, self.nprobe))
+
+
+    def assign(self, centroids, vectors):
+        """
+        Return the closest centroid of each vector, and the similarity to it, as
+        two arrays.
+        """
+        clusters = numpy.empty(len(vectors), dtype=numpy.intp)
+        sims = numpy.empty(len(vectors), dtype=numpy.float32)
+        for start in xrange(0, len(vectors), self.chunksize):
+            chunk_sims = numpy.dot(numpy.asarray(vectors[start : start + self.chunksize]), centroids.T)
+            best = numpy.argmax(chunk_sims, axis=1)
+            clusters[start : start + len(best)] = best
+            sims[start : start + len(best)] = chunk_sims[numpy.arange(len(best)), best]
+        return clusters, sims
+
+
+    def candidates(self, query, nprobe=None):
+        """
+        Return positions of all vectors in the `nprobe` clusters closest to the
+        unit-length `query` vector.
+        """
+        if nprobe is None:
+            nprobe = self.nprobe
+        nprobe = max(1, min(nprobe, self.num_clusters))
+        centroid_sims = numpy.dot(self.centroids, query)
+        if nprobe < self.num_clusters:
+            probed = matutils.argsort(centroid_sims, nprobe)
+        else:
+            probed = numpy.arange(self.num_clusters)
+        return numpy.concatenate([self.order[self.starts[c] : self.starts[c + 1]] for c in probed])
+
+
+    def most_similar(self, vectors, query, topn=10, nprobe=None, exclude=()):
+        """
+        Find the (approximately) `topn` most similar vectors to the unit-length
+        `query` vector, by cosine similarity. `vectors` must be the same array the
+        index was built from.
+
+        Return a `(positions, sims)` 2-tuple of arrays, sorted by decreasing
+        similarity. Positions in `exclude` are never returned.
+
+        `nprobe` overrides the number of clusters scanned, set in the constructor.
+
+        """
+        if len(vectors) != self.num_vectors:
+            raise ValueError("index built over %i vectors, but got %i" % (self.num_vectors, len(vectors)))
+        candidates = self.candidates(query, nprobe)
+        if len(exclude):
+            candidates = candidates[~numpy.in1d(candidates, list(exclude))]
+        sims = numpy.dot(vectors[candidates], query)
+        topn = max(0, min(topn, len(candidates)))
+        if 0 < topn < len(candidates):
+            best = matutils.argsort(sims, topn)
+        else:
+            best = numpy.arange(topn)
+        best = best[numpy.argsort(-sims[best], kind='mergesort')]
+        return candidates[best], sims[best]
+#endclass InvertedFileIndex
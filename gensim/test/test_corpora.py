@@ -12,8 +12,12 @@ import logging
 import os.path
 import unittest
 import tempfile
+import bz2
 
-from gensim.corpora import bleicorpus, mmcorpus, lowcorpus, svmlightcorpus, ucicorpus
+import numpy
+
+from gensim import matutils
+from gensim.corpora import bleicorpus, mmcorpus, lowcorpus, svmlightcorpus, ucicorpus, npycorpus, wikicorpus
 
 
 module_path = os.path.dirname(__file__) # needed because sample data files are located in the same folder
@@ -64,6 +68,22 @@ class CorpusTesterABC(object):
 
         # delete the temporary file
         os.remove(testfile())
+
+
+    def check_iter_chunks(self, corpus):
+        # chunks must be the same as converting the document stream by hand
+        docs = list(corpus)
+        expected = matutils.corpus2csc(docs, num_terms=corpus.num_terms).toarray()
+        for chunksize in [1, 2, 4, 9, 100]:
+            chunks = list(corpus.iter_chunks(chunksize))
+            self.assertEqual(len(chunks), (len(docs) + chunksize - 1) // chunksize)
+            self.assertTrue(all(chunk.shape[1] <= chunksize for chunk in chunks))
+            got = numpy.hstack([chunk.toarray() for chunk in chunks])
+            self.assertTrue(numpy.allclose(expected, got))
+
+        # more rows than features in the corpus
+        chunk = next(corpus.iter_chunks(100, num_terms=corpus.num_terms + 5))
+        self.assertEqual(chunk.shape, (corpus.num_terms + 5, len(docs)))
 #endclass CorpusTesterABC
 
 
@@ -71,6 +91,17 @@ class TestMmCorpus(unittest.TestCase, CorpusTesterABC):
     def setUp(self):
         self.corpus_class = mmcorpus.MmCorpus
         self.file_extension = '.mm'
+
+    def test_iter_chunks(self):
+        self.check_iter_chunks(self.corpus_class(datapath('testcorpus.mm')))
+
+        # documents with no entries, at the start, in the middle and at the end of the file
+        corpus = [[], [(1, 1.0)], [], [], [(0, 0.5), (2, 1.0)], []]
+        self.corpus_class.serialize(testfile(), corpus)
+        corpus2 = self.corpus_class(testfile())
+        self.check_iter_chunks(corpus2)
+        self.assertEqual(sum(chunk.shape[1] for chunk in corpus2.iter_chunks(4, buffer_lines=1)), len(corpus))
+        os.remove(testfile())
 #endclass TestMmCorpus
 
 
@@ -105,6 +136,9 @@ class TestUciCorpus(unittest.TestCase, CorpusTesterABC):
         self.corpus_class = ucicorpus.UciCorpus
         self.file_extension = '.uci'
 
+    def test_iter_chunks(self):
+        self.check_iter_chunks(self.corpus_class(datapath('testcorpus.uci')))
+
     def test_save(self):
         super(TestUciCorpus, self).test_save(corpus=[[(1, 1)], [], [(0, 2), (2, 1)], []])
 
@@ -113,6 +147,207 @@ class TestUciCorpus(unittest.TestCase, CorpusTesterABC):
 #endclass TestUciCorpus
 
 
+class TestNpyCorpus(unittest.TestCase, CorpusTesterABC):
+    def setUp(self):
+        self.corpus_class = npycorpus.NpyCorpus
+        self.file_extension = '.npyc'
+
+    def tearDown(self):
+        # the CSR arrays are stored in separate files, next to the main one
+        for suffix in ['', '.indptr.npy', '.indices.npy', '.data.npy']:
+            if os.path.exists(testfile() + suffix):
+                os.remove(testfile() + suffix)
+
+    def test_load(self):
+        # there is no binary test file; convert the MM version instead
+        mm = mmcorpus.MmCorpus(datapath('testcorpus.mm'))
+        self.corpus_class.serialize(testfile(), mm)
+        corpus = self.corpus_class(testfile())
+        self.assertEqual(len(corpus), 9)
+        self.assertEqual(list(corpus), list(mm))
+        self.assertEqual((corpus.num_terms, corpus.num_nnz), (mm.num_terms, mm.num_nnz))
+
+    def test_mmap(self):
+        corpus = [[(1, 1.0)], [], [(0, 0.5), (2, 1.0)], []]
+        self.corpus_class.serialize(testfile(), corpus)
+        for mmap in [None, 'r']:
+            corpus2 = self.corpus_class(testfile(), mmap=mmap)
+            self.assertEqual(corpus, list(corpus2))
+            self.assertEqual(corpus[-2], corpus2[-2])
+            self.assertRaises(IndexError, corpus2.__getitem__, 4)
+
+    def test_iter_chunks(self):
+        self.corpus_class.serialize(testfile(), mmcorpus.MmCorpus(datapath('testcorpus.mm')))
+        self.check_iter_chunks(self.corpus_class(testfile()))
+#endclass TestNpyCorpus
+
+
+WIKI_HEADER = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.8/" version="0.8" xml:lang="en">
+  <siteinfo>
+    <sitename>Wikipedia</sitename>
+  </siteinfo>
+"""
+
+WIKI_PAGE = """  <page>
+    <title>%(title)s</title>
+    <ns>%(ns)s</ns>
+    <id>%(id)i</id>
+    <revision>
+      <id>%(id)i</id>
+      <text xml:space="preserve">%(text)s</text>
+    </revision>
+  </page>
+"""
+
+
+def write_wiki_dump(fname, index_fname=None, num_pages=30, pages_per_stream=4):
+    """
+    Create an artificial wikipedia dump. If `index_fname` is set, store it in the
+    multistream format (plus index), otherwise as a single bz2 stream.
+    """
+    words = "wiki markup article anarchism history science music paris london physics".split()
+    random = numpy.random.RandomState(0)
+    pages = []
+    for pageid in range(num_pages):
+        length = 20 if pageid % 7 == 3 else 80 # some articles are too short, and get pruned
+        text = ' '.join(words[i] for i in random.randint(0, len(words), length))
+        text += " [[link|%s]] {{template|%s}} &lt;ref&gt;note&lt;/ref&gt;" % (words[pageid % 10], words[0])
+        ns = 1 if pageid % 11 == 5 else 0 # talk pages are filtered out
+        pages.append(WIKI_PAGE % {'title': 'Page %i' % pageid, 'ns': ns, 'id': pageid + 1, 'text': text})
+
+    if index_fname is None:
+        with open(fname, 'wb') as fout:
+            fout.write(bz2.compress(WIKI_HEADER + ''.join(pages) + '</mediawiki>\n'))
+        return
+    index = []
+    with open(fname, 'wb') as fout:
+        fout.write(bz2.compress(WIKI_HEADER))
+        for start in range(0, num_pages, pages_per_stream):
+            offset = fout.tell()
+            for pageid in range(start, min(num_pages, start + pages_per_stream)):
+                index.append("%i:%i:Page %i\n" % (offset, pageid + 1, pageid))
+            fout.write(bz2.compress(''.join(pages[start : start + pages_per_stream])))
+        fout.write(bz2.compress('</mediawiki>\n'))
+    with open(index_fname, 'wb') as fout:
+        fout.write(bz2.compress(''.join(index)))
+
+
+class TestWikiCorpus(unittest.TestCase):
+    def setUp(self):
+        self.fnames = [testfile() + suffix for suffix in ['.xml.bz2', '.multistream.xml.bz2', '.index.txt.bz2']]
+        write_wiki_dump(self.fnames[0])
+        write_wiki_dump(self.fnames[1], self.fnames[2])
+
+    def tearDown(self):
+        for fname in self.fnames:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def test_multistream(self):
+        wiki = wikicorpus.WikiCorpus(self.fnames[0], processes=1, lemmatize=False)
+        texts = list(wiki.get_texts())
+        self.assertEqual(len(texts), 23)
+        self.assertEqual(wiki.length, 23)
+
+        # parallel decompression must give identical results, in identical order
+        wiki2 = wikicorpus.WikiCorpus(self.fnames[1], processes=2, lemmatize=False, index_fname=self.fnames[2])
+        self.assertEqual(list(wiki2.get_texts()), texts)
+        self.assertEqual(wiki2.dictionary.token2id, wiki.dictionary.token2id)
+        self.assertEqual(list(wiki2), list(wiki))
+
+    def test_resume(self):
+        wiki = wikicorpus.WikiCorpus(self.fnames[1], processes=2, lemmatize=False, index_fname=self.fnames[2])
+        texts = list(wiki.get_texts())
+        self.assertEqual(wiki.resume_offset, None)
+
+        # simulate a crash after 10 articles
+        done = 0
+        for _ in wiki.get_texts():
+            done += 1
+            if done == 10:
+                break
+        offset = wiki.resume_offset
+        self.assertTrue(offset > 0)
+        resumed = list(wiki.get_texts(start_offset=offset))
+        # resuming starts from the beginning of the stream with the last article seen
+        self.assertTrue(len(texts) - 10 < len(resumed) < len(texts))
+        self.assertEqual(resumed, texts[-len(resumed):])
+        self.assertRaises(ValueError, lambda: list(wikicorpus.WikiCorpus(self.fnames[0], dictionary={}).get_texts(0)))
+
+    def test_cache(self):
+        cache_fname = testfile() + '.cache'
+        self.fnames.extend(cache_fname + suffix for suffix in ['', '.ids', '.offsets.npy'])
+        wiki = wikicorpus.WikiCorpus(self.fnames[0], processes=1, lemmatize=False)
+        texts, bows = list(wiki.get_texts()), list(wiki)
+
+        # the cache is created during the dictionary building pass
+        wiki = wikicorpus.WikiCorpus(self.fnames[0], processes=1, lemmatize=False, cache_fname=cache_fname)
+        self.assertTrue(wiki.load_cache() is not None)
+        wiki._get_article_tokens = None # make sure the dump isn't parsed again
+        self.assertEqual(list(wiki.get_texts()), texts)
+        self.assertEqual(list(wiki), bows)
+        wiki.dictionary.filter_tokens(bad_ids=[0, 5])
+        self.assertEqual(list(wiki), [wiki.dictionary.doc2bow(text) for text in texts])
+
+        # changing the settings invalidates the cache
+        wiki = wikicorpus.WikiCorpus(self.fnames[0], processes=1, lemmatize=False, cache_fname=cache_fname,
+                                     filter_namespaces=False, dictionary=wiki.dictionary)
+        self.assertTrue(wiki.load_cache() is None)
+        self.assertEqual(len(list(wiki.get_texts())), 26)
+        self.assertEqual(len(list(wikicorpus.WikiCorpus(self.fnames[0], processes=1, lemmatize=False,
+                                                        cache_fname=cache_fname).get_texts())), 23)
+
+    def test_markup_scanner(self):
+        markup = """{{Infobox person|name={{nowrap|Ada Lovelace}}|image=Ada.jpg}}
+'''Ada Lovelace'''<ref name="a">{{cite book|title=Notes}}</ref> was an [[England|English]] mathematician
+<!-- comment [[ignored]] --> known for her work on the [[Analytical Engine]].<ref>Note</ref>
+[[File:Ada.jpg|thumb|left|Portrait by [[Alfred Edward Chalon]], 1840]]
+She wrote about [http://example.com Bernoulli numbers] and <math>B_n</math> <nowiki>[[raw]]</nowiki>.
+{| class="wikitable"
+|-
+! Year !! Event
+|-
+| 1842 || Translation || [[Luigi Menabrea|Menabrea]]
+|}
+[[Category:Mathematicians]]
+[[de:Ada Lovelace]]"""
+        self.assertEqual(wikicorpus.tokenize(wikicorpus.filter_wiki(markup, scanner=True)),
+                         wikicorpus.tokenize(wikicorpus.filter_wiki(markup)))
+        # tables nested in links and file captions, and comments in file captions
+        markups = [
+            "[[lambda|theta || [[epsilon delta|{{iota|beta=iota alpha}}]]\n]] zeta",
+            "[[epsilon [[beta|<!-- -->]]\n|}\n]] zeta",
+            "[[beta|\n{| class=\"wikitable\"\n|-\n! gamma [[beta|{{beta|theta=beta}}]] || gamma]]",
+            "[[zeta|delta <!-- [[Image:theta.png|left|<!-- -->]] iota",
+            "<!-- [[File:alpha.jpg|thumb|\n{| --> iota\n|}\n]] zeta",
+            "<ref>[[File:a.jpg|thumb|beta zeta</ref> || theta]]\n|}\n]]</ref> iota",
+            # file links inside comments and footnotes, nested comments
+            "<!-- [[File:eps.jpg|thumb|delta]] [[File:eps.jpg|thumb|<!-- eps --> [[eps|alpha]]]] --> beta",
+            "<ref>[[File:eps.jpg|thumb|beta]] [[File:delta.jpg|thumb|\n{|\n| <ref>delta</ref> || gamma\n|-\n| gamma\n|}\n]]</ref>",
+            "<!-- alpha <!-- beta --> gamma --> delta",
+            # links simplified after the table markup, brackets inside outside links
+            "\n{|\n| eps [[beta|[[<!-- alpha -->]]]] || gamma\n|-\n| gamma\n|}\n",
+            "[[alpha|\n{|\n| [[eps|gamma [[delta|<ref>gamma</ref>]]]] || eps\n|-\n| eps\n|}\n]]",
+            "[http://example.com/alpha [[beta]] gamma] delta",
+            # categories with links inside
+            "[[Category:delta|[http://example.com/delta eps]]] zeta",
+            "[[Category:beta|[[Category:alpha|eps]] beta]] zeta",
+        ]
+        for markup in markups:
+            self.assertEqual(wikicorpus.tokenize(wikicorpus.scan_markup(markup)),
+                             wikicorpus.tokenize(wikicorpus.remove_markup(markup)))
+        # known difference: category brackets separated by a comment or tag
+        markup = "[[Category:alpha]<!-- -->] beta"
+        self.assertEqual(wikicorpus.tokenize(wikicorpus.scan_markup(markup)), ['category', 'alpha', 'beta'])
+        self.assertEqual(wikicorpus.tokenize(wikicorpus.remove_markup(markup)), ['beta'])
+
+        wiki = wikicorpus.WikiCorpus(self.fnames[0], processes=1, lemmatize=False)
+        wiki2 = wikicorpus.WikiCorpus(self.fnames[1], processes=2, lemmatize=False, index_fname=self.fnames[2],
+                                      markup_scanner=True)
+        self.assertEqual(list(wiki2.get_texts()), list(wiki.get_texts()))
+#endclass TestWikiCorpus
+
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
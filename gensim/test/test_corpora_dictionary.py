@@ -114,6 +114,27 @@ class TestDictionary(unittest.TestCase):
         # unicode must be converted to utf8
         self.assertEqual(d.doc2bow([u'\u017elu\u0165ou\u010dk\xfd']), [(0, 1)])
 
+        # mixed utf8 and unicode forms of the same token are counted together
+        self.assertEqual(d.doc2bow([u'\u017elu\u0165ou\u010dk\xfd', "žluťoučký"]), [(0, 2)])
+        self.assertEqual(d.doc2bow(["žluťoučký", "kůň"], return_missing=True), ([(0, 1)], {"kůň": 1}))
+
+    def test_doc2bow_many(self):
+        d = Dictionary()
+        bows = d.doc2bow_many(self.texts, allow_update=True)
+        self.assertEqual(d.token2id, Dictionary(self.texts).token2id)
+        self.assertEqual(bows, [d.doc2bow(text) for text in self.texts])
+
+        csr = d.doc2bow_many(self.texts + [['unknown', 'trees']], as_csr=True)
+        self.assertEqual(csr.shape, (len(self.texts) + 1, len(d)))
+        self.assertEqual([list(zip(row.indices, row.data)) for row in csr], bows + [[(d.token2id['trees'], 1)]])
+
+        # token ids with gaps
+        d.filter_tokens(bad_ids=[0])
+        csr = d.doc2bow_many(self.texts, as_csr=True)
+        self.assertEqual(csr.shape, (len(self.texts), max(d.token2id.values()) + 1))
+        self.assertEqual([list(zip(row.indices, row.data)) for row in csr], [d.doc2bow(text) for text in self.texts])
+        self.assertEqual(Dictionary().doc2bow_many(self.texts, as_csr=True).shape, (len(self.texts), 0))
+
     def test_saveAsText_and_loadFromText(self):
         """`Dictionary` can be saved as textfile and loaded again from textfile. """
         tmpf = get_tmpfile('dict_test.txt')
@@ -160,6 +181,32 @@ class TestDictionary(unittest.TestCase):
         self.assertEqual(dictionary.num_docs, dictionary_from_corpus.num_docs)
         self.assertEqual(dictionary.num_pos, dictionary_from_corpus.num_pos)
         self.assertEqual(dictionary.num_nnz, dictionary_from_corpus.num_nnz)
+
+    def test_merge_with(self):
+        d = Dictionary(self.texts[:5])
+        d2 = Dictionary(self.texts[5:])
+        d.merge_with(d2)
+        expected = Dictionary(self.texts)
+        self.assertEqual(d.token2id, expected.token2id)
+        self.assertEqual(d.dfs, expected.dfs)
+        self.assertEqual((d.num_docs, d.num_pos, d.num_nnz),
+                         (expected.num_docs, expected.num_pos, expected.num_nnz))
+
+    def test_from_documents_parallel(self):
+        expected = Dictionary(self.texts)
+        for processes in [1, 2, 3]:
+            for chunksize in [1, 2, 100]:
+                d = Dictionary.from_documents(iter(self.texts), processes=processes, chunksize=chunksize,
+                                              prune_at=None if processes == 1 else len(expected))
+                self.assertEqual(d.token2id, expected.token2id)
+                self.assertEqual(d.dfs, expected.dfs)
+                self.assertEqual((d.num_docs, d.num_pos, d.num_nnz),
+                                 (expected.num_docs, expected.num_pos, expected.num_nnz))
+
+        # pruning during the merge keeps the most frequent tokens only
+        d = Dictionary.from_documents(self.texts, processes=2, chunksize=2, prune_at=4)
+        self.assertTrue(len(d) <= 4)
+        self.assertEqual(sorted(d.token2id.values()), list(range(len(d))))
 #endclass TestDictionary
 
 
@@ -177,6 +177,14 @@ class TestHashDictionary(unittest.TestCase):
         d2 = d.load(tmpf)
         self.assertEqual(len(d), len(d2))
 
+    def test_doc2bow_many(self):
+        d = HashDictionary(id_range=5)
+        bows = [d.doc2bow(text) for text in self.texts]
+        self.assertEqual(HashDictionary(id_range=5).doc2bow_many(self.texts), bows)
+        csr = HashDictionary(id_range=5).doc2bow_many(self.texts, as_csr=True)
+        self.assertEqual(csr.shape, (len(self.texts), 5))
+        self.assertEqual([sorted(zip(row.indices, row.data)) for row in csr], bows)
+
 
 
 if __name__ == '__main__':
@@ -14,6 +14,7 @@ import unittest
 import os
 import os.path
 import tempfile
+import threading
 
 import numpy
 import scipy.linalg
@@ -85,6 +86,17 @@ class TestLsiModel(unittest.TestCase):
         self.assertTrue(numpy.allclose(abs(got), abs(expected))) # must equal up to sign
 
 
+    def testChunkedCorpus(self):
+        """Test training from sparse chunks of MmCorpus vs. a plain list of documents."""
+        for onepass in [True, False]:
+            numpy.random.seed(0)
+            model = lsimodel.LsiModel(self.corpus, num_topics=2, chunksize=4, onepass=onepass)
+            numpy.random.seed(0)
+            model2 = lsimodel.LsiModel(list(self.corpus), id2word=model.id2word, num_topics=2, chunksize=4, onepass=onepass)
+            self.assertTrue(numpy.allclose(model.projection.s, model2.projection.s))
+            self.assertTrue(numpy.allclose(abs(model.projection.u), abs(model2.projection.u)))
+
+
     def testOnlineTransform(self):
         corpus = list(self.corpus)
         doc = corpus[0] # use the corpus' first document for testing
@@ -210,6 +222,44 @@ class TestLdaModel(unittest.TestCase):
         self.assertTrue(passed)
 
 
+    def testTransformProcesses(self):
+        # same as testTransform, but with the E step running in local worker processes
+        passed = False
+        for i in range(5): # restart at most 5 times
+            model = ldamodel.LdaModel(id2word=dictionary, num_topics=2, passes=100, processes=2)
+            model.update(corpus)
+            self.assertEqual(model.num_updates, 100)
+
+            transformed = model[corpus[0]]
+            vec = matutils.sparse2full(transformed, 2)
+            expected = [0.13, 0.87]
+            passed = numpy.allclose(sorted(vec), sorted(expected), atol=1e-2)
+            if passed:
+                break
+            logging.warning("LDA failed to converge on attempt %i (got %s, expected %s)" %
+                            (i, sorted(vec), sorted(expected)))
+        self.assertTrue(passed)
+
+
+    def testBatchInference(self):
+        # batch and per-document inference must give the same results
+        model = ldamodel.LdaModel(self.corpus, num_topics=3)
+        chunk = list(self.corpus) + [[]] # include an empty document, too
+        for iterations in [2, 50]:
+            model.iterations = iterations
+            numpy.random.seed(1)
+            gamma, sstats = model.inference(chunk, collect_sstats=True, batch=False)
+            numpy.random.seed(1)
+            gamma2, sstats2 = model.inference(chunk, collect_sstats=True, batch=True)
+            self.assertTrue(numpy.allclose(gamma, gamma2))
+            self.assertTrue(numpy.allclose(sstats, sstats2))
+
+        numpy.random.seed(1)
+        gamma3, sstats3 = model.inference(chunk[:0], collect_sstats=True)
+        self.assertEqual(gamma3.shape, (0, 3))
+        self.assertEqual(sstats3.sum(), 0.0)
+
+
     def testPersistence(self):
         model = ldamodel.LdaModel(self.corpus, num_topics=2)
         model.save(testfile())
@@ -240,6 +290,67 @@ class TestLdaModel(unittest.TestCase):
 #endclass TestLdaModel
 
 
+class TestWorkerState(unittest.TestCase):
+    """
+    Exchange of model state between the dispatchers and workers of distributed
+    LDA/LSI, without Pyro: one worker on the dispatcher's machine (state passed
+    through files) and one remote worker (state compressed, LDA resets as deltas).
+    """
+    def setUpWorkers(self, dispatcher_module, worker_module):
+        dispatcher = dispatcher_module.Dispatcher()
+        dispatcher.lock_update = threading.Lock()
+        dispatcher._jobsdone, dispatcher._jobsreceived = 0, 0
+        dispatcher.remote_base = None
+        dispatcher.workers, dispatcher.local_workers = {}, set([0])
+        for workerid in [0, 1]:
+            worker = worker_module.Worker()
+            worker.initialize(workerid, dispatcher=dispatcher, id2word=dictionary, num_topics=2)
+            worker.requestjob = lambda: None # no jobs are queued
+            dispatcher.workers[workerid] = worker
+        return dispatcher, dispatcher.workers[0], dispatcher.workers[1]
+
+    def testLda(self):
+        from gensim.models import lda_dispatcher, lda_worker
+        dispatcher, local, remote = self.setUpWorkers(lda_dispatcher, lda_worker)
+        try:
+            state = ldamodel.LdaModel(corpus, id2word=dictionary, num_topics=2).state
+            for iteration in range(3):
+                # the first reset sends the full state to the remote worker, the next ones a difference
+                expected = numpy.exp(state.get_Elogbeta())
+                dispatcher.reset(state)
+                self.assertEqual(remote.base.dtype, state.sstats.dtype)
+                self.assertTrue(numpy.array_equal(remote.base, state.sstats))
+                for worker in [local, remote]:
+                    self.assertTrue(numpy.allclose(worker.model.expElogbeta, expected))
+                    self.assertEqual(worker.model.state.sstats.sum(), 0.0)
+
+                for worker, docs in [(local, corpus[:5]), (remote, corpus[5:])]:
+                    worker.processjob(docs)
+                sstats = local.model.state.sstats + remote.model.state.sstats
+                numdocs = local.model.state.numdocs + remote.model.state.numdocs
+                state = dispatcher.getstate()
+                self.assertTrue(numpy.allclose(state.sstats, sstats))
+                self.assertEqual(state.numdocs, numdocs)
+                self.assertFalse(os.path.exists(dispatcher.shared_fname('worker0')))
+                state.sstats = state.sstats * 0.9 + 0.1 # a new model state, slightly different
+        finally:
+            if os.path.exists(dispatcher.shared_fname('state')):
+                os.remove(dispatcher.shared_fname('state'))
+
+    def testLsi(self):
+        from gensim.models import lsi_dispatcher, lsi_worker
+        dispatcher, local, remote = self.setUpWorkers(lsi_dispatcher, lsi_worker)
+        for workerid, worker in [(0, local), (1, remote)]:
+            worker.reset()
+            worker.processjob(corpus)
+            expected = worker.model.projection
+            projection = dispatcher.pullstate(workerid)
+            self.assertTrue(numpy.array_equal(projection.u, expected.u))
+            self.assertTrue(numpy.array_equal(projection.s, expected.s))
+            self.assertFalse(os.path.exists(dispatcher.shared_fname('worker%i' % workerid)))
+#endclass TestWorkerState
+
+
 class TestTfidfModel(unittest.TestCase):
     def setUp(self):
         self.corpus = mmcorpus.MmCorpus(datapath('testcorpus.mm'))
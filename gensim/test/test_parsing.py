@@ -7,9 +7,13 @@ Automated tests for the parsing module.
 
 import logging
 import unittest
+import os
+import tempfile
+import threading
 import numpy as np
 
 from gensim.parsing.preprocessing import *
+from gensim._six.moves import xrange
 
 
 # several documents
@@ -83,6 +87,61 @@ class TestPreprocessing(unittest.TestCase):
                 "a littl fuzzi would help."
         self.assertEquals(stem_text(doc5), target)
 
+    def testStemDocuments(self):
+        docs = [doc5, doc5.upper(), "running dogs"]
+        self.assertEquals(stem_documents(docs), [stem_text(doc) for doc in docs])
+
+    def testCachedStemmer(self):
+        stemmer = CachedPorterStemmer(cache_size=10)
+        words = doc5.split() * 3
+        self.assertEquals([stemmer.stem(word) for word in words], [PorterStemmer().stem(word) for word in words])
+        # the cache stays bounded
+        self.assertTrue(len(stemmer.cache) <= 10 and len(stemmer.old_cache) <= 10)
+
+        fname = os.path.join(tempfile.gettempdir(), 'gensim_stemmer.tst')
+        try:
+            stemmer.save(fname)
+            stemmer2 = CachedPorterStemmer.load(fname)
+            self.assertEquals(stemmer.cache, stemmer2.cache)
+            self.assertEquals(stemmer2.stem_documents(["running dogs"]), ["run dog"])
+        finally:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def testStemThreads(self):
+        # the shared stemmer must give correct stems when used from several threads
+        words = [word + suffix for word in doc5.lower().split() for suffix in ['', 'ing', 'ed', 'ation', 'ness', 'fully']]
+        words = [word + str(i % 50) for i in xrange(20) for word in words]  # mostly cache misses
+        expected = [PorterStemmer().stem(word) for word in words]
+        stemmer = CachedPorterStemmer(cache_size=100)
+        results, errors = {}, []
+
+        def stem_all(thread_no):
+            try:
+                results[thread_no] = [stemmer.stem(word) for word in words]
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=stem_all, args=(thread_no,)) for thread_no in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(errors, [])
+        for thread_no in xrange(4):
+            self.assertEquals(results[thread_no], expected)
+
+    def testPipeline(self):
+        docs = [doc1, doc2, doc3, doc4, doc5, "<i>Hello</i> <b>World</b>!\\n42 times\\tfoo1bar"]
+        expected = [preprocess_string(doc) for doc in docs]
+        pipeline = PreprocessingPipeline()
+        self.assertEquals([pipeline(doc) for doc in docs], expected)
+        self.assertEquals(list(pipeline.process_many(docs)), expected)
+        self.assertEquals(list(pipeline.process_many(docs, processes=2, chunksize=2)), expected)
+
+        pipeline = PreprocessingPipeline(stem=False)
+        self.assertEquals(pipeline(doc5), preprocess_string(doc5, DEFAULT_FILTERS[:-1]))
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.WARNING)
@@ -10,11 +10,13 @@ Automated tests for similarity algorithms (the similarities package).
 
 
 import logging
+import multiprocessing.pool
 import unittest
 import os
 import tempfile
 
 import numpy
+import scipy.sparse
 
 from gensim.corpora import mmcorpus, Dictionary
 from gensim import matutils, utils, similarities
@@ -193,11 +195,92 @@ class TestMatrixSimilarity(unittest.TestCase, _TestSimilarityABC):
     def setUp(self):
         self.cls = similarities.MatrixSimilarity
 
+    def testOutOfCore(self):
+        """build the index straight into a memory-mapped .npy file, from a generator"""
+        fname, npy_fname = testfile() + '.pkl', testfile() + '.index.npy'
+        index = self.cls(corpus, num_features=len(dictionary))
+        vectors = [numpy.ones(len(dictionary))] # dense documents are stored as they are
+        index2 = self.cls((doc for doc in corpus + [[]] + vectors), num_features=len(dictionary), chunksize=4,
+                          output_fname=npy_fname)
+        self.assertTrue(isinstance(index2.index, numpy.memmap))
+        self.assertEqual(index2.index.shape, (len(corpus) + 2, len(dictionary)))
+        self.assertTrue(numpy.allclose(index.index, index2.index[: len(corpus)]))
+        self.assertTrue(numpy.allclose(index2.index[len(corpus):], [numpy.zeros(len(dictionary))] + vectors))
+        self.assertTrue(numpy.allclose(index[corpus], index2[corpus][:, : len(corpus)]))
+
+        # only a reference to the matrix file is saved
+        if os.path.exists(fname + '.index.npy'):
+            os.remove(fname + '.index.npy')
+        index2.save(fname, sep_limit=0)
+        self.assertFalse(os.path.exists(fname + '.index.npy'))
+        index3 = self.cls.load(fname, mmap='r')
+        self.assertTrue(isinstance(index3.index, numpy.memmap))
+        self.assertTrue(numpy.allclose(index2.index, index3.index))
+        self.assertRaises(ValueError, self.cls, corpus, output_fname=npy_fname)
+
+    def testQuantized(self):
+        fname, npy_fname = testfile() + '.pkl', testfile() + '.index.npy'
+        dense = numpy.random.RandomState(0).randn(100, 20) # dense documents, like in LSI space
+        dense_corpus = [matutils.full2sparse(vec) for vec in dense]
+        index = self.cls(dense_corpus, num_features=20)
+        for quantize in ['float16', 'int8', 'int8_column']:
+            index2 = self.cls(dense_corpus, num_features=20, quantize=quantize)
+            self.assertTrue(index2.index.nbytes < index.index.nbytes)
+            self.assertTrue(numpy.allclose(index.index, index2.index[:], atol=0.02))
+            self.assertTrue(numpy.allclose(index.index[5], index2.index[5], atol=0.02))
+            self.assertTrue(numpy.allclose(index[dense_corpus[:10]], index2[dense_corpus[:10]], atol=0.02))
+            self.assertTrue(numpy.allclose(index[dense_corpus[0]], index2[dense_corpus[0]], atol=0.02))
+            self.assertTrue(numpy.allclose(list(index), list(index2), atol=0.02))
+
+            index2.save(fname, sep_limit=0)
+            index3 = self.cls.load(fname, mmap='r')
+            self.assertTrue(isinstance(index3.index.data, numpy.memmap))
+            self.assertTrue(numpy.allclose(index2[dense_corpus[:10]], index3[dense_corpus[:10]]))
+
+        # re-ranking the top documents from full precision vectors gives exact results
+        index.num_best = 5
+        index2 = self.cls(iter(dense_corpus), num_features=20, num_best=5, quantize='int8', rerank=20,
+                          output_fname=npy_fname)
+        self.assertTrue(numpy.allclose(index[dense_corpus[:10]], index2[dense_corpus[:10]]))
+        index2.save(fname)
+        index3 = self.cls.load(fname, mmap='r')
+        self.assertTrue(numpy.allclose(index[dense_corpus[:10]], index3[dense_corpus[:10]]))
+        self.assertRaises(ValueError, self.cls, dense_corpus, num_features=20, rerank=20)
+
 
 class TestSparseMatrixSimilarity(unittest.TestCase, _TestSimilarityABC):
     def setUp(self):
         self.cls = similarities.SparseMatrixSimilarity
 
+    def testChunkedCreation(self):
+        """build the index straight from sparse chunks of a MmCorpus"""
+        mm = mmcorpus.MmCorpus(datapath('testcorpus.mm'))
+        index = self.cls(mm)
+        index2 = self.cls(list(mm), num_features=mm.num_terms)
+        self.assertEqual(index.index.shape, index2.index.shape)
+        self.assertTrue(numpy.allclose(index.index.toarray(), index2.index.toarray()))
+
+    def testInvertedIndex(self):
+        """top-n queries answered from posting lists must match the full similarities"""
+        random = numpy.random.RandomState(0)
+        docs = [[(termid, random.randint(1, 4)) for termid in sorted(set(random.randint(0, 50, 8)))]
+                for _ in range(300)]
+        index = self.cls(docs, num_features=50)
+        index2 = self.cls(docs, num_features=50, inverted_index=True)
+        queries = [doc[:2] for doc in docs[:20]] + docs[20:40] + [[(3, 1.0), (7, -0.5)], []]
+        for num_best in [1, 5, 100]:
+            index.num_best = index2.num_best = num_best
+            for query, sims, sims2 in zip(queries, index[queries], index2[queries]):
+                self.assertEqual(len(sims), len(sims2))
+                self.assertTrue(numpy.allclose(sorted(sim for _, sim in sims), sorted(sim for _, sim in sims2)))
+                self.assertEqual(sims2, index2[query])
+
+        # the posting lists are stored along with the index
+        fname = testfile() + '.pkl'
+        index2.save(fname, sep_limit=0)
+        index3 = self.cls.load(fname, mmap='r')
+        self.assertEqual(index2[queries], index3[queries])
+
 
 class TestSimilarity(unittest.TestCase, _TestSimilarityABC):
     def setUp(self):
@@ -219,6 +302,240 @@ class TestSimilarity(unittest.TestCase, _TestSimilarityABC):
         expected = matutils.sparse2full(expected, len(index))
         self.assertTrue(numpy.allclose(expected, sims))
 
+    def testQuantized(self):
+        dense = numpy.random.RandomState(0).randn(30, 20)
+        dense_corpus = [matutils.full2sparse(vec) for vec in dense]
+        index = similarities.Similarity(None, dense_corpus, num_features=20, shardsize=8)
+        index2 = similarities.Similarity(None, dense_corpus[:20], num_features=20, shardsize=8,
+                                         quantize='int8', rerank=10)
+        _ = index2[dense_corpus[0]] # forces shard close
+        index2.add_documents(dense_corpus[20:]) # reopens the last shard from its full-precision vectors
+        self.assertTrue(all(isinstance(shard.get_index().index, similarities.docsim.QuantizedMatrix)
+                            for shard in index2.shards))
+        self.assertTrue(numpy.allclose(index[dense_corpus[:5]], index2[dense_corpus[:5]], atol=0.02))
+        self.assertTrue(numpy.allclose(index.vector_by_id(25), index2.vector_by_id(25), atol=0.02))
+        index.num_best = index2.num_best = 3
+        self.assertTrue(numpy.allclose(index[dense_corpus[:5]], index2[dense_corpus[:5]]))
+
+    def testCache(self):
+        index = similarities.Similarity(None, corpus[:5], num_features=len(dictionary), shardsize=3, cache_size=2)
+        for num_best in [None, 3]:
+            index.num_best = num_best
+            for query in [corpus[0], corpus[:3], numpy.ones((2, len(dictionary)))]:
+                sims = index[query]
+                self.assertTrue(1 <= len(index.query_cache) <= 2) # least recently used queries are evicted
+                sims2 = index[query]
+                self.assertTrue(numpy.allclose(sims, sims2))
+                self.assertFalse(sims is sims2) # the cached result must not be handed out directly
+
+        # adding documents must invalidate the cache
+        index.num_best = None
+        sims = index[corpus[0]]
+        index.add_documents(corpus[5:])
+        self.assertEqual(len(index.query_cache), 0)
+        self.assertEqual(len(index[corpus[0]]), len(corpus))
+        self.assertEqual(len(sims), 5)
+
+    def testParallel(self):
+        for parallel_type in ['thread', 'process']:
+            serial = similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=2)
+            index = similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=2,
+                                            parallel_shards=2, parallel_type=parallel_type)
+            for num_best in [None, 3]:
+                serial.num_best = index.num_best = num_best
+                for query in [corpus[0], corpus[:3]]:
+                    self.assertTrue(numpy.allclose(serial[query], index[query]))
+            pool = index.pool
+            self.assertTrue(pool is not None)
+            index.add_documents(corpus[:3]) # shards change => workers must not use stale shards
+            serial.add_documents(corpus[:3])
+            self.assertTrue(numpy.allclose(serial[corpus[:3]], index[corpus[:3]]))
+            self.assertTrue(index.pool is pool) # the pool is reused between queries
+
+            index.save(testfile())
+            index2 = similarities.Similarity.load(testfile())
+            self.assertTrue(index2.pool is None)
+            self.assertTrue(numpy.allclose(serial[corpus[:3]], index2[corpus[:3]]))
+            index2.close_pool()
+            index.close_pool()
+            self.assertTrue(index.pool is None)
+
+            # the pool is also stopped at the end of a `with` block, and when the index is garbage collected
+            with similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=2,
+                                         parallel_shards=2, parallel_type=parallel_type) as index:
+                index[corpus[:3]]
+                pool = index.pool
+            self.assertTrue(index.pool is None)
+            self.assertEqual(pool._state, multiprocessing.pool.TERMINATE)
+            index[corpus[:3]]
+            pool = index.pool
+            del index
+            self.assertEqual(pool._state, multiprocessing.pool.TERMINATE)
+
+        # indexes saved by older versions query in threads, too
+        index = similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=2, parallel_shards=2)
+        del index.parallel_type
+        self.assertTrue(isinstance(index.get_pool(), multiprocessing.pool.ThreadPool))
+        index.close_pool()
+        self.assertRaises(ValueError, similarities.Similarity, None, corpus, len(dictionary), parallel_type='foo')
+
+    def testLoadOld(self):
+        # an index saved before documents had ids: strip everything the old format didn't have
+        index = similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=3)
+        index.close_shard()
+        expected = index.vector_by_id(0)
+        for shard in index.shards:
+            for attr in set(shard.__dict__) - set(['dirname', 'fname', 'length', 'cls', 'num_best', 'normalize',
+                                                   'num_nnz', 'index']):
+                delattr(shard, attr)
+        for attr in set(index.__dict__) - set(['output_prefix', 'num_features', 'num_best', 'normalize', 'chunksize',
+                                               'shardsize', 'shards', 'fresh_docs', 'fresh_nnz']):
+            delattr(index, attr)
+        utils.SaveLoad.save(index, testfile())
+
+        index2 = similarities.Similarity.load(testfile())
+        self.assertTrue(numpy.allclose(index2.vector_by_id(0), expected))
+        index2.delete_documents([1])
+        self.assertEqual(index2.get_ids().tolist(), [0, 2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual(len(index2[corpus[0]]), 8)
+
+    def testDelete(self):
+        index = similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=3)
+        fresh = similarities.Similarity(None, [corpus[i] for i in [0, 1, 4, 5, 6, 7]],
+                                        num_features=len(dictionary), shardsize=3)
+        index.delete_documents([2, 3, 8])
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.get_ids().tolist(), [0, 1, 4, 5, 6, 7])
+        self.assertTrue(numpy.allclose(index[corpus[:3]], fresh[corpus[:3]]))
+        self.assertRaises(ValueError, index.delete_documents, [2]) # already deleted
+        self.assertRaises(ValueError, index.add_documents, [corpus[0]], ids=[0]) # id already used
+        # a wrong number of ids leaves the index unchanged, even for streamed corpora
+        for docs, ids in [(corpus[:2], [20]), (corpus[:1], [20, 21]), (iter(corpus[:2]), [20])]:
+            self.assertRaises(ValueError, index.add_documents, docs, ids=ids)
+            self.assertRaises(ValueError, index.update_documents, docs, ids=ids)
+            self.assertEqual(index.get_ids().tolist(), [0, 1, 4, 5, 6, 7])
+        self.assertEqual(index.next_id, 9)
+        # duplicate or unknown ids leave the index unchanged, too
+        for ids in [[5, 5], [5, 3], [5, 100]]:
+            self.assertRaises(ValueError, index.update_documents, corpus[:2], ids=ids)
+            self.assertEqual(index.get_ids().tolist(), [0, 1, 4, 5, 6, 7])
+        original = similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=3)
+        self.assertTrue(numpy.allclose(index.vector_by_id(4).toarray(), original.vector_by_id(4).toarray()))
+        self.assertRaises(ValueError, index.vector_by_id, 3)
+
+        # results with num_best refer to document ids, which don't change
+        index.num_best = fresh.num_best = 3
+        ids = [0, 1, 4, 5, 6, 7]
+        for sims, expected in zip(index[corpus], fresh[corpus]):
+            expected = [(ids[pos], sim) for pos, sim in expected]
+            self.assertTrue(numpy.allclose(matutils.sparse2full(sims, 9), matutils.sparse2full(expected, 9)))
+
+        index.update_documents([corpus[8]], ids=[0])
+        self.assertEqual(index[corpus[8]][0][0], 0)
+        self.assertEqual(len(index), 6)
+        index.add_documents([corpus[2]])
+        self.assertEqual(index.get_ids().tolist(), [1, 4, 5, 6, 7, 0, 9]) # ids are never reused
+
+        # compaction reclaims the space, but doesn't change the results
+        index.num_best = None
+        sims = index[corpus]
+        index.compact(max_deleted=0.0, background=True).join()
+        self.assertTrue(all(shard.num_deleted == 0 for shard in index.shards))
+        self.assertEqual(sum(len(shard) for shard in index.shards), 7)
+        self.assertTrue(numpy.allclose(sims, index[corpus]))
+
+        # files of compacted shards are kept until the queries using them finish, and names are never reused
+        names = [shard.fullname() for shard in index.shards]
+        index.delete_documents([4])
+        snapshot = index.acquire_shards()
+        index.compact(max_deleted=0.0)
+        self.assertTrue(all(os.path.exists(fname) for fname in names))
+        compacted = [shard.fullname() for shard in snapshot if shard not in index.shards]
+        self.assertEqual(len(compacted), 1)
+        self.assertEqual(len(set(shard.fullname() for shard in index.shards) - set(names)), 1)
+        index.release_shards(snapshot)
+        self.assertFalse(os.path.exists(compacted[0]))
+        self.assertTrue(numpy.allclose(numpy.delete(sims, 1, axis=1), index[corpus]))
+
+        # query worker processes drop the shards removed from the index
+        docsim = similarities.docsim
+        try:
+            docsim.init_query_worker()
+            docsim.open_shard(index.shards[0].worker_copy())
+            self.assertTrue(index.shards[0].fullname() in docsim.WORKER_SHARDS)
+            docsim.open_shard(index.shards[1].worker_copy(expired=(index.shards[0].fullname(),)))
+            self.assertEqual(list(docsim.WORKER_SHARDS), [index.shards[1].fullname()])
+        finally:
+            docsim.WORKER_SHARDS = None
+
+        # ids and tombstones survive save & load
+        index.delete_documents([5])
+        index.save(testfile())
+        index2 = similarities.Similarity.load(testfile())
+        self.assertEqual(index2.get_ids().tolist(), index.get_ids().tolist())
+        self.assertTrue(numpy.allclose(index2[corpus], index[corpus]))
+        index2.add_documents([corpus[3]])
+        self.assertEqual(index2.get_ids().tolist()[-1], 10)
+
+        # reopening a sparse shard after a delete must count the remaining non-zeroes exactly
+        docs = [[(0, 1.0)], [(0, 1.0), (1, 1.0), (2, 1.0), (3, 1.0)], [(5, 1.0)]]
+        index = similarities.Similarity(None, docs, num_features=len(dictionary), shardsize=10)
+        index[docs[0]]
+        index.delete_documents([0])
+        index.add_documents([[(1, 1.0)]])
+        self.assertEqual(index.get_ids().tolist(), [1, 2, 3])
+        self.assertTrue(numpy.allclose(index[docs[2]], [0.0, 1.0, 0.0]))
+
+    def testPruning(self):
+        index = similarities.Similarity(None, corpus, num_features=len(dictionary), shardsize=3)
+        expected = index[corpus]
+        index.save(testfile())
+        index2 = similarities.Similarity.load(testfile()) # shards are not opened until queried
+        index2.num_best = 2
+        sims = index2[corpus[6]] # the "graph/trees" documents are all in the last shard
+        self.assertEqual([docid for docid, _ in sims], [6, 7])
+        self.assertTrue(numpy.allclose([sim for _, sim in sims], expected[6][[6, 7]]))
+        self.assertEqual([hasattr(shard, 'index') for shard in index2.shards], [False, False, True])
+
+        # pruning must not change the results of any query
+        for num_best in [1, 2, 5, 100]:
+            index2.num_best = num_best
+            for query, sims in zip(corpus, index2[corpus]):
+                full = matutils.full2sparse_clipped(expected[corpus.index(query)], num_best)
+                self.assertTrue(numpy.allclose([sim for _, sim in sims], [sim for _, sim in full]))
+
+        # the summaries of sparse shards stay sparse
+        index = similarities.Similarity(None, corpus, num_features=1000, shardsize=3)
+        expected = index[corpus]
+        self.assertTrue(all(scipy.sparse.issparse(shard.max_weights) for shard in index.shards))
+        self.assertTrue(all(scipy.sparse.issparse(summary) for summary in index.get_summaries(index.shards)))
+        for num_best in [1, 2, 5]:
+            index.num_best = num_best
+            for query, sims in zip(corpus, index[corpus]):
+                full = matutils.full2sparse_clipped(expected[corpus.index(query)], num_best)
+                self.assertTrue(numpy.allclose([sim for _, sim in sims], [sim for _, sim in full]))
+
+    def testEmptyNumBest(self):
+        index = similarities.Similarity(None, [], num_features=len(dictionary), num_best=3)
+        self.assertEqual(index[corpus[0]], [])
+        # all shards deleted and compacted away
+        index = similarities.Similarity(None, corpus[:3], num_features=len(dictionary), num_best=3, shardsize=3)
+        index.delete_documents([0, 1, 2])
+        index.compact(max_deleted=0.0)
+        self.assertEqual(index.shards, [])
+        self.assertEqual(index[corpus[0]], [])
+
+    def testDenseSummary(self):
+        docs = [[(0, 1.0), (1, 1.0)], [(1, 1.0), (2, 1.0)]]
+        index = similarities.MatrixSimilarity(docs, num_features=3)
+        shard = similarities.docsim.Shard(testfile(), index)
+        try:
+            self.assertTrue(numpy.allclose(shard.centroid, index.index.mean(axis=0)))
+            self.assertTrue(numpy.allclose(shard.max_weights, index.index.max(axis=0)))
+            self.assertTrue(numpy.allclose(shard.min_weights, index.index.min(axis=0)))
+        finally:
+            os.remove(testfile())
+
 
 
 if __name__ == '__main__':
@@ -9,8 +9,12 @@ Automated tests for checking various utils functions.
 
 
 import logging
+import os
+import tempfile
 import unittest
 
+import numpy
+
 from gensim import utils
 
 
@@ -75,6 +79,50 @@ class TestIsCorpus(unittest.TestCase):
             self.assertEqual(expected, result)
 
 
+class TestPackArray(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(0)
+        self.arr = numpy.random.rand(20, 30)
+        self.arr[:, 10:] = 0.0
+
+    def test_compressed(self):
+        packed = utils.pack_array(self.arr)
+        self.assertTrue(len(packed['data']) < self.arr.nbytes)
+        result = utils.unpack_array(packed)
+        self.assertEqual(result.dtype, self.arr.dtype)
+        self.assertTrue((result == self.arr).all())
+
+        # other dtypes and shapes work too
+        for arr in [numpy.arange(10, dtype=numpy.int32), numpy.zeros((0, 5), dtype=numpy.float32)]:
+            result = utils.unpack_array(utils.pack_array(arr))
+            self.assertEqual(result.shape, arr.shape)
+            self.assertEqual(result.dtype, arr.dtype)
+            self.assertTrue((result == arr).all())
+
+    def test_delta(self):
+        arr2 = self.arr * 0.9 + 1e-3
+        packed = utils.pack_array(arr2, base=self.arr)
+        self.assertTrue(packed['delta'])
+        result = utils.unpack_array(packed, base=self.arr)
+        self.assertTrue((result == arr2).all()) # reconstruction is exact
+        self.assertRaises(ValueError, utils.unpack_array, packed)
+        self.assertRaises(ValueError, utils.pack_array, arr2, base=self.arr[:5])
+
+    def test_file(self):
+        fname = os.path.join(tempfile.gettempdir(), 'gensim_packed.npy')
+        try:
+            packed = utils.pack_array(self.arr, fname=fname)
+            self.assertEqual(packed, {'fname': fname})
+            self.assertTrue((utils.unpack_array(packed) == self.arr).all())
+            self.assertTrue((utils.unpack_array(packed, mmap='r') == self.arr).all())
+        finally:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+        # plain arrays pass through unchanged
+        self.assertTrue(utils.unpack_array(self.arr) is self.arr)
+
+
 if __name__ == '__main__':
     logging.root.setLevel(logging.WARNING)
     unittest.main()
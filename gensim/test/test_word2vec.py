@@ -15,11 +15,13 @@ import os
 import tempfile
 import itertools
 import bz2
+import heapq
 
 import numpy
 
 from gensim import utils, matutils
 from gensim.models import word2vec
+from gensim.similarities import InvertedFileIndex
 
 module_path = os.path.dirname(__file__) # needed because sample data files are located in the same folder
 datapath = lambda fname: os.path.join(module_path, 'test_data', fname)
@@ -139,6 +141,142 @@ class TestWord2VecModel(unittest.TestCase):
         self.models_equal(model, model2)
 
 
+    def testTrainingModes(self):
+        """Test word2vec training with skip-gram/CBOW and hierarchical softmax/negative sampling."""
+        for sg, hs, negative in [(1, 0, 5), (1, 1, 5), (0, 1, 0), (0, 0, 5), (0, 1, 5)]:
+            model = word2vec.Word2Vec(size=2, min_count=1, sg=sg, hs=hs, negative=negative)
+            model.build_vocab(sentences)
+            self.assertEqual(hasattr(model, 'syn1'), bool(hs))
+            self.assertEqual(hasattr(model, 'syn1neg'), bool(negative))
+            if negative:
+                self.assertTrue(model.syn1neg.shape == (len(model.vocab), 2))
+            syn0 = model.syn0.copy()
+            model.train(sentences)
+            self.assertFalse(numpy.allclose(syn0, model.syn0))
+
+            # build vocab and train in one step; must be the same as above
+            model2 = word2vec.Word2Vec(sentences, size=2, min_count=1, sg=sg, hs=hs, negative=negative)
+            self.models_equal(model, model2)
+
+        model = word2vec.Word2Vec(sentences, min_count=1, sg=0, hs=0, negative=5, cbow_mean=1)
+        model.save(testfile())
+        self.models_equal(model, word2vec.Word2Vec.load(testfile()))
+        self.assertRaises(ValueError, word2vec.Word2Vec, sentences, hs=0, negative=0)
+
+
+    def testSampling(self):
+        """Test downsampling of frequent words."""
+        corpus = LeeCorpus()
+        model = word2vec.Word2Vec(min_count=5, sample=1e-3)
+        model.build_vocab(corpus)
+        self.assertTrue(model.vocab['the'].sample_probability < 0.5)  # frequent words are often dropped...
+        self.assertEqual(model.vocab['israeli'].sample_probability, 1.0)  # ...rare words never
+        # the words dropped from training still count towards the progress (and learning rate)
+        total_words = sum(v.count for v in model.vocab.itervalues())
+        self.assertEqual(model.train(corpus), total_words)
+
+        # no downsampling by default
+        model = word2vec.Word2Vec(sentences, min_count=1)
+        self.assertTrue(all(v.sample_probability == 1.0 for v in model.vocab.itervalues()))
+
+
+    def testNoiseTable(self):
+        """Test the table of noise words for negative sampling."""
+        model = word2vec.Word2Vec(min_count=1, negative=5)
+        model.build_vocab(sentences)
+        counts = numpy.bincount(model.table, minlength=len(model.vocab))
+        expected = numpy.array([model.vocab[word].count for word in model.index2word]) ** 0.75
+        self.assertTrue(numpy.allclose(1.0 * counts / counts.sum(), expected / expected.sum(), atol=1e-3))
+
+
+    def testPackedTree(self):
+        """Test the flat Huffman code & point arrays used for training."""
+        model = word2vec.Word2Vec(min_count=1)
+        model.build_vocab(sentences)
+        self.assertEqual(len(model.code_offsets), len(model.vocab) + 1)
+        for index, word in enumerate(model.index2word):
+            point, code = model.word_tree(index)
+            self.assertTrue(numpy.all(point == model.vocab[word].point))
+            self.assertTrue(numpy.all(code == model.vocab[word].code))
+
+        # the packed arrays survive a save/load round trip
+        model.save(testfile())
+        model2 = word2vec.Word2Vec.load(testfile())
+        self.assertTrue(numpy.all(model.vocab_codes == model2.vocab_codes))
+        self.assertTrue(numpy.all(model.code_offsets == model2.code_offsets))
+
+
+    def testHuffmanTree(self):
+        """Test the Huffman codes on counts without ties, where the tree is unique."""
+        model = word2vec.Word2Vec()
+        model.vocab_counts = numpy.array([16, 1, 8, 2, 4])
+        model.create_binary_tree()
+        expected = [([3], [1]), ([3, 2, 1, 0], [0, 0, 0, 0]), ([3, 2], [0, 1]),
+                    ([3, 2, 1, 0], [0, 0, 0, 1]), ([3, 2, 1], [0, 0, 1])]
+        for index, (point, code) in enumerate(expected):
+            self.assertEqual(model.word_tree(index)[0].tolist(), point)
+            self.assertEqual(model.word_tree(index)[1].tolist(), code)
+
+        # the total code length must be optimal, also with ties
+        model = word2vec.Word2Vec(min_count=1)
+        model.build_vocab(LeeCorpus())
+        heap = model.vocab_counts.tolist()
+        heapq.heapify(heap)
+        cost = 0
+        while len(heap) > 1:
+            merged = heapq.heappop(heap) + heapq.heappop(heap)
+            heapq.heappush(heap, merged)
+            cost += merged  # each merge adds one bit to the codes of all words below it
+        self.assertEqual((numpy.diff(model.code_offsets) * model.vocab_counts).sum(), cost)
+
+
+    def testCompactVocab(self):
+        """Test the array-backed vocabulary."""
+        model = word2vec.Word2Vec(sentences, min_count=1)
+        self.assertEqual(len(model.vocab), 12)
+        self.assertEqual(sorted(model.vocab), sorted(model.index2word))
+        self.assertTrue('human' in model.vocab and 'dinosaur' not in model.vocab)
+        self.assertEqual(model.vocab['graph'].count, 3)
+        self.assertEqual(model.index2word[model.vocab['graph'].index], 'graph')
+        self.assertEqual(model.vocab.get('dinosaur'), None)
+
+        # the vocabulary arrays can be stored separately & mmapped back
+        model.save(testfile(), sep_limit=0)
+        model2 = word2vec.Word2Vec.load(testfile(), mmap='r')
+        self.assertTrue(isinstance(model2.vocab_counts, numpy.memmap))
+        self.assertTrue(numpy.all(model.vocab_counts == model2.vocab_counts))
+        self.assertTrue(numpy.allclose(model['graph'], model2['graph']))
+        self.assertEqual(model.most_similar('graph'), model2.most_similar('graph'))
+
+
+    def testApproxMostSimilar(self):
+        """Test approximate most_similar using an inverted file index."""
+        model = word2vec.Word2Vec(LeeCorpus(), min_count=5)
+        self.assertRaises(ValueError, model.most_similar, 'war', approx=True)
+        model.init_ann_index(num_clusters=10, nprobe=3)
+
+        # probing all clusters must give exact results
+        exact = model.most_similar(positive=['war', 'israeli'], negative=['government'], topn=20)
+        approx = model.most_similar(positive=['war', 'israeli'], negative=['government'], topn=20, approx=True, nprobe=10)
+        self.assertEqual([word for word, _ in exact], [word for word, _ in approx])
+        self.assertTrue(numpy.allclose([sim for _, sim in exact], [sim for _, sim in approx]))
+
+        # probing fewer clusters must return a subset, in decreasing order
+        approx = model.most_similar('war', topn=20, approx=True)
+        self.assertEqual(len(approx), 20)
+        self.assertTrue('war' not in [word for word, _ in approx])
+        sims = [sim for _, sim in approx]
+        self.assertEqual(sims, sorted(sims, reverse=True))
+
+        # the index can be stored separately and mmap'ed back
+        model.ann_index.save(testfile())
+        index2 = InvertedFileIndex.load(testfile(), mmap='r')
+        self.assertTrue(numpy.allclose(model.ann_index.centroids, index2.centroids))
+        self.assertTrue(numpy.array_equal(model.ann_index.order, index2.order))
+        model.ann_index = index2
+        self.assertEqual(approx, model.most_similar('war', topn=20, approx=True))
+
+
     def testParallel(self):
         """Test word2vec parallel training."""
         if word2vec.FAST_VERSION < 0:  # don't test the plain NumPy version for parallelism (too slow)
@@ -164,7 +302,10 @@ class TestWord2VecModel(unittest.TestCase):
     def models_equal(self, model, model2):
         self.assertEqual(len(model.vocab), len(model2.vocab))
         self.assertTrue(numpy.allclose(model.syn0, model2.syn0))
-        self.assertTrue(numpy.allclose(model.syn1, model2.syn1))
+        if model.hs:
+            self.assertTrue(numpy.allclose(model.syn1, model2.syn1))
+        if model.negative:
+            self.assertTrue(numpy.allclose(model.syn1neg, model2.syn1neg))
         most_common_word = max(model.vocab.iteritems(), key=lambda item: item[1].count)[0]
         self.assertTrue(numpy.allclose(model[most_common_word], model2[most_common_word]))
 #endclass TestWord2VecModel
@@ -709,6 +709,72 @@ def pyro_daemon(name, obj, random_suffix=False, ip=None, port=None):
             daemon.requestLoop()
 
 
+def pack_array(arr, fname=None, base=None):
+    """
+    Prepare a (large) numpy array for sending to another process, in a form that
+    is cheaper to transfer than pickling the array directly.
+
+    If `fname` is given, the array is stored to that `.npy` file and only the
+    file name is sent; use this when both processes run on the same machine.
+
+    Otherwise, the array is compressed (its bytes are shuffled so that bytes of
+    the same significance come together, then compressed with zlib). If `base`
+    is given (an array of the same shape and dtype that the receiver already has),
+    only the XOR difference against `base` is sent; values that changed little
+    share most of their bits with `base`, so the difference compresses well. The
+    reconstruction on the receiving side is exact.
+
+    Use `unpack_array` to get the array back.
+
+    """
+    arr = numpy.ascontiguousarray(arr)
+    if fname is not None:
+        # write to a temp file first, so that readers never see a partially written array
+        with open(fname + '.tmp', 'wb') as fout:
+            numpy.save(fout, arr)
+        if os.name == 'nt' and os.path.exists(fname):
+            os.remove(fname) # no atomic replace on Windows
+        os.rename(fname + '.tmp', fname)
+        return {'fname': fname}
+
+    import zlib
+    raw = arr.view(numpy.uint8).reshape(-1, arr.dtype.itemsize)
+    delta = base is not None
+    if delta:
+        base = numpy.ascontiguousarray(base)
+        if base.shape != arr.shape or base.dtype != arr.dtype:
+            raise ValueError("base array of shape %s/%s doesn't match array of shape %s/%s" %
+                             (base.shape, base.dtype, arr.shape, arr.dtype))
+        raw = raw ^ base.view(numpy.uint8).reshape(raw.shape)
+    return {'shape': arr.shape, 'dtype': arr.dtype.str, 'delta': delta,
+            'data': zlib.compress(raw.T.tostring(), 1)}
+
+
+def unpack_array(packed, base=None, mmap=None):
+    """
+    Reconstruct an array packed by `pack_array`. `base` must be the same array
+    that was used for packing, if any.
+
+    Arrays stored to a file are loaded into RAM, unless `mmap` is set (see
+    `numpy.load`). Plain numpy arrays are returned unchanged.
+
+    """
+    if isinstance(packed, numpy.ndarray):
+        return packed
+    if 'fname' in packed:
+        return numpy.load(packed['fname'], mmap_mode=mmap)
+
+    import zlib
+    dtype = numpy.dtype(packed['dtype'])
+    raw = numpy.fromstring(zlib.decompress(packed['data']), dtype=numpy.uint8)
+    raw = raw.reshape(dtype.itemsize, -1).T.copy() # undo the byte shuffle
+    if packed['delta']:
+        if base is None:
+            raise ValueError("array was packed as a difference, but no base array given")
+        raw ^= numpy.ascontiguousarray(base).view(numpy.uint8).reshape(raw.shape)
+    return raw.view(dtype).reshape(packed['shape'])
+
+
 if HAS_PATTERN:
     def lemmatize(content, allowed_tags=re.compile('(NN|VB|JJ|RB)'), light=False):
         """